@@ -0,0 +1,260 @@
+import argparse
+import concurrent.futures
+import contextlib
+import dataclasses
+import glob
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+import traceback
+from pathlib import Path
+from captiongenerator import CaptionGenerator
+from renderoptions import add_render_arguments, render_options_from_arguments, positive_int
+from framecache import DiskFrameCache
+
+STAMP_SUFFIX = ".camala-stamp"
+
+# render options that change where frames are cached or what is measured, but not what ends up in the output
+_OPTIONS_WITHOUT_EFFECT = ['jobs', 'inkscape', 'cache_dir', 'cache_size', 'profile', 'trace', 'cprofile', 'incremental']
+
+
+def expand_specs(patterns, base_folder=None):
+    """
+    expands paths and glob patterns (** matches subfolders) into a sorted list of existing .toml specifications
+    :param patterns: list of paths or glob patterns
+    :param base_folder: optional folder against which relative patterns are resolved
+    :return: list of absolute paths; patterns that match nothing are reported
+    """
+    specs = []
+    for pattern in patterns:
+        if base_folder is not None and not os.path.isabs(pattern):
+            pattern = os.path.join(base_folder, pattern)
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            print(f"Warning: {pattern} doesn't match any specification.")
+        specs.extend(str(Path(match).absolute()) for match in matches if Path(match).is_file())
+    return specs
+
+
+def read_manifest(manifest_file):
+    """
+    reads a job manifest: either a json list of {"spec": ..., "output": ...} objects (output is optional and
+    excludes the extension), or a text file with one path or glob pattern per line (# starts a comment);
+    relative paths are relative to the folder of the manifest
+    :param manifest_file: path to the manifest
+    :return: list of (spec, output or None) tuples
+    """
+    base_folder = str(Path(manifest_file).absolute().parent)
+    contents = Path(manifest_file).read_text("utf-8")
+    if manifest_file.endswith(".json"):
+        jobs = []
+        for entry in json.loads(contents):
+            if isinstance(entry, str):
+                entry = {'spec': entry}
+            output = entry.get('output')
+            if output is not None and not os.path.isabs(output):
+                output = os.path.join(base_folder, output)
+            jobs.extend((spec, output) for spec in expand_specs([entry['spec']], base_folder))
+        return jobs
+    patterns = [line.split("#", 1)[0].strip() for line in contents.splitlines()]
+    return [(spec, None) for spec in expand_specs([p for p in patterns if p], base_folder)]
+
+
+def job_digest(spec_file, template_folder, options):
+    """
+    computes a digest of everything that determines the result of a job: the specification, the svg templates
+    and the render options
+    :param spec_file: path to the .toml specification
+    :param template_folder: folder with the svg templates
+    :param options: RenderOptions
+    :return: hex digest
+    """
+    h = hashlib.sha1()
+    h.update(Path(spec_file).read_bytes())
+    for template in sorted(Path(template_folder).rglob("*")):
+        relative = template.relative_to(template_folder)
+        if template.is_file() and relative.parts[0] != "modules":  # modules holds mako's compiled templates
+            h.update(str(relative.as_posix()).encode("utf-8"))
+            h.update(Path(template).read_bytes())
+    relevant = {key: value for key, value in dataclasses.asdict(options).items() if key not in _OPTIONS_WITHOUT_EFFECT}
+    h.update(json.dumps(relevant, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def output_paths(output_file, video_format):
+    """
+    :param output_file: output file of a job (without extension)
+    :param video_format: format of the job (the format from the [Global] section of its specification)
+    :return: list of the files that the job produces (for image sequences: the index or the first frame)
+    """
+    if video_format == 'png':
+        return [f"{output_file}_{0:08}.png"]
+    if video_format == 'svg':
+        return [f"{output_file}.index.json"]
+    return [f"{output_file}.{video_format}"]
+
+
+def write_stamp(output_file, digest, spec_file, video_format):
+    """
+    remembers that a job was rendered, so it can be skipped as long as nothing changes
+    :param output_file: output file of the job (without extension)
+    :param digest: digest of the job as computed by job_digest
+    :param spec_file: path to the .toml specification
+    :param video_format: format of the job
+    """
+    with open(output_file + STAMP_SUFFIX, "w") as f:
+        json.dump({'digest': digest, 'spec': spec_file, 'format': video_format}, f)
+
+
+def is_up_to_date(output_file, digest):
+    """
+    :param output_file: output file of a job (without extension)
+    :param digest: digest of the job as computed by job_digest
+    :return: True if the output was rendered before from the same specification, templates and options, and the
+             files it produced still exist
+    """
+    try:
+        with open(output_file + STAMP_SUFFIX, "r") as f:
+            stamp = json.load(f)
+    except (IOError, ValueError):
+        return False
+    if stamp.get('digest') != digest or not stamp.get('format'):
+        return False
+    return all(os.path.exists(path) for path in output_paths(output_file, stamp['format']))
+
+
+def plan_workers(budget, nr_of_jobs):
+    """
+    divides a global budget of worker processes over the jobs
+    :param budget: total number of worker processes
+    :param nr_of_jobs: number of jobs that must be rendered
+    :return: tuple (number of jobs rendered concurrently, number of frame workers per job)
+    """
+    budget = max(1, budget)
+    workers_per_job = max(1, budget // max(1, min(budget, nr_of_jobs)))
+    return max(1, min(nr_of_jobs, budget // workers_per_job)), workers_per_job
+
+
+def render_job(spec_file, output_file, options, log_file):
+    """
+    renders one specification (runs in a worker process); all output of the job is written to its log file
+    :param options: RenderOptions of the job (options.jobs is the number of frame workers of the job)
+    :return: dictionary with the status, frames and cache statistics of the job
+    """
+    result = {'status': 'failed', 'frames': 0, 'format': None, 'cache': None, 'error': None}
+    start_time = time.perf_counter()
+    with open(log_file, "w") as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            c = CaptionGenerator(output_file, options)
+            if c.write_videofile(input=spec_file):
+                result['status'] = 'rendered'
+            else:
+                result['error'] = f"rendering failed, see {log_file}"
+            if c.spec is not None:
+                result['frames'] = int(math.ceil(c.duration() * c.output_fps()))
+                result['format'] = c.video_format()
+            if c.last_cache_statistics is not None:
+                result['cache'] = dict(c.last_cache_statistics)
+            if c.last_profile_report is not None:
+                result['profile'] = c.last_profile_report['stages']
+        except Exception as e:
+            traceback.print_exc()
+            result['error'] = f"{type(e).__name__}: {e}"
+    result['wall_time'] = time.perf_counter() - start_time
+    return result
+
+
+def run_batch(jobs_to_run, options, budget, force=False, log_folder=None):
+    """
+    renders a list of jobs concurrently, sharing one budget of worker processes between all of them
+    :param jobs_to_run: list of (spec, output) tuples; output excludes the extension
+    :param options: RenderOptions for all jobs (options.jobs is replaced by the frame workers per job)
+    :param budget: total number of worker processes
+    :param force: if True, also render jobs whose outputs are up to date
+    :param log_folder: folder for the log files of the jobs (default: next to the outputs)
+    :return: list with a summary dictionary per job, in the order of jobs_to_run
+    """
+    template_folder = str(Path(__file__).absolute().parent.joinpath("templates"))
+    summary = []
+    pending = []
+    for spec_file, output_file in jobs_to_run:
+        entry = {'spec': spec_file, 'output': output_file, 'status': 'skipped', 'wall_time': 0.0, 'frames': 0,
+                 'format': None, 'cache': None, 'error': None, 'digest': job_digest(spec_file, template_folder, options)}
+        summary.append(entry)
+        if force or not is_up_to_date(output_file, entry['digest']):
+            pending.append(entry)
+        else:
+            print(f"Skipping {output_file}: up to date.")
+
+    concurrent_jobs, workers_per_job = plan_workers(budget, len(pending))
+    if pending:
+        print(f"Rendering {len(pending)} of {len(summary)} jobs, {concurrent_jobs} at a time "
+              f"with {workers_per_job} worker(s) each.")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=concurrent_jobs) as executor:
+        futures = {}
+        for entry in pending:
+            Path(entry['output']).parent.mkdir(parents=True, exist_ok=True)
+            folder = Path(log_folder) if log_folder else Path(entry['output']).parent
+            folder.mkdir(parents=True, exist_ok=True)
+            entry['log'] = str(folder.joinpath(Path(entry['output']).name + ".log"))
+            futures[executor.submit(render_job, entry['spec'], entry['output'],
+                                    dataclasses.replace(options, jobs=workers_per_job), entry['log'])] = entry
+        for future in concurrent.futures.as_completed(futures):
+            entry = futures[future]
+            try:
+                entry.update(future.result())
+            except Exception as e:  # e.g. a worker process that crashed
+                entry.update({'status': 'failed', 'error': f"{type(e).__name__}: {e}"})
+            if entry['status'] == 'rendered':
+                write_stamp(entry['output'], entry['digest'], entry['spec'], entry['format'])
+            print(f"{entry['status']:>8} {entry['output']} ({entry['wall_time']:.1f}s)"
+                  + (f": {entry['error']}" if entry['error'] else ""))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render many .toml specifications without the gui. Outputs that are "
+                                                 "up to date with their specification, the svg templates and the "
+                                                 "render options are skipped.")
+    parser.add_argument("specs", nargs="*", help="paths or glob patterns (** matches subfolders) of .toml specifications")
+    parser.add_argument("-m", "--manifest", help="json list of {\"spec\": ..., \"output\": ...} objects, or a text file "
+                                                 "with one path or glob pattern per line")
+    parser.add_argument("-o", "--output-folder", help="folder for the results (default: next to each specification)")
+    parser.add_argument("-w", "--workers", type=positive_int, default=os.cpu_count() or 1,
+                        help="total number of worker processes, shared by all jobs (default: number of cpus)")
+    parser.add_argument("--force", action="store_true", help="also render outputs that are up to date")
+    parser.add_argument("--summary", help="write a json summary (per job: status, wall time, frames, cache hits, "
+                                          "errors) to this file")
+    parser.add_argument("--log-folder", help="folder for the log files of the jobs (default: next to the outputs)")
+    add_render_arguments(parser)
+    args = parser.parse_args()
+    options = render_options_from_arguments(parser, args)
+    if not args.specs and not args.manifest:
+        parser.error("no specifications given (use paths, glob patterns or --manifest)")
+
+    jobs_to_run = [(spec, None) for spec in expand_specs(args.specs)]
+    if args.manifest:
+        jobs_to_run.extend(read_manifest(args.manifest))
+    for index, (spec, output) in enumerate(jobs_to_run):
+        if output is None:
+            output_folder = Path(args.output_folder) if args.output_folder else Path(spec).parent
+            output = str(output_folder.absolute().joinpath(Path(spec).stem + ("-draft" if args.draft else "")))
+        jobs_to_run[index] = (spec, output)
+
+    if args.clear_cache:
+        DiskFrameCache(args.cache_dir).clear()
+
+    start_time = time.perf_counter()
+    summary = run_batch(jobs_to_run, options, args.workers, force=args.force, log_folder=args.log_folder)
+    failures = [entry for entry in summary if entry['status'] == 'failed']
+    print(f"Done in {time.perf_counter() - start_time:.1f}s: "
+          f"{sum(entry['status'] == 'rendered' for entry in summary)} rendered, "
+          f"{sum(entry['status'] == 'skipped' for entry in summary)} skipped, {len(failures)} failed.")
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump({'workers': args.workers, 'wall_time': time.perf_counter() - start_time, 'jobs': summary},
+                      f, indent=2)
+    sys.exit(1 if failures else 0)
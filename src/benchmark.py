@@ -0,0 +1,499 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+import numpy as np
+import PIL.Image
+import PIL.ImageColor
+from rasterizer import PngDecoder, Rasterizer, to_numpy, make_rasterizer, available_backends
+from encoder import FFmpegEncoder, encoder_settings
+from captiongenerator import CaptionGenerator
+from renderoptions import RenderOptions
+
+EXAMPLES_FOLDER = Path(__file__).absolute().parent.joinpath("../examples/gettingstarted")
+
+# timings compared against a baseline, in milliseconds (init per spec, the others per frame)
+METRICS = ['init_ms', 'resolve_ms', 'rasterize_ms', 'encode_ms']
+
+
+def _make_png(width, height):
+    """
+    helper function to generate a png that compresses about as well as a rendered caption
+    :return: bytes with an RGBA png image
+    """
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    pixels[:, :, 0] = (x * 255 // max(1, width - 1)).astype(np.uint8)
+    pixels[:, :, 1] = (y * 255 // max(1, height - 1)).astype(np.uint8)
+    pixels[:, :, 2] = ((x // 40 + y // 40) % 2 * 255).astype(np.uint8)
+    pixels[:, :, 3] = 255
+    data = io.BytesIO()
+    PIL.Image.fromarray(pixels, "RGBA").save(data, "PNG")
+    return data.getvalue()
+
+
+def _measure(decode, pngdata, frames):
+    """
+    helper function to measure the time and the peak python/numpy memory allocated per decoded frame
+    (memory that PIL allocates internally is invisible to tracemalloc, so the copying path is underestimated)
+    :return: tuple (seconds per frame, bytes per frame)
+    """
+    decode(pngdata)  # warm up (e.g. allocate reused buffers)
+    tracemalloc.start()
+    total_bytes = 0
+    start_time = time.perf_counter()
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        frame = decode(pngdata)
+        _, peak = tracemalloc.get_traced_memory()
+        total_bytes += peak - baseline
+        del frame
+    elapsed = time.perf_counter() - start_time
+    tracemalloc.stop()
+    return elapsed / frames, total_bytes / frames
+
+
+def benchmark_decode(width, height, frames):
+    """
+    compares decoding png frames the old way (PIL image -> np.array copy -> contiguous copy for the encoder)
+    with decoding into a reused buffer (PngDecoder) followed by the single copy that is kept by the frame cache
+    :param width: width of the frames
+    :param height: height of the frames
+    :param frames: number of frames to decode per method
+    :return: dictionary of method name to (seconds per frame, bytes per frame)
+    """
+    pngdata = _make_png(width, height)
+    decoder = PngDecoder()
+
+    def decode_with_copies(data):
+        img = PIL.Image.open(io.BytesIO(data), formats=["PNG"])
+        return np.ascontiguousarray(to_numpy(img, width, height))
+
+    def decode_into_buffer(data):
+        return decoder.decode(data, width, height).copy()
+
+    return {'copying decode': _measure(decode_with_copies, pngdata, frames),
+            'reused buffer decode': _measure(decode_into_buffer, pngdata, frames)}
+
+
+class FakeRasterizer(Rasterizer):
+    """
+    Stand-in for a real rasterizer, so the rest of the pipeline can be benchmarked on machines without inkscape:
+    every frame is filled with a single color derived from the svg, so different svgs still give different frames.
+    """
+    def __init__(self):
+        self.buffer = None
+
+    def rasterize(self, svg, width, height, background):
+        channels = 4 if background is None else 3
+        if self.buffer is None or self.buffer.shape != (height, width, channels):
+            self.buffer = np.empty((height, width, channels), dtype=np.uint8)
+        checksum = zlib.crc32(svg.encode())
+        self.buffer[:, :, :3] = (checksum & 0xff, (checksum >> 8) & 0xff, (checksum >> 16) & 0xff)
+        if channels == 4:
+            self.buffer[:, :, 3] = 255
+        return self.buffer
+
+
+class BoxRasterizer(Rasterizer):
+    """
+    Deterministic stand-in for a real rasterizer: every drawable element after </defs> is painted as a
+    (half-)transparent box, in user units, so the pixels respect the viewBox like a real rasterizer would.
+    A caption line is a box that starts at its anchor and grows with its text; other elements get a box (and
+    color) derived from their svg. Pixels are sampled at their centers, so cropping the viewBox to whole pixels
+    gives exactly the same pixels as rasterizing the complete frame.
+    """
+    ROOT_ELEMENT = re.compile(r"<svg\b[^>]*>")
+    VIEWBOX = re.compile(r"""viewBox=(["'])(.*?)\1""")
+    ELEMENT = re.compile(r"<(text|rect|circle|path|ellipse|g|image|use)\b.*?(?:</\1>|/>)", re.S)
+    TEXT_POSITION = re.compile(r"""<text x="([^"]*)" y="([^"]*)\"""")
+
+    def rasterize(self, svg, width, height, background):
+        view_x, view_y, view_width, view_height = [float(v) for v in
+                                                   self.VIEWBOX.search(self.ROOT_ELEMENT.search(svg).group(0)).group(2).split()]
+        centers_x = view_x + (np.arange(width) + 0.5) * view_width / width
+        centers_y = view_y + (np.arange(height) + 0.5) * view_height / height
+        image = np.zeros((height, width, 4), dtype=np.float64)
+        if background is not None:
+            image[:, :, :3] = np.array(PIL.ImageColor.getrgb(background)[:3]) / 255
+            image[:, :, 3] = 1
+        for match in self.ELEMENT.finditer(svg.split("</defs>", 1)[1]):
+            element = match.group(0)
+            digest = hashlib.sha1(element.encode()).digest()
+            position = self.TEXT_POSITION.search(element) if match.group(1) == 'text' else None
+            if position is not None:
+                x, y = float(position.group(1)), float(position.group(2))
+                length = len(re.sub(r"<[^>]*>", "", element).strip())
+                left, top, right, bottom = x, y - 20, x + 10 * length, y + 5
+            else:
+                left = view_x + digest[0] * view_width / 512
+                top = view_y + digest[1] * view_height / 512
+                right, bottom = left + 1 + digest[2] * view_width / 400, top + 1 + digest[3] * view_height / 400
+            columns = (centers_x >= left) & (centers_x < right)
+            rows = (centers_y >= top) & (centers_y < bottom)
+            if not columns.any() or not rows.any():
+                continue
+            alpha = 0.5 if digest[4] % 2 else 1.0
+            color = np.array([digest[5], digest[6], digest[7]]) / 255
+            region = image[np.ix_(rows, columns)]
+            coverage = alpha + region[..., 3:4] * (1 - alpha)
+            colors = color * alpha + region[..., :3] * region[..., 3:4] * (1 - alpha)
+            region[..., :3] = np.divide(colors, coverage, out=np.zeros_like(colors), where=coverage > 0)
+            region[..., 3:4] = coverage
+            image[np.ix_(rows, columns)] = region
+        pixels = np.rint(image * 255).astype(np.uint8)
+        return pixels if background is None else pixels[..., :3]
+
+
+class CountingRasterizer(Rasterizer):
+    """
+    Wraps a rasterizer to count how often it is called, how many pixels it rasterizes and how long that takes.
+    """
+    def __init__(self, rasterizer):
+        """
+        :param rasterizer: the Rasterizer that does the work (closed by its owner)
+        """
+        self.rasterizer = rasterizer
+        self.calls = 0
+        self.pixels = 0
+        self.seconds = 0.0
+
+    def rasterize(self, svg, width, height, background):
+        self.calls += 1
+        self.pixels += width * height
+        start = time.perf_counter()
+        pixels = self.rasterizer.rasterize(svg, width, height, background)
+        self.seconds += time.perf_counter() - start
+        return pixels
+
+    def version(self):
+        return self.rasterizer.version()
+
+
+def stress_spec(lines=1, segments=1, filters=False, duration=2, fps=25):
+    """
+    generates a synthetic specification that stresses one dimension of the pipeline
+    :param lines: number of caption lines, each with its own position animation
+    :param segments: number of segments per line, alternating between a static and an animated style
+                     (lines with a single segment alternate between the styles as well)
+    :param filters: if True, every line gets an animated blur filter
+    :return: string with a .toml specification
+    """
+    parts = [f"""[Global]
+W = "1000"
+H = "500"
+duration = "{duration}"
+fps = "{fps}"
+format = "mp4"
+background = "black"
+
+[Animations.Position.slide]
+type = "PointAnimation"
+begin = "[-${{Global.W}}/3, 0]"
+end = "[${{Global.W}}/3, 0]"
+tween = "easeInOutQuad"
+
+[Animations.Style.grow]
+type = "NumberAnimation"
+begin = "10"
+end = "30"
+tween = "easeOutBounce"
+
+[Animations.Filter.sharpen]
+type = "NumberAnimation"
+begin = "20"
+end = "0"
+tween = "easeOutQuad"
+[Animations.Filter.sharpen.FilterAnimation.stdDeviationx]
+birth_time = "0"
+begin_time = "0"
+end_time = "${{Global.duration}}"
+death_time = "${{Global.duration}}"
+
+[Styles.normal.StyleProperties]
+text-anchor="middle"
+fill="white"
+font-size="20"
+font-family="sans-serif"
+
+[Styles.special.StyleProperties]
+text-anchor="middle"
+fill="yellow"
+font-size="${{Animations.Style.grow}}"
+font-family="sans-serif"
+[Styles.special.StyleAnimation.grow]
+birth_time = "0"
+begin_time = "0"
+end_time = "${{Global.duration}}"
+death_time = "${{Global.duration}}"
+"""]
+    for line in range(lines):
+        parts.append(f"""
+[Caption.Line{line}]
+pos = "${{Animations.Position.slide}}"
+[Caption.Line{line}.PositionAnimation]
+birth_time = "0"
+begin_time = "{line % 10} * ${{Global.duration}} / 20"
+end_time = "${{Global.duration}}"
+death_time = "${{Global.duration}}"
+""")
+        if filters:
+            parts.append(f"""[Caption.Line{line}.Filter]
+filter = "${{Filters.blur}}"
+[Caption.Line{line}.Filter.Overrides]
+stdDeviationx = "${{Animations.Filter.sharpen}}"
+""")
+        for segment in range(segments):
+            style = "special" if (line + segment) % 2 else "normal"
+            parts.append(f"""[Caption.Line{line}.Segments.Segment{segment}]
+text = "word{segment} "
+style = "${{Styles.{style}}}"
+""")
+    return "".join(parts)
+
+
+STRESS_SPECS = {
+    'stress-many-lines': dict(lines=60),
+    'stress-many-segments': dict(segments=200),
+    'stress-many-filters': dict(lines=20, filters=True),
+}
+
+
+def suite_specs(include_examples=True, include_stress=True):
+    """
+    :return: dictionary of benchmark name to .toml specification (the gettingstarted examples and the stress specs)
+    """
+    specs = {}
+    if include_examples:
+        for spec_file in sorted(EXAMPLES_FOLDER.glob("*.toml")):
+            specs[spec_file.stem] = spec_file.read_text("utf-8")
+    if include_stress:
+        for name, settings in STRESS_SPECS.items():
+            specs[name] = stress_spec(**settings)
+    return specs
+
+
+def benchmark_spec(contents, rasterizer, max_frames=50, scale=0.25, repeat=3):
+    """
+    times the stages of rendering one specification separately: initialization, resolving the svg of each frame
+    (without rasterizing), rasterizing and encoding to mp4
+    :param contents: string with the .toml specification
+    :param rasterizer: Rasterizer used for the rasterization stage (e.g. a FakeRasterizer)
+    :param max_frames: at most this many frames (evenly spread over the animation) are timed
+    :param scale: scale factor for the size of the rasterized frames
+    :param repeat: the initialization is timed this many times; the fastest time is kept
+    :return: dictionary with the timings in milliseconds (init_ms per spec; the others per frame), or None if the
+             specification can't be initialized
+    """
+    init_times = []
+    for _ in range(repeat):
+        generator = CaptionGenerator("", RenderOptions(scale=scale), rasterizer=rasterizer)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # warnings about defaults
+            success = generator.initialize_from_string(contents)
+        init_times.append(time.perf_counter() - start)
+        if not success:
+            return None
+
+    fps = generator.output_fps()
+    nr_of_frames = int(np.ceil(generator.duration() * fps))
+    indices = sorted(set(np.linspace(0, max(0, nr_of_frames - 1), min(max_frames, nr_of_frames)).round().astype(int)))
+    start = time.perf_counter()
+    svgs = [generator.make_svg(index / fps) for index in indices]
+    resolve_time = time.perf_counter() - start
+
+    W, H = generator.frame_size()
+    background = generator._replace_globals('${Global.background}')
+    start = time.perf_counter()
+    frames = [rasterizer.rasterize(svg, W, H, background).copy() for svg in svgs]
+    rasterize_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        encoder = FFmpegEncoder(os.path.join(folder, "benchmark.mp4"), W, H, fps, **encoder_settings('mp4'))
+        for frame in frames:
+            encoder.write_frame(frame)
+        encoder.close()
+        encode_time = time.perf_counter() - start
+
+    return {'init_ms': min(init_times) * 1000,
+            'resolve_ms': resolve_time * 1000 / len(indices),
+            'rasterize_ms': rasterize_time * 1000 / len(indices),
+            'encode_ms': encode_time * 1000 / len(indices),
+            'frames': len(indices),
+            'bindings': len(generator.bindings),
+            'svg_bytes': int(statistics.mean(len(svg) for svg in svgs))}
+
+
+LAYER_MODES = {
+    'whole': {},
+    'static-layers': {'static_layers': True},
+    'per-line': {'per_line': True},
+}
+
+
+def benchmark_layer_modes(contents, rasterizer, max_frames=100, scale=1.0):
+    """
+    times rendering the first frames of a specification as whole frames, with static layers and per caption line;
+    the frame cache is disabled, so every frame is really rendered (but the per-line cache of rasterized lines isn't)
+    :param contents: string with the .toml specification
+    :param rasterizer: Rasterizer that does the rasterization (e.g. a BoxRasterizer)
+    :param max_frames: at most this many consecutive frames, starting at the first frame, are timed
+    :param scale: scale factor for the size of the rasterized frames
+    :return: dictionary of layer mode to a dictionary with the milliseconds per frame (total and spent in the
+             rasterizer), rasterizer calls per frame and megapixels rasterized per frame, or None if the
+             specification can't be initialized
+    """
+    results = {}
+    for mode, options in LAYER_MODES.items():
+        counter = CountingRasterizer(rasterizer)
+        generator = CaptionGenerator("", RenderOptions(scale=scale, **options), rasterizer=counter)
+        generator.frame_cache.max_bytes = 0
+        with contextlib.redirect_stdout(io.StringIO()):  # warnings about defaults
+            if not generator.initialize_from_string(contents):
+                return None
+        fps = generator.output_fps()
+        nr_of_frames = max(1, min(max_frames, int(np.ceil(generator.duration() * fps))))
+        start = time.perf_counter()
+        for index in range(nr_of_frames):
+            generator.frame_maker(index / fps)
+        total_time = time.perf_counter() - start
+        results[mode] = {'frame_ms': total_time * 1000 / nr_of_frames,
+                         'rasterize_ms': counter.seconds * 1000 / nr_of_frames,
+                         'calls': counter.calls / nr_of_frames,
+                         'megapixels': counter.pixels / 1e6 / nr_of_frames,
+                         'frames': nr_of_frames}
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold=0.2, min_difference=0.1):
+    """
+    :param results: dictionary of benchmark name to timings, as returned by benchmark_spec
+    :param baseline: dictionary with the same structure, from an earlier run
+    :param threshold: relative slowdown that counts as a regression (0.2 is 20% slower)
+    :param min_difference: slowdowns smaller than this many milliseconds are ignored (timer noise)
+    :return: list of (benchmark name, metric, baseline value, new value) tuples for all regressions
+    """
+    regressions = []
+    for name, timings in results.items():
+        if timings is None or baseline.get(name) is None:
+            continue
+        for metric in METRICS:
+            old, new = baseline[name].get(metric), timings[metric]
+            if old is not None and new > old * (1 + threshold) and new - old > min_difference:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro benchmarks for the camala rendering pipeline.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    decode_parser = subparsers.add_parser("decode", help="memory allocated per decoded png frame")
+    decode_parser.add_argument("--width", type=int, default=3840)
+    decode_parser.add_argument("--height", type=int, default=2160)
+    decode_parser.add_argument("--frames", type=int, default=20)
+    suite_parser = subparsers.add_parser("suite", help="time initialization, svg resolution, rasterization and "
+                                                       "encoding for the gettingstarted examples and stress specs")
+    suite_parser.add_argument("--rasterizer", choices=['fake'] + available_backends(), default="fake",
+                              help="rasterizer to time (fake: a stand-in that doesn't need inkscape)")
+    suite_parser.add_argument("--inkscape", default="/usr/bin/inkscape", help="(full) path to the inkscape executable")
+    suite_parser.add_argument("--frames", type=int, default=50, help="maximum number of frames timed per spec")
+    suite_parser.add_argument("--scale", type=float, default=0.25, help="scale factor for the rasterized frames")
+    suite_parser.add_argument("--repeat", type=int, default=3, help="number of times the initialization is timed")
+    suite_parser.add_argument("--only", help="only run the benchmarks whose name contains this text")
+    suite_parser.add_argument("--no-examples", action="store_true", help="skip the gettingstarted examples")
+    suite_parser.add_argument("--no-stress", action="store_true", help="skip the synthetic stress specs")
+    suite_parser.add_argument("--output", help="save the results as json (e.g. to use as baseline later)")
+    suite_parser.add_argument("--baseline", help="json results of an earlier run to compare with")
+    suite_parser.add_argument("--threshold", type=float, default=0.2,
+                              help="relative slowdown that counts as a regression (default: 0.2, i.e. 20%%)")
+    suite_parser.add_argument("--min-difference", type=float, default=0.1,
+                              help="ignore slowdowns smaller than this many milliseconds (default: 0.1)")
+    layers_parser = subparsers.add_parser("layers", help="compare rendering whole frames with --static-layers and "
+                                                         "--per-line on consecutive frames")
+    layers_parser.add_argument("--rasterizer", choices=['box'] + available_backends(), default="box",
+                               help="rasterizer to time (box: a stand-in that doesn't need inkscape and, unlike "
+                                    "fake, respects the viewBox of cropped layers)")
+    layers_parser.add_argument("--inkscape", default="/usr/bin/inkscape", help="(full) path to the inkscape executable")
+    layers_parser.add_argument("--frames", type=int, default=100, help="number of consecutive frames timed per spec")
+    layers_parser.add_argument("--scale", type=float, default=1.0, help="scale factor for the rasterized frames")
+    layers_parser.add_argument("--only", help="only run the benchmarks whose name contains this text")
+    layers_parser.add_argument("specs", nargs="*", help=".toml specifications (default: the gettingstarted examples)")
+    args = parser.parse_args()
+
+    if args.benchmark == "decode":
+        print(f"Decoding {args.frames} frames of {args.width}x{args.height} pixels.")
+        for method, (seconds, allocated) in benchmark_decode(args.width, args.height, args.frames).items():
+            print(f"{method:>22}: {seconds * 1000:8.1f} ms/frame, {allocated / 1024 / 1024:8.1f} MiB allocated/frame")
+
+    elif args.benchmark == "layers":
+        if args.rasterizer == "box":
+            rasterizer = BoxRasterizer()
+        else:
+            rasterizer = make_rasterizer(args.inkscape, backend=args.rasterizer)
+        if args.specs:
+            specs = {Path(spec).stem: Path(spec).read_text("utf-8") for spec in args.specs}
+        else:
+            specs = suite_specs(include_stress=False)
+        if args.only:
+            specs = {name: contents for name, contents in specs.items() if args.only in name}
+        print(f"{'benchmark':<34}{'mode':<15}{'ms/frame':>10}{'raster':>10}{'calls':>8}{'Mpx':>8}{'speedup':>9}")
+        with rasterizer:
+            for name, contents in specs.items():
+                results = benchmark_layer_modes(contents, rasterizer, args.frames, args.scale)
+                if results is None:
+                    print(f"{name:<34}  failed to initialize")
+                    continue
+                for mode, timings in results.items():
+                    speedup = results['whole']['frame_ms'] / timings['frame_ms']
+                    print(f"{name:<34}{mode:<15}{timings['frame_ms']:>10.1f}{timings['rasterize_ms']:>10.1f}"
+                          f"{timings['calls']:>8.1f}{timings['megapixels']:>8.2f}{speedup:>8.1f}x")
+
+    elif args.benchmark == "suite":
+        if args.rasterizer == "fake":
+            rasterizer = FakeRasterizer()
+        else:
+            rasterizer = make_rasterizer(args.inkscape, backend=args.rasterizer)
+        specs = suite_specs(not args.no_examples, not args.no_stress)
+        if args.only:
+            specs = {name: contents for name, contents in specs.items() if args.only in name}
+        results = {}
+        print(f"{'benchmark':<36}{'init ms':>10}{'resolve':>10}{'raster':>10}{'encode':>10}  (ms per frame)")
+        with rasterizer:
+            for name, contents in specs.items():
+                results[name] = benchmark_spec(contents, rasterizer, args.frames, args.scale, args.repeat)
+                if results[name] is None:
+                    print(f"{name:<36}  failed to initialize")
+                    continue
+                print(f"{name:<36}" + "".join(f"{results[name][metric]:>10.3f}" for metric in METRICS))
+
+        failed = [name for name, timings in results.items() if timings is None]
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                                           'rasterizer': rasterizer.version(), 'scale': args.scale,
+                                           'frames': args.frames},
+                           'results': results}, f, indent=2)
+        regressions = []
+        if args.baseline:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+            if baseline['environment'].get('rasterizer') != rasterizer.version():
+                print(f"Warning: the baseline was measured with {baseline['environment'].get('rasterizer')}.")
+            regressions = compare_with_baseline(results, baseline['results'], args.threshold, args.min_difference)
+            for name, metric, old, new in regressions:
+                print(f"Regression: {name} {metric} {old:.3f} -> {new:.3f} ({new / old - 1:+.0%})")
+            if not regressions:
+                print(f"No regressions larger than {args.threshold:.0%} compared with {args.baseline}.")
+        exit(1 if regressions or failed else 0)
@@ -2,78 +2,140 @@ import tomli
 from mako.template import Template
 from mako import exceptions
 import platform
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
 import os.path
 from vectortween.NumberAnimation import NumberAnimation
 from vectortween.PointAnimation import PointAnimation
 from vectortween.SequentialAnimation import SequentialAnimation
 from vectortween.SumAnimation import SumAnimation
-from vectortween.Mapping import Mapping
-import string
-import ast
-import PIL.Image
-import subprocess
-import io
-import numpy as np
+import argparse
 import moviepy
 from moviepy.editor import CompositeVideoClip
+import proglog
+import numpy as np
 from pathlib import Path
 from dataclasses import dataclass
+from rasterizer import make_rasterizer
+from renderoptions import RenderOptions, positive_int, add_render_arguments, render_options_from_arguments
+from parallel import ParallelFrameRenderer, OrderedFrameSource
+from placeholders import PlaceholderPlan
+from timeline import Timeline, sample_frame
+from framecache import FrameCache, DiskFrameCache, cache_report
+from encoder import FFmpegEncoder, FORMAT_SETTINGS, encoder_settings
+from gifwriter import GifWriter, build_palette
+from profiling import Profiler, profile_table
+from incremental import FrameManifest, frame_ranges
+from expressions import ExpressionEvaluator, ExpressionError
+from typewriter import TypewriterIndex
+from layers import LayerPlan, LinePlan, strip_layer_markers
+import PIL.Image
+import contextlib
+import dataclasses
+import gzip
+import json
+import math
+import time
 
 @dataclass
 class FilterTemplate:
     svg_template: str
     defaults: dict
 
-def to_numpy(image, width, height):
-    '''  Converts an RGBA image into numpy RGB format  '''
-    arr = np.array(image).reshape(height, width, 4)  # Copies the data
-    return arr[:, :, :3]  # remove alpha channel
+@dataclass
+class AnimationBinding:
+    animation: object
+    birth_frame: float
+    begin_frame: float
+    end_frame: float
+    death_frame: float
+    target: str  # name of the placeholder to fill in (for 'position' and 'text' bindings: name of the caption line)
+    kind: str = 'value'  # one of 'value', 'position' or 'text'
 
 
 class CaptionGenerator(object):
     """
     The main class in this project. This class interprets .toml specifications and turns them into animated caption movies.
     """
-    def __init__(self, output_file):
+    # output formats that keep the alpha channel; these are rendered on a transparent background
+    ALPHA_FORMATS = ['png', 'webm', 'mov']
+
+    def __init__(self, output_file, options=None, rasterizer=None):
         """
 
         :param output_file: (full) path to where the resulting movie should be written
+        :param options: optional RenderOptions that configure the rendering (default: RenderOptions())
+        :param rasterizer: optional Rasterizer used to turn the generated svg frames into pixels
+                           (if not specified, one is made for the backend in the options)
         """
         self.template_folder = str(Path(__file__).absolute().parent.joinpath("templates"))
         self.output_file = output_file
         self.output_folder = str(Path(output_file).parent)
+        self.options = options if options is not None else RenderOptions()
         guess = defaultdict(lambda key: "")
         guess['Linux'] = '/usr/bin/inkscape'
         guess['Windows'] = r'c:\Program Files\Inkscape\Inkscape.exe'
         guess['Darwin'] = r'/Applications/Inkscape.app/Contents/MacOS/inkscape'  # ???
-        self.inkscape = guess[platform.system()]
+        self.inkscape = self.options.inkscape or guess[platform.system()]
+        self.rasterizer = rasterizer
+        self.parallel_renderer = None
+        self.last_cache_statistics = None
+        self.profiler = Profiler() if self.options.profiling() else None
+        self.last_profile_report = None
+        self.frame_cache = FrameCache()
+        self.disk_cache = DiskFrameCache(self.options.cache_dir, self.options.cache_size) \
+            if self.options.cache_dir else None
+        self.layer_plan = None
         self.frame_maker = None
         self.animations = {}
         self.filters = {}
         self.paths = {}
         self.spec = None
+        self.spec_contents = None
+        self.expressions = None
+        self.svg_skeleton = None
+        self.svg_plan = None
+        self.bindings = []
+        self.bound_targets = set()
+        self.static_values = {}
+        self.typewriters = {}
+        self.timeline = None
 
     def duration(self):
         """
 
         :return: value of the duration in seconds declared in the [Global] section of the .toml specification
         """
-        return self._eval_expr(self._replace_globals('${Global.duration}'))
+        return self.expressions.global_value('duration')
 
     def video_format(self):
         """
 
-        :return: value of the output format declared in the [Global] section of the .toml specification (can be gif, mp4 or svg)
+        :return: value of the output format declared in the [Global] section of the .toml specification
+                 (can be gif, mp4, svg, png, webm or mov)
         """
         return self.spec['Global']['format'].lower()
 
+    def has_alpha(self):
+        """
+
+        :return: True if the output format keeps the alpha channel (png sequence, webm, mov)
+        """
+        return self.video_format() in self.ALPHA_FORMATS
+
     def fps(self):
         """
 
         :return: value of the fps (frame per second) declared in the [Global] section
         """
-        return self._eval_expr(self._replace_globals('${Global.fps}'))
+        return self.expressions.global_value('fps')
+
+    def output_fps(self):
+        """
+
+        :return: frame rate with which the frames are rendered: the render_fps passed to the constructor if any,
+                 otherwise the fps declared in the [Global] section
+        """
+        return self.options.render_fps if self.options.render_fps else self.fps()
 
     def initialize_from_file(self, filename: str) -> bool:
         """
@@ -95,21 +157,61 @@ class CaptionGenerator(object):
         :param contents: a string containing the .toml specification
         :return: True if the initialization succeeded; False if it failed (e.g. because of syntax errors in the .toml file)
         """
-        self.spec = tomli.loads(contents)
-        if not self._validate_spec():
-            print("Errors in specification found.")
-            return False
-        if not self._build_animations():
-            print("Errors in animation specification found.")
-            return False
-        if not self._build_paths():
-            print("Errors in path specification found.")
-            return False
-        if not self._build_filters():
-            print("Errors in filter specification found.")
+        self.svg_skeleton = None
+        self.svg_plan = None
+        self.layer_plan = None
+        self.bindings = []
+        self.static_values = {}
+        self.timeline = None
+        with self._stage("parse spec"):
+            self.spec = tomli.loads(contents)
+        self.spec_contents = contents
+        self.expressions = ExpressionEvaluator(self.spec.get('Global', {}))
+        try:
+            with self._stage("validate spec"):
+                success = self._validate_spec()
+            if not success:
+                print("Errors in specification found.")
+                return False
+            with self._stage("build animations"):
+                success = self._build_animations()
+            if not success:
+                print("Errors in animation specification found.")
+                return False
+            with self._stage("build paths"):
+                success = self._build_paths()
+            if not success:
+                print("Errors in path specification found.")
+                return False
+            with self._stage("build filters"):
+                success = self._build_filters()
+            if not success:
+                print("Errors in filter specification found.")
+                return False
+
+            # the svg skeleton only depends on the spec, so it is rendered once here instead of once per frame
+            with self._stage("render template"):
+                success, self.svg_skeleton = self._make_svg_string()
+            if not success:
+                print("Error rendering svg template.")
+                return False
+            fps = self.output_fps()
+            with self._stage("bind animations"):
+                success = self._bind_animations(fps)
+            if not success:
+                print("Errors in caption specification found.")
+                return False
+            with self._stage("build timeline"):
+                self.timeline = Timeline(self.bindings, int(math.ceil(self.duration() * fps)))
+            with self._stage("build svg plan"):
+                success = self._build_svg_plan()
+            if not success:
+                return False
+        except ExpressionError as e:  # e.g. a typo in a formula; reported with the spec path where it occurs
+            print(f"Error! {e}")
             return False
 
-        self.frame_maker = self._build_make_frame(25)
+        self.frame_maker = self._build_make_frame(fps)
         return True
 
     def _check_section_present(self, section: str, subspec: dict) -> bool:
@@ -275,6 +377,7 @@ class CaptionGenerator(object):
         all_ok = True
         all_ok = self._check_section_present('Global', self.spec) and all_ok
         all_ok = self._check_all_keys_present(['W', 'H', 'duration'], 'Global', self.spec['Global']) and all_ok
+        all_ok = self._check_global_expressions(['W', 'H', 'duration', 'fps']) and all_ok
         all_ok = self._check_section_present('Animations', self.spec) and all_ok
         all_ok = self._check_animation_types(self.spec['Animations']) and all_ok
         all_ok = self._check_section_present('Styles', self.spec) and all_ok
@@ -285,6 +388,27 @@ class CaptionGenerator(object):
 
         return all_ok
 
+    def _check_global_expressions(self, keys):
+        """
+        helper function to check that some entries of the [Global] section are valid numerical expressions
+        (used during validation of the .toml spec)
+        :param keys: names of the entries to check (entries that are missing are skipped)
+        :return: True if ok; False if nok
+        """
+        all_ok = True
+        for key in keys:
+            if key in self.spec.get('Global', {}):
+                try:
+                    value = self.expressions.global_value(key)
+                except ExpressionError as e:
+                    print(f"Error in specification: {e}")
+                    all_ok = False
+                    continue
+                if not isinstance(value, (int, float)):
+                    print(f"Error in specification: Global.{key} = '{value}' is not a number.")
+                    all_ok = False
+        return all_ok
+
     def _replace_placeholders(self, the_string, placeholders):
         """
         helper function to replace things named ${something.else.goes} with values defined in a dictionary
@@ -312,24 +436,17 @@ class CaptionGenerator(object):
             placeholders[f"${{Global.{key}}}"] = self.spec['Global'][key]
         return self._replace_placeholders(the_string, placeholders)
 
-    def _eval_expr(self, expr):
+    def _evaluate(self, expr, path):
         """
-        takes a string and evaluates it to something numerical (i.e. number or list of numbers or a simple formula involving numbers)
-        written to be safer than using bare "eval"
+        takes a string and evaluates it to something numerical (i.e. number or list of numbers or a simple formula
+        involving numbers, ${Global.xxx} references and math functions like sin, cos, min, max and clamp)
+        expressions are compiled once and cached (see expressions.ExpressionEvaluator)
         :param expr: a string containing something numerical
-        :return: the numerical result
+        :param path: location of expr in the .toml specification, e.g. Caption.line1.pos (used in error messages)
+        :return: the numerical result, or expr itself if it is not a formula (e.g. a word); raises ExpressionError if
+                 a formula can't be evaluated
         """
-        try:
-            tree = ast.parse(expr, mode='eval')
-        except SyntaxError:
-            return expr  # not a Python expression
-        if not all(isinstance(node, (ast.Expression, ast.List, ast.Constant, ast.Load,
-                                     ast.UnaryOp, ast.unaryop,
-                                     ast.BinOp, ast.operator,
-                                     ast.Num)) for node in ast.walk(tree)):
-            return expr  # not a mathematical expression (numbers and operators)
-        result = eval(compile(tree, filename='', mode='eval'))
-        return result
+        return self.expressions.evaluate(expr, path)
 
     def _listel_from_str(self, string):
         """
@@ -364,8 +481,8 @@ class CaptionGenerator(object):
                 if the_type == basic_type_name:
                     if 'begin' not in tp:
                         print(f"Warning: no 'begin' specified in Animations.{kind}.{anim_instance}. Using 0 instead.")
-                    begin_str = self._replace_globals(tp['begin']) if 'begin' in tp else default_begin_end
-                    begin_numeric = self._eval_expr(begin_str)
+                    begin_str = tp['begin'] if 'begin' in tp else default_begin_end
+                    begin_numeric = self._evaluate(begin_str, f"Animations.{kind}.{anim_instance}.begin")
                     if not isinstance(begin_numeric, allowed_begin_end_types):
                         print(
                             f"Invalid expression in Animations.{kind}.{anim_instance}.begin. Expected to find a {type(default_begin_end)}. Found {begin_numeric} instead.")
@@ -373,8 +490,8 @@ class CaptionGenerator(object):
                     if 'end' not in tp:
                         print(
                             f"Warning: no 'end' specified in Animations.{kind}.{anim_instance}. Using {default_begin_end} instead.")
-                    end_str = self._replace_globals(tp['end']) if 'end' in tp else default_begin_end
-                    end_numeric = self._eval_expr(end_str)
+                    end_str = tp['end'] if 'end' in tp else default_begin_end
+                    end_numeric = self._evaluate(end_str, f"Animations.{kind}.{anim_instance}.end")
                     if not isinstance(end_numeric, allowed_begin_end_types):
                         print(
                             f"Invalid expression in Animations.{kind}.{anim_instance}.end. Expected to find a {type(default_begin_end)}. Found {end_numeric} instead.")
@@ -401,14 +518,15 @@ class CaptionGenerator(object):
                             return False
                         elements.append(self.animations[kind][stripped_el])
 
-                    timeweights_str = self._replace_globals(tp['time_weights']) if 'time_weights' in tp else None
-                    timeweights = self._eval_expr(timeweights_str) if timeweights_str else None
+                    timeweights_str = tp['time_weights'] if 'time_weights' in tp else None
+                    timeweights = self._evaluate(timeweights_str, f"Animations.{kind}.{anim_instance}.time_weights") \
+                        if timeweights_str else None
                     if timeweights is not None and len(timeweights) != len(elements_str):
                         print(
                             f"Timeweights must have same length as elements in Animations.{kind}.{anim_instance}.time_weights. Currently len(elements) = {len(elements_str)}, but len(time_weights) = {len(timeweights)}")
                         return False
-                    repeats = self._replace_globals(tp['repeats']) if 'repeats' in tp else '1'
-                    repeats = self._eval_expr(repeats)
+                    repeats = tp['repeats'] if 'repeats' in tp else '1'
+                    repeats = self._evaluate(repeats, f"Animations.{kind}.{anim_instance}.repeats")
                     tween = tp['tween'] if 'tween' in tp else 'linear'
                     if not self._check_valid_tween(tween):
                         print(
@@ -541,7 +659,7 @@ class CaptionGenerator(object):
                         print(f"Error! Caption.{line}.Filter.filter does not point to an existing file {filter_defaults_file}.")
                         return False
                     try:
-                        filter_defaults = tomli.load(filter_defaults_file)
+                        filter_defaults = tomli.loads(filter_defaults_file.read_text("utf-8"))
                     except Exception:
                         print(f"Error! Couldn't parse {filter_defaults_file}. Check for syntax errors.")
                         return False
@@ -556,62 +674,6 @@ class CaptionGenerator(object):
                 self.paths[path] = True # just remember which paths exist for validation purposes later on
         return True
 
-    def _get_text_per_segment_for_line(self, text_per_line_per_segment, line, animated_value):
-        """
-        helper function to return part of a larger text based on the value of animated_value
-        for value 0 only 1 character is returned, for value 100 (think percentage) all characters are returned
-        (note: negative animated_value returns characters from the back to the front instead of from front to back)
-        extra difficulty is that the complete text may be spread over different segments, so this function needs to
-        preserve these boundaries
-        :param text_per_line_per_segment: datastructure containing text split in different segments per line
-        :param line: current line being examined
-        :param animated_value: value between -100-100 to indicate how much of the text is to be returned
-        :return:
-        """
-        text_per_segment = text_per_line_per_segment[line]
-        total_text = ""
-        for s in text_per_segment:
-            total_text += text_per_segment[s]
-        len_total_text = len(total_text)
-        text_values = OrderedDict()
-
-        if animated_value is None:
-            for s in text_per_segment:
-                text_values[f"text_{line}_{s}"] = ""
-        else:
-            if animated_value >= 0:
-                reverse = False
-                end_index = Mapping.linlin(animated_value, 0, 100, 0, len_total_text - 1, clip=True)
-            else:
-                reverse = True
-                end_index = Mapping.linlin(-animated_value, 0, 100, 0, len_total_text - 1, clip=True)
-
-            if not reverse:
-                cur_index = 0
-                for s in text_per_segment:
-                    partial_s = ""
-                    for character in text_per_segment[s]:
-                        if cur_index <= end_index:
-                            partial_s += character
-                            cur_index += 1
-                        else:
-                            cur_index += 1
-                    text_values[f"text_{line}_{s}"] = partial_s
-            else:
-                cur_index = 0
-                for s in reversed(text_per_segment):
-                    partial_s = ""
-                    for character in reversed(text_per_segment[s]):
-                        if cur_index <= end_index:
-                            partial_s = character + partial_s
-                            cur_index += 1
-                        else:
-                            cur_index += 1
-                    text_values[f"text_{line}_{s}"] = partial_s
-                    text_values.move_to_end(f"text_{line}_{s}",
-                                            last=False)  # reverse order since we iterated in reverse
-        return text_values
-
     def _make_svg_string(self) -> bool:
         """
         renders the mako svg template to get a string that still contains placeholders for animated values
@@ -636,27 +698,27 @@ class CaptionGenerator(object):
         """
         birth_frame = 0
         start_frame = 0
-        stop_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
-        death_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
+        stop_frame = self.duration() * fps
+        death_frame = self.duration() * fps
         if kind in self.spec['Caption'][line]:
             time_section = self.spec['Caption'][line][kind]
             if 'birth_time' in time_section:
-                birth_frame = self._eval_expr(self._replace_globals(time_section['birth_time'])) * fps
+                birth_frame = self._evaluate(time_section['birth_time'], f"Caption.{line}.{kind}.birth_time") * fps
             else:
                 print(
                     f"Warning: no birth_time specified in Caption.{line}.{kind}. Using {birth_frame}.")
             if 'begin_time' in time_section:
-                start_frame = self._eval_expr(self._replace_globals(time_section['begin_time'])) * fps
+                start_frame = self._evaluate(time_section['begin_time'], f"Caption.{line}.{kind}.begin_time") * fps
             else:
                 print(
                     f"Warning: no start_time specified in Caption.{line}.{kind}. Using {start_frame}.")
             if 'end_time' in time_section:
-                stop_frame = self._eval_expr(self._replace_globals(time_section['end_time'])) * fps
+                stop_frame = self._evaluate(time_section['end_time'], f"Caption.{line}.{kind}.end_time") * fps
             else:
                 print(
                     f"Warning: no stop_time specified in Caption.{line}.{kind}. Using {stop_frame}.")
             if 'death_time' in time_section:
-                death_frame = self._eval_expr(self._replace_globals(time_section['death_time'])) * fps
+                death_frame = self._evaluate(time_section['death_time'], f"Caption.{line}.{kind}.death_time") * fps
             else:
                 print(
                     f"Warning: no death_time specified in Caption.{line}.{kind}. Using {death_frame}.")
@@ -673,27 +735,27 @@ class CaptionGenerator(object):
         """
         birth_frame = 0
         start_frame = 0
-        stop_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
-        death_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
+        stop_frame = self.duration() * fps
+        death_frame = self.duration() * fps
         if kind in self.spec['Styles'][style_name]['StyleAnimation']:
             time_section = self.spec['Styles'][style_name]['StyleAnimation'][kind]
             if 'birth_time' in time_section:
-                birth_frame = self._eval_expr(self._replace_globals(time_section['birth_time'])) * fps
+                birth_frame = self._evaluate(time_section['birth_time'], f"Styles.{style_name}.StyleAnimation.{kind}.birth_time") * fps
             else:
                 print(
                     f"Warning: no birth_time specified in Caption.{style_name}.StyleAnimation.{kind}. Using {birth_frame}.")
             if 'begin_time' in time_section:
-                start_frame = self._eval_expr(self._replace_globals(time_section['begin_time'])) * fps
+                start_frame = self._evaluate(time_section['begin_time'], f"Styles.{style_name}.StyleAnimation.{kind}.begin_time") * fps
             else:
                 print(
                     f"Warning: no start_time specified in Caption.{style_name}.StyleAnimation.{kind}. Using {start_frame}.")
             if 'end_time' in time_section:
-                stop_frame = self._eval_expr(self._replace_globals(time_section['end_time'])) * fps
+                stop_frame = self._evaluate(time_section['end_time'], f"Styles.{style_name}.StyleAnimation.{kind}.end_time") * fps
             else:
                 print(
                     f"Warning: no stop_time specified in Caption.{style_name}.StyleAnimation.{kind}. Using {stop_frame}.")
             if 'death_time' in time_section:
-                death_frame = self._eval_expr(self._replace_globals(time_section['death_time'])) * fps
+                death_frame = self._evaluate(time_section['death_time'], f"Styles.{style_name}.StyleAnimation.{kind}.death_time") * fps
             else:
                 print(
                     f"Warning: no death_time specified in Caption.{style_name}.StyleAnimation.{kind}. Using {death_frame}.")
@@ -712,8 +774,8 @@ class CaptionGenerator(object):
         """
         birth_frame = 0
         start_frame = 0
-        stop_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
-        death_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
+        stop_frame = self.duration() * fps
+        death_frame = self.duration() * fps
         if not attrib_anim_name in self.spec['Animations']['CaptionSvgAttribute']:
             print(
                 f"Error! didn't find a section Animations.CaptionSvgAttribute.{attrib_anim_name}. Using birth_frame = {birth_frame}, start_frame = {start_frame}, stop_frame = {stop_frame}, death_frame = {death_frame}.")
@@ -725,22 +787,22 @@ class CaptionGenerator(object):
                 time_section = self.spec['Animations']['CaptionSvgAttribute'][attrib_anim_name][
                     'CaptionSvgAttributeAnimation']
                 if 'birth_time' in time_section:
-                    birth_frame = self._eval_expr(self._replace_globals(time_section['birth_time'])) * fps
+                    birth_frame = self._evaluate(time_section['birth_time'], f"Animations.CaptionSvgAttribute.{attrib_anim_name}.CaptionSvgAttributeAnimation.birth_time") * fps
                 else:
                     print(
                         f"Warning: no birth_time specified in Animations.CaptionSvgAttribute.{attrib_anim_name}. Using {birth_frame}.")
                 if 'begin_time' in time_section:
-                    start_frame = self._eval_expr(self._replace_globals(time_section['begin_time'])) * fps
+                    start_frame = self._evaluate(time_section['begin_time'], f"Animations.CaptionSvgAttribute.{attrib_anim_name}.CaptionSvgAttributeAnimation.begin_time") * fps
                 else:
                     print(
                         f"Warning: no start_time specified in Animations.CaptionSvgAttribute.{attrib_anim_name}. Using {start_frame}.")
                 if 'end_time' in time_section:
-                    stop_frame = self._eval_expr(self._replace_globals(time_section['end_time'])) * fps
+                    stop_frame = self._evaluate(time_section['end_time'], f"Animations.CaptionSvgAttribute.{attrib_anim_name}.CaptionSvgAttributeAnimation.end_time") * fps
                 else:
                     print(
                         f"Warning: no stop_time specified in Animations.CaptionSvgAttribute.{attrib_anim_name}. Using {stop_frame}.")
                 if 'death_time' in time_section:
-                    death_frame = self._eval_expr(self._replace_globals(time_section['death_time'])) * fps
+                    death_frame = self._evaluate(time_section['death_time'], f"Animations.CaptionSvgAttribute.{attrib_anim_name}.CaptionSvgAttributeAnimation.death_time") * fps
                 else:
                     print(
                         f"Warning: no death_time specified in Animations.CaptionSvgAttribute.{attrib_anim_name}. Using {death_frame}.")
@@ -756,8 +818,8 @@ class CaptionGenerator(object):
         """
         birth_frame = 0
         start_frame = 0
-        stop_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
-        death_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
+        stop_frame = self.duration() * fps
+        death_frame = self.duration() * fps
         if not animation_name in self.spec['Animations']['Filter']:
             print(
                 f"Error! didn't find a section Animations.Filter.{animation_name}. Using birth_frame = {birth_frame}, start_frame = {start_frame}, stop_frame = {stop_frame}, death_frame = {death_frame}.")
@@ -771,22 +833,22 @@ class CaptionGenerator(object):
                 else:
                     time_section = self.spec['Animations']['Filter'][animation_name]['FilterAnimation'][parameter_name]
                     if 'birth_time' in time_section:
-                        birth_frame = self._eval_expr(self._replace_globals(time_section['birth_time'])) * fps
+                        birth_frame = self._evaluate(time_section['birth_time'], f"Animations.Filter.{animation_name}.FilterAnimation.{parameter_name}.birth_time") * fps
                     else:
                         print(
                             f"Warning: no birth_time specified in Animations.Filter.{animation_name}. Using {birth_frame}.")
                     if 'begin_time' in time_section:
-                        start_frame = self._eval_expr(self._replace_globals(time_section['begin_time'])) * fps
+                        start_frame = self._evaluate(time_section['begin_time'], f"Animations.Filter.{animation_name}.FilterAnimation.{parameter_name}.begin_time") * fps
                     else:
                         print(
                             f"Warning: no start_time specified in Animations.Filter.{animation_name}. Using {start_frame}.")
                     if 'end_time' in time_section:
-                        stop_frame = self._eval_expr(self._replace_globals(time_section['end_time'])) * fps
+                        stop_frame = self._evaluate(time_section['end_time'], f"Animations.Filter.{animation_name}.FilterAnimation.{parameter_name}.end_time") * fps
                     else:
                         print(
                             f"Warning: no stop_time specified in Animations.Filter.{animation_name}. Using {stop_frame}.")
                     if 'death_time' in time_section:
-                        death_frame = self._eval_expr(self._replace_globals(time_section['death_time'])) * fps
+                        death_frame = self._evaluate(time_section['death_time'], f"Animations.Filter.{animation_name}.FilterAnimation.{parameter_name}.death_time") * fps
                     else:
                         print(
                             f"Warning: no death_time specified in Animations.Filter.{animation_name}. Using {death_frame}.")
@@ -802,8 +864,8 @@ class CaptionGenerator(object):
         """
         birth_frame = 0
         start_frame = 0
-        stop_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
-        death_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
+        stop_frame = self.duration() * fps
+        death_frame = self.duration() * fps
         if not attrib_anim_name in self.spec['Animations']['SegmentSvgAttribute']:
             print(
                 f"Error! didn't find a section Animations.SegmentSvgAttribute.{attrib_anim_name}. Using birth_frame = {birth_frame}, start_frame = {start_frame}, stop_frame = {stop_frame}, death_frame = {death_frame}.")
@@ -815,22 +877,22 @@ class CaptionGenerator(object):
                 time_section = self.spec['Animations']['SegmentSvgAttribute'][attrib_anim_name][
                     'SegmentSvgAttributeAnimation']
                 if 'birth_time' in time_section:
-                    birth_frame = self._eval_expr(self._replace_globals(time_section['birth_time'])) * fps
+                    birth_frame = self._evaluate(time_section['birth_time'], f"Animations.SegmentSvgAttribute.{attrib_anim_name}.SegmentSvgAttributeAnimation.birth_time") * fps
                 else:
                     print(
                         f"Warning: no birth_time specified in Animations.SegmentSvgAttribute.{attrib_anim_name}. Using {birth_frame}.")
                 if 'begin_time' in time_section:
-                    start_frame = self._eval_expr(self._replace_globals(time_section['begin_time'])) * fps
+                    start_frame = self._evaluate(time_section['begin_time'], f"Animations.SegmentSvgAttribute.{attrib_anim_name}.SegmentSvgAttributeAnimation.begin_time") * fps
                 else:
                     print(
                         f"Warning: no start_time specified in Animations.SegmentSvgAttribute.{attrib_anim_name}. Using {start_frame}.")
                 if 'end_time' in time_section:
-                    stop_frame = self._eval_expr(self._replace_globals(time_section['end_time'])) * fps
+                    stop_frame = self._evaluate(time_section['end_time'], f"Animations.SegmentSvgAttribute.{attrib_anim_name}.SegmentSvgAttributeAnimation.end_time") * fps
                 else:
                     print(
                         f"Warning: no stop_time specified in Animations.SegmentSvgAttribute.{attrib_anim_name}. Using {stop_frame}.")
                 if 'death_time' in time_section:
-                    death_frame = self._eval_expr(self._replace_globals(time_section['death_time'])) * fps
+                    death_frame = self._evaluate(time_section['death_time'], f"Animations.SegmentSvgAttribute.{attrib_anim_name}.SegmentSvgAttributeAnimation.death_time") * fps
                 else:
                     print(
                         f"Warning: no death_time specified in Animations.SegmentSvgAttribute.{attrib_anim_name}. Using {death_frame}.")
@@ -846,8 +908,8 @@ class CaptionGenerator(object):
         """
         birth_frame = 0
         start_frame = 0
-        stop_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
-        death_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
+        stop_frame = self.duration() * fps
+        death_frame = self.duration() * fps
         if not 'PathAnimation' in self.spec['Caption'][line]:
             print(f"Warning. No PathAnimation section in Caption.{line}. Using birth_frame = {birth_frame}, start_frame = {start_frame}, stop_frame = {stop_frame}, death_frame = {death_frame}.")
         elif not short_name in self.spec['Caption'][line]['PathAnimation']:
@@ -856,41 +918,38 @@ class CaptionGenerator(object):
         else:
             time_section = self.spec['Caption'][line]['PathAnimation'][short_name]
             if 'birth_time' in time_section:
-                birth_frame = self._eval_expr(self._replace_globals(time_section['birth_time'])) * fps
+                birth_frame = self._evaluate(time_section['birth_time'], f"Caption.{line}.PathAnimation.{short_name}.birth_time") * fps
             else:
                 print(
                     f"Warning: no birth_time specified in Caption.{line}.PathAnimation.{short_name}. Using {birth_frame}.")
             if 'begin_time' in time_section:
-                start_frame = self._eval_expr(self._replace_globals(time_section['begin_time'])) * fps
+                start_frame = self._evaluate(time_section['begin_time'], f"Caption.{line}.PathAnimation.{short_name}.begin_time") * fps
             else:
                 print(
                     f"Warning: no start_time specified in Caption.{line}.PathAnimation.{short_name}. Using {start_frame}.")
             if 'end_time' in time_section:
-                stop_frame = self._eval_expr(self._replace_globals(time_section['end_time'])) * fps
+                stop_frame = self._evaluate(time_section['end_time'], f"Caption.{line}.PathAnimation.{short_name}.end_time") * fps
             else:
                 print(
                     f"Warning: no stop_time specified in Caption.{line}.PathAnimation.{short_name}. Using {stop_frame}.")
             if 'death_time' in time_section:
-                death_frame = self._eval_expr(self._replace_globals(time_section['death_time'])) * fps
+                death_frame = self._evaluate(time_section['death_time'], f"Caption.{line}.PathAnimation.{short_name}.death_time") * fps
             else:
                 print(
                     f"Warning: no death_time specified in Caption.{line}.PathAnimation.{short_name}. Using {death_frame}.")
         return birth_frame, start_frame, stop_frame, death_frame
 
-    def _resolve_textprovider_animations(self, fps, current_frame, line, svg):
+    def _bind_textprovider_animations(self, fps, line):
         """
-        helper function to iterate over all Caption.Line.Segments and fill in the value of the animated properties for the value of current_frame
+        helper function to bind the text of all Caption.Line.Segments (and the TextProvider animation revealing it, if any)
         :param fps: frames per second
-        :param current_frame: current frame in the animation
         :param line: which caption.Line we are processing
-        :param svg: svg string with placeholders
-        :return: new svg string with (potentially) some placeholders replaced by values
+        :return: True if ok; False if nok
         """
-        text_per_line_per_segment = defaultdict(lambda: defaultdict(lambda: ""))
-        for segment in self.spec['Caption'][line]['Segments']:
-            text_per_line_per_segment[line][segment] = self.spec['Caption'][line]['Segments'][segment]['text']
+        segments = self.spec['Caption'][line]['Segments']
+        self.typewriters[line] = TypewriterIndex(line, {segment: segments[segment]['text'] for segment in segments})
         if 'TextProvider' not in self.spec['Caption'][line]:
-            animated_value = 100
+            self.static_values.update(self.typewriters[line].reveal(100))
         else:
             if 'style' not in self.spec['Caption'][line]['TextProvider']:
                 print(f"Error! In Caption.{line}.TextProvider, no style is defined.")
@@ -908,50 +967,40 @@ class CaptionGenerator(object):
             animation = self.animations['TextProvider'][short_provider_name]
             birth_frame, start_frame, stop_frame, death_frame = self._parse_animation_times(fps, line,
                                                                                             'TextProviderAnimation')
-            animated_value = animation.make_frame(current_frame,
-                                                  birth_frame,
-                                                  start_frame,
-                                                  stop_frame,
-                                                  death_frame)
-
-        resolved_text_values = self._get_text_per_segment_for_line(text_per_line_per_segment, line,
-                                                                   animated_value)
-        svg = string.Template(svg).safe_substitute(resolved_text_values)
-        return svg
-
-    def _resolve_pathproperty_animations(self, fps, current_frame, line, svg):
+            self.bindings.append(AnimationBinding(animation, birth_frame, start_frame, stop_frame, death_frame,
+                                                  target=line, kind='text'))
+        return True
+
+    def _bind_pathproperty_animations(self, fps, line):
+        """
+        helper function to bind the animations used in Caption.line.PathProperties
+        :param fps: frames per second
+        :param line: which caption.Line we are processing
+        :return: True if ok; False if nok
+        """
         if 'PathProperties' not in self.spec['Caption'][line]:
             # use defaults
-            return svg
-        else:
-            resolved_pathanimation_values = {}
-            for prop in self.spec['Caption'][line]['PathProperties']:
-                if "${" in self.spec['Caption'][line]['PathProperties'][prop]:
-                    short_name = self.spec['Caption'][line]['PathProperties'][prop][len("${Animations.Path."):-1]
-                    if short_name not in self.animations['Path']:
-                        print(
-                            f"Error! Section Caption.{line}.PathProperties uses an animation {short_name} which is not defined in Animations.Path section")
-                        return False
-                    birth_frame, start_frame, end_frame, death_frame = self._parse_path_animation_times(fps, line, short_name)
-                    current_value = self.animations['Path'][short_name].make_frame(current_frame,
-                                                                                   birth_frame,
-                                                                                   start_frame,
-                                                                                   end_frame,
-                                                                                   death_frame)
-                    key = "${Animations.Path." + f"{short_name}" + "_for_line_" + f"{line}" + "}"
-                    resolved_pathanimation_values[key] = current_value
-            svg = self._replace_placeholders(svg, resolved_pathanimation_values)
-        return svg
-
+            return True
+        for prop in self.spec['Caption'][line]['PathProperties']:
+            if "${" in self.spec['Caption'][line]['PathProperties'][prop]:
+                short_name = self.spec['Caption'][line]['PathProperties'][prop][len("${Animations.Path."):-1]
+                if short_name not in self.animations['Path']:
+                    print(
+                        f"Error! Section Caption.{line}.PathProperties uses an animation {short_name} which is not defined in Animations.Path section")
+                    return False
+                birth_frame, start_frame, end_frame, death_frame = self._parse_path_animation_times(fps, line, short_name)
+                key = "Animations.Path." + f"{short_name}" + "_for_line_" + f"{line}"
+                self.bindings.append(AnimationBinding(self.animations['Path'][short_name],
+                                                      birth_frame, start_frame, end_frame, death_frame,
+                                                      target=key))
+        return True
 
-    def _resolve_captionsvgattribute_animations(self, fps, current_frame, line, svg):
+    def _bind_captionsvgattribute_animations(self, fps, line):
         """
-        helper function to replace animation placeholders in Caption.line.CaptionSvgAttribute with animated values for current_frame
+        helper function to bind the animations used in Caption.line.CaptionSvgAttribute
         :param fps: frames per second
-        :param current_frame: current frame in the animation
         :param line: which caption.Line we are processing
-        :param svg: svg string with placeholders
-        :return: new svg string with (potentially) some placeholders replaced by values
+        :return: True if ok; False if nok
         """
         if 'CaptionSvgAttribute' in self.spec['Caption'][line]:
             for key in self.spec['Caption'][line]['CaptionSvgAttribute']:
@@ -966,25 +1015,17 @@ class CaptionGenerator(object):
                     birth_frame, start_frame, stop_frame, death_frame = self._parse_captionsvgattribute_animation_times( \
                         fps,
                         short_provider_name)
-                    animated_value = animation.make_frame(current_frame,
-                                                          birth_frame,
-                                                          start_frame,
-                                                          stop_frame,
-                                                          death_frame)
-                    resolved_style_values = {
-                        "${Animations.CaptionSvgAttribute." + short_provider_name + "_for_line_" + line + "}": animated_value}
-                    svg = self._replace_placeholders(svg, resolved_style_values)
-        return svg
-
-    def _resolve_segmentsvgattribute_animations(self, fps, current_frame, line, segment, svg):
-        """
-        helper function to replace animation placeholders in Caption.line.SegmentSvgAttribute with animated values for current_frame
+                    self.bindings.append(AnimationBinding(animation, birth_frame, start_frame, stop_frame, death_frame,
+                                                          target="Animations.CaptionSvgAttribute." + short_provider_name + "_for_line_" + line))
+        return True
+
+    def _bind_segmentsvgattribute_animations(self, fps, line, segment):
+        """
+        helper function to bind the animations used in Caption.line.Segments.segment.SegmentSvgAttribute
         :param fps: frames per second
-        :param current_frame: current frame in the animation
         :param line: which caption.Line we are processing
         :param segment: which segment we are processing within the line
-        :param svg: svg string with placeholders
-        :return: new svg string with (potentially) some placeholders replaced by values
+        :return: True if ok; False if nok
         """
         if 'SegmentSvgAttribute' in self.spec['Caption'][line]['Segments'][segment]:
             for key in self.spec['Caption'][line]['Segments'][segment]['SegmentSvgAttribute']:
@@ -995,40 +1036,23 @@ class CaptionGenerator(object):
                         print(
                             f"Error: Caption.{line}.Segments.{segment}.SegmentSvgAttribute specifies an animation which is not defined in the Animations.SegmentSvgAttribute section.")
                         return False
-                animation = self.animations['SegmentSvgAttribute'][short_provider_name]
-                birth_frame, start_frame, stop_frame, death_frame = self._parse_segmentsvgattribute_animation_times(fps,
-                                                                                                                    short_provider_name)
-                animated_value = animation.make_frame(current_frame,
-                                                      birth_frame,
-                                                      start_frame,
-                                                      stop_frame,
-                                                      death_frame)
-                resolved_style_values = {
-                    "${Animations.SegmentSvgAttribute." + short_provider_name + "_for_line_" + line + "_for_segment_" + segment + "}": animated_value
-                }
-                svg = self._replace_placeholders(svg, resolved_style_values)
-        return svg
-
-    def _resolve_position_animations(self, fps, current_frame, line, svg):
-        """
-        helper function to replace animation placeholders in Caption.line.PositionAnimation with animated values for current_frame
+                    animation = self.animations['SegmentSvgAttribute'][short_provider_name]
+                    birth_frame, start_frame, stop_frame, death_frame = self._parse_segmentsvgattribute_animation_times(fps,
+                                                                                                                        short_provider_name)
+                    self.bindings.append(AnimationBinding(animation, birth_frame, start_frame, stop_frame, death_frame,
+                                                          target="Animations.SegmentSvgAttribute." + short_provider_name + "_for_line_" + line + "_for_segment_" + segment))
+        return True
+
+    def _bind_position_animations(self, fps, line):
+        """
+        helper function to bind the position (or position animation) of Caption.line
         :param fps: frames per second
-        :param current_frame: current frame in the animation
         :param line: which caption.Line we are processing
-        :param svg: svg string with placeholders
-        :return: new svg string with (potentially) some placeholders replaced by values
+        :return: True if ok; False if nok
         """
         current_pos = [0, 0]
         if 'pos' not in self.spec['Caption'][line] and 'path' not in self.spec['Caption'][line]:  # no position or path
             print(f"Warning: no position/path specified in caption Caption.{line}. Using {current_pos} instead.")
-            resolved_values = {line + '_x': current_pos[0],
-                               line + "_y": current_pos[1]}
-            svg = string.Template(svg).safe_substitute(resolved_values)
-        elif 'path' in self.spec['Caption'][line] and not 'pos' in self.spec['Caption'][line]:
-            # with path specified, but no position
-            resolved_values = {line + '_x': current_pos[0],
-                               line + "_y": current_pos[1]}
-            svg = string.Template(svg).safe_substitute(resolved_values)
         elif 'pos' in self.spec['Caption'][line]:
             cap = self.spec['Caption'][line]
             if '${' in cap['pos']:  # animated position
@@ -1043,7 +1067,6 @@ class CaptionGenerator(object):
                     the_pos_el = self._listel_from_str(the_pos)
                 else:
                     the_pos_el = [the_pos]
-                current_pos = [0, 0]
                 for index, animation in enumerate(the_pos_el):
                     if '${Animations.Position' in animation:
                         if len(the_pos_el) != 1:
@@ -1052,46 +1075,35 @@ class CaptionGenerator(object):
                             return False
 
                         animation_short_name = the_pos_el[0][len("${Animations.Position."):-1]
+                        if animation_short_name not in self.animations['Position']:
+                            print(
+                                f"Error! Caption.{line}.pos uses an animation {animation_short_name} which is not defined in the Animations.Position section.")
+                            return False
                         animation_obj = self.animations['Position'][animation_short_name]
-                        animation_value = animation_obj.make_frame(current_frame, birth_frame, start_frame,
-                                                                   stop_frame, death_frame)
-                        current_pos = list(animation_value)
-                        if current_pos[0] is None:
-                            current_pos[0] = 1e10  # move out of sight
-                        if current_pos[1] is None:
-                            current_pos[1] = 1e10  # move out of sight
+                        self.bindings.append(AnimationBinding(animation_obj, birth_frame, start_frame, stop_frame,
+                                                              death_frame, target=line, kind='position'))
+                        return True
                     else:
                         if len(the_pos_el) != 2:
                             print(
                                 f"Error! Position animation in Caption.{line}.pos must be a single animation, or a list of 2 floats.")
                             return False
-                        animation_value = float(animation)
-                        current_pos[index] = animation_value
-                resolved_values = {line + '_x': current_pos[0],
-                                   line + "_y": current_pos[1]}
-                svg = string.Template(svg).safe_substitute(resolved_values)
+                        current_pos[index] = float(animation)
             else:  # fixed position
-                current_pos = self._eval_expr(self._replace_globals(self.spec['Caption'][line]['pos']))
-                resolved_values = {line + '_x': current_pos[0],
-                                   line + "_y": current_pos[1]}
-                svg = string.Template(svg).safe_substitute(resolved_values)
-        return svg
+                current_pos = self._evaluate(self.spec['Caption'][line]['pos'], f"Caption.{line}.pos")
+        self.static_values[line + '_x'] = current_pos[0]
+        self.static_values[line + '_y'] = current_pos[1]
+        return True
 
-    def _resolve_style_animations(self, fps, current_frame, line, svg):
+    def _bind_style_animations(self, fps, line):
         """
-        helper function to replace animation placeholders in Caption.line.Segments.segment.style with animated values for current_frame
+        helper function to bind the animated properties of the styles used in Caption.line.Segments
+        (every style is bound only once, even if it is used by multiple segments)
         :param fps: frames per second
-        :param current_frame: current frame in the animation
         :param line: which caption.Line we are processing
-        :param svg: svg string with placeholders
-        :return: new svg string with (potentially) some placeholders replaced by values
+        :return: True if ok; False if nok
         """
-        # resolve style animations
         for segment in self.spec['Caption'][line]['Segments']:
-            birth_frame = 0
-            death_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
-            begin_frame = None
-            end_frame = None
             if 'style' in self.spec['Caption'][line]['Segments'][segment]:
                 style_name = self.spec['Caption'][line]['Segments'][segment]['style']
                 style_name_short = style_name[len("${Styles."): -1]
@@ -1103,23 +1115,19 @@ class CaptionGenerator(object):
                 for property in style_definition['StyleProperties']:
                     prop_val = style_definition['StyleProperties'][property]
                     if "${" in prop_val:  # animated property
-
                         property_animation_short = prop_val[len("${Animations.Style."):-1]
-                        birth_frame, begin_frame, end_frame, death_frame = self._parse_style_animation_times(fps,
-                                                                                                             style_name_short,
-                                                                                                             property_animation_short)
-
+                        key = "Animations.Style." + property_animation_short + "_for_style_" + style_name_short
+                        if key in self.bound_targets:
+                            continue
                         if property_animation_short in self.animations['Style']:
                             # animated style
+                            birth_frame, begin_frame, end_frame, death_frame = self._parse_style_animation_times(fps,
+                                                                                                                 style_name_short,
+                                                                                                                 property_animation_short)
                             animation = self.animations['Style'][property_animation_short]
-                            animated_value = animation.make_frame(current_frame,
-                                                                  birth_frame,
-                                                                  begin_frame,
-                                                                  end_frame,
-                                                                  death_frame)
-                            resolved_style_values = {
-                                "${Animations.Style." + property_animation_short + "_for_style_" + style_name_short + "}": animated_value}
-                            svg = self._replace_placeholders(svg, resolved_style_values)
+                            self.bindings.append(AnimationBinding(animation, birth_frame, begin_frame, end_frame,
+                                                                  death_frame, target=key))
+                            self.bound_targets.add(key)
                         else:
                             # unknown animated property
                             print(
@@ -1130,17 +1138,23 @@ class CaptionGenerator(object):
                         pass
             else:
                 # todo: use a default style? for now, use no style (which is also a kind of default I guess)
-                begin_frame = 0
-                end_frame = self._eval_expr(self._replace_globals('${Global.duration}')) * fps
-        return svg
+                pass
+        return True
 
-    def _resolve_filter_animations(self, fps, current_frame, line, svg):
+    def _bind_filter_animations(self, fps, line):
+        """
+        helper function to bind the (animated, overridden or default) filter parameters of Caption.line.Filter
+        :param fps: frames per second
+        :param line: which caption.Line we are processing
+        :return: True if ok; False if nok
+        """
         resolved_filter_values = {}
         if 'Filter' in self.spec['Caption'][line]:
             filter_name = self.spec['Caption'][line]['Filter']['filter'][len("${Filters."):-1]
             if 'Overrides' in self.spec['Caption'][line]['Filter']:
                 for override in self.spec['Caption'][line]['Filter']['Overrides']:
                     override_value = self.spec['Caption'][line]['Filter']['Overrides'][override]
+                    key = "Animations.Filter." + f"{override}_{line}"
                     if "${" in override_value: # animated filter value
                         animation_name = override_value[len("${Animations.Filter."):-1]
                         if animation_name not in self.animations['Filter']:
@@ -1150,109 +1164,422 @@ class CaptionGenerator(object):
                         birth_frame, begin_frame, end_frame, death_frame = self._parse_filter_animation_times(fps,
                                                                                                               animation_name,
                                                                                                               override)
-                        current_value = animation.make_frame(current_frame, birth_frame, begin_frame,
-                                                             end_frame, death_frame)
-                        resolved_filter_values["${Animations.Filter." + f"{override}_{line}" + "}"] = current_value
+                        self.bindings.append(AnimationBinding(animation, birth_frame, begin_frame, end_frame,
+                                                              death_frame, target=key))
+                        self.bound_targets.add(key)
                     else: # fixed filter value
-                        resolved_filter_values["${Animations.Filter." + f"{override}_{line}" + "}"] = override_value
+                        resolved_filter_values[key] = override_value
             # now replace everything that was not overridden with default values
             for parameter in self.filters[filter_name].defaults['defaults']:
-                key = "${Animations.Filter." + f"{parameter}_{line}" + "}"
-                if key not in resolved_filter_values:
+                key = "Animations.Filter." + f"{parameter}_{line}"
+                if key not in resolved_filter_values and key not in self.bound_targets:
                     resolved_filter_values[key] = self.filters[filter_name].defaults['defaults'][parameter]
-            svg = self._replace_placeholders(svg, resolved_filter_values)
-        return svg
+            self.static_values.update(resolved_filter_values)
+        return True
 
-    def _resolve_uninstantiated_filter_animations(self, svg):
-        resolved_filter_values = {}
+    def _bind_uninstantiated_filter_animations(self):
+        """
+        helper function to fill in default values for the filters that are defined for every line, but not used by it
+        :return: True if ok; False if nok
+        """
         for line in self.spec['Caption']:
             for filter_name in self.filters:
                 for parameter in self.filters[filter_name].defaults['defaults']:
-                    key = "${Animations.Filter." + f"{parameter}_{line}" + "}"
-                    if key not in resolved_filter_values:
-                        resolved_filter_values[key] = self.filters[filter_name].defaults['defaults'][parameter]
-        svg = self._replace_placeholders(svg, resolved_filter_values)
-        return svg
+                    key = "Animations.Filter." + f"{parameter}_{line}"
+                    if key not in self.static_values and key not in self.bound_targets:
+                        self.static_values[key] = self.filters[filter_name].defaults['defaults'][parameter]
+        return True
 
-    def _build_make_frame(self, fps):
+    def _bind_animations(self, fps):
         """
-        helper function to generate a make_frame function that can be used by moviepy
+        function to resolve, once, every animation reference in the Caption section into a flat table of
+        AnimationBindings (animation, birth/begin/end/death frame and target placeholder) and a dictionary
+        of placeholder values that never change. Generating a frame then only needs to evaluate the bindings.
         :param fps: frames per second
-        :return: a function that is suitable as make_frame function in moviepy
+        :return: True if ok; False if nok
         """
-        def make_frame(t):
-            current_frame = t * fps
-            success, svg = self._make_svg_string()
-            if not success:
-                print(f"Error rendering svg template.")
+        self.bindings = []
+        self.bound_targets = set()
+        self.static_values = {}
+        self.typewriters = {}
+        for line in self.spec['Caption']:
+            if not self._bind_textprovider_animations(fps, line):
                 return False
 
-            # resolve the different positions and position animations
-            for line in self.spec['Caption']:
-                svg = self._resolve_textprovider_animations(fps, current_frame, line, svg)
-                if not svg:
-                    return False
+            if not self._bind_captionsvgattribute_animations(fps, line):
+                return False
 
-                svg = self._resolve_captionsvgattribute_animations(fps, current_frame, line, svg)
-                if not svg:
+            for segment in self.spec['Caption'][line]['Segments']:
+                if not self._bind_segmentsvgattribute_animations(fps, line, segment):
                     return False
 
-                for segment in self.spec['Caption'][line]['Segments']:
-                    svg = self._resolve_segmentsvgattribute_animations(fps, current_frame, line, segment, svg)
-                    if not svg:
-                        return False
+            if not self._bind_position_animations(fps, line):
+                return False
 
-                svg = self._resolve_position_animations(fps, current_frame, line, svg)
-                if not svg:
-                    return False
+            if not self._bind_style_animations(fps, line):
+                return False
 
-                svg = self._resolve_style_animations(fps, current_frame, line, svg)
-                if not svg:
-                    return False
+            if not self._bind_filter_animations(fps, line):
+                return False
 
-                svg = self._resolve_filter_animations(fps, current_frame, line, svg)
-                if not svg:
-                    return False
+            if not self._bind_pathproperty_animations(fps, line):
+                return False
 
-                svg = self._resolve_pathproperty_animations(fps, current_frame, line, svg)
-                if not svg:
-                    return False
+        return self._bind_uninstantiated_filter_animations()
 
-            svg = self._resolve_uninstantiated_filter_animations(svg)
-            if not svg:
-                return False
+    def _get_rasterizer(self):
+        """
+        helper function to lazily create the default rasterizer (so changes to self.inkscape are still picked up)
+        :return: the Rasterizer used to render frames
+        """
+        if self.rasterizer is None:
+            self.rasterizer = make_rasterizer(self.inkscape, backend=self.options.backend)
+        return self.rasterizer
 
-            if "${" in svg:
-                print(
-                    f"Error! Some animations or globals could not be resolved. Please check your specification for typos.")
-                print(f"{svg}")
-                return False
+    def _resolve_placeholder_values(self, current_frame):
+        """
+        helper function to compute the values of all placeholders in the svg skeleton for current_frame
+        :param current_frame: current frame in the animation
+        :return: dictionary of placeholder name to value
+        """
+        values = dict(self.static_values)
+        if self.profiler is None:
+            for index, binding in enumerate(self.bindings):
+                self._resolve_binding(index, binding, current_frame, values)
+            return values
+
+        # while profiling, keep track of the time spent per group of animations (Style, Filter, Path, ...)
+        timings = defaultdict(float)
+        for index, binding in enumerate(self.bindings):
+            start = time.perf_counter()
+            self._resolve_binding(index, binding, current_frame, values)
+            timings[self._binding_group(binding)] += time.perf_counter() - start
+        frame = int(round(current_frame))
+        start = time.perf_counter() - sum(timings.values())
+        for group, seconds in timings.items():  # shown one after the other in the trace
+            self.profiler.add(f"resolve {group} animations", start, seconds, frame)
+            start += seconds
+        return values
+
+    def _resolve_binding(self, index, binding, current_frame, values):
+        """
+        helper function to compute the placeholder value(s) of a single AnimationBinding for current_frame
+        :param index: index of the binding in self.bindings
+        :param binding: the AnimationBinding
+        :param current_frame: current frame in the animation
+        :param values: dictionary of placeholder name to value in which the result is stored
+        """
+        found, animated_value = self.timeline.lookup(index, current_frame) if self.timeline else (False, None)
+        if not found:
+            animated_value = sample_frame(binding.animation,
+                                          current_frame,
+                                          binding.birth_frame,
+                                          binding.begin_frame,
+                                          binding.end_frame,
+                                          binding.death_frame)
+        if binding.kind == 'position':
+            current_pos = list(animated_value) if animated_value is not None else [None, None]
+            if current_pos[0] is None:
+                current_pos[0] = 1e10  # move out of sight
+            if current_pos[1] is None:
+                current_pos[1] = 1e10  # move out of sight
+            values[binding.target + '_x'] = current_pos[0]
+            values[binding.target + '_y'] = current_pos[1]
+        elif binding.kind == 'text':
+            values.update(self.typewriters[binding.target].reveal(animated_value))
+        else:
+            values[binding.target] = animated_value
 
-            W = self._eval_expr(self._replace_globals('${Global.W}'))
-            H = self._eval_expr(self._replace_globals('${Global.H}'))
-            background = self._replace_globals('${Global.background}')
+    @staticmethod
+    def _binding_group(binding):
+        """
+        helper function to find the section of the spec an AnimationBinding comes from (for profiling)
+        :return: Position, TextProvider, or the animation section in the target name (e.g. Style, Filter, Path)
+        """
+        if binding.kind == 'position':
+            return 'Position'
+        if binding.kind == 'text':
+            return 'TextProvider'
+        return binding.target.split(".")[1]
 
-            if self.video_format() == 'svg':
-                frame = f"frame_{int(t * fps):08}.svg"
-                destination = os.path.join(self.output_folder, frame)
-                with open(destination, "w") as f:
-                    f.write(svg)
+    def _stage(self, name, frame=None):
+        """
+        helper function to time a stage of the rendering with the profiler (if profiling is enabled)
+        :param name: name of the stage
+        :param frame: index of the frame the stage belongs to, or None
+        :return: context manager
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.stage(name, frame)
+
+    def _build_svg_plan(self):
+        """
+        helper function to compile the svg skeleton into a PlaceholderPlan and check (once) that every
+        placeholder in it will be resolved while generating frames
+        :return: True if ok; False if nok
+        """
+        self.svg_plan = PlaceholderPlan(strip_layer_markers(self.svg_skeleton))
+        missing = self.svg_plan.missing(self._resolve_placeholder_values(0))
+        if missing:
+            print(
+                f"Error! Some animations or globals could not be resolved. Please check your specification for typos.")
+            for name in missing:
+                print(f"Unresolved: ${{{name}}}")
+            return False
+        if self.options.static_layers or self.options.per_line:
+            animated_values = {}
+            for index, binding in enumerate(self.bindings):
+                self._resolve_binding(index, binding, 0, animated_values)
+            plan = LinePlan if self.options.per_line else LayerPlan
+            self.layer_plan = plan(self.svg_skeleton, set(animated_values), list(self.spec['Caption']))
+        return True
+
+    def frame_size(self):
+        """
+
+        :return: tuple (width, height) in pixels of the rendered frames: the W and H declared in the [Global] section,
+                 multiplied by the scale passed to the constructor
+        """
+        W = self.expressions.global_value('W')
+        H = self.expressions.global_value('H')
+        if self.options.scale == 1:
+            return W, H
+        return max(1, int(round(W * self.options.scale))), max(1, int(round(H * self.options.scale)))
+
+    def _rasterize(self, key, svg, W, H, background, frame_index=None, values=None):
+        """
+        helper function to rasterize a frame, or to load it from the disk cache if it was rasterized before
+        :param key: key of the frame as returned by FrameCache.key
+        :param frame_index: index of the frame (for profiling)
+        :param values: placeholder values of the frame; if given (and the svg has static layers, or is rendered
+                       per line), the frame is composited from its layers instead of being rasterized as a whole
+        :return: the rasterized frame
+        """
+        rasterizer = self._get_rasterizer()
+        if self.disk_cache is None:
+            return self._rasterize_frame(rasterizer, svg, W, H, background, frame_index, values)
+        disk_key = DiskFrameCache.key(key, rasterizer.version(), self._layer_mode())
+        with self._stage("disk cache", frame_index):
+            frame = self.disk_cache.get(disk_key)
+        if frame is None:
+            frame = self._rasterize_frame(rasterizer, svg, W, H, background, frame_index, values)
+            with self._stage("disk cache", frame_index):
+                self.disk_cache.put(disk_key, frame)
+        return frame
+
+    def _layer_mode(self):
+        """
+        :return: name of the way frames are made from their layers: 'whole', 'static-layers' or 'per-line'
+        """
+        if self.options.per_line:
+            return 'per-line'
+        return 'static-layers' if self.options.static_layers else 'whole'
+
+    def _rasterize_frame(self, rasterizer, svg, W, H, background, frame_index, values):
+        """
+        helper function to rasterize a frame as a whole, or to composite it from its layers
+        :return: the rasterized frame (read-only if it is a view on a buffer that the rasterizer reuses)
+        """
+        if values is None or self.layer_plan is None or not self.layer_plan.is_layered():
+            return self._timed_rasterize(rasterizer, svg, W, H, background, frame_index)
+        return self.layer_plan.render(values,
+                                      lambda layer_svg, width, height: self._timed_rasterize(
+                                          rasterizer, layer_svg, width, height, None, frame_index),
+                                      W, H, background,
+                                      lambda name: self._stage(name, frame_index))
+
+    def _timed_rasterize(self, rasterizer, svg, W, H, background, frame_index):
+        """
+        helper function to rasterize a frame; while profiling, the time spent decoding the png image that the
+        rasterizer produced is recorded separately from the rasterization itself
+        :return: the rasterized frame (may be a view on a buffer that the rasterizer reuses)
+        """
+        if self.profiler is None:
+            return rasterizer.rasterize(svg, W, H, background)
+        start = time.perf_counter()
+        frame = rasterizer.rasterize(svg, W, H, background)
+        seconds = time.perf_counter() - start
+        decoder = getattr(rasterizer, 'decoder', None)
+        decode_time = decoder.last_decode_time if decoder is not None else 0.0
+        self.profiler.add("rasterize", start, seconds - decode_time, frame_index)
+        if decoder is not None:
+            self.profiler.add("png decode", start + seconds - decode_time, decode_time, frame_index)
+        return frame
+
+    def make_svg(self, t):
+        """
+        function to get the fully resolved svg document of a single frame (after initialization)
+        :param t: time in seconds
+        :return: svg string
+        """
+        return self.svg_plan.render(self._resolve_placeholder_values(t * self.output_fps()))
+
+    def cache_statistics(self):
+        """
+        :return: dictionary with the number of hits and misses of the in-memory and on-disk frame caches, and of
+                 the cache of rasterized layers in per-line mode
+        """
+        line_cache = self.layer_plan.cache if isinstance(self.layer_plan, LinePlan) else None
+        return {'hits': self.frame_cache.hits,
+                'misses': self.frame_cache.misses,
+                'disk_hits': self.disk_cache.hits if self.disk_cache else 0,
+                'disk_misses': self.disk_cache.misses if self.disk_cache else 0,
+                'line_hits': line_cache.hits if line_cache else 0,
+                'line_misses': line_cache.misses if line_cache else 0}
+
+    def _frame_position(self, t, fps):
+        """
+        helper function to find the (possibly fractional) position in the animation of the frame shown at time t
+        :param t: time in seconds
+        :param fps: frames per second
+        :return: position in frames; with a frame stride, the position of the last frame that is really rendered
+        """
+        current_frame = t * fps
+        if self.options.frame_stride > 1:
+            current_frame = (int(round(current_frame)) // self.options.frame_stride) * self.options.frame_stride
+        return current_frame
+
+    def frame_keys(self):
+        """
+        function to compute the key (see FrameCache.key) of every frame in the clip (after initialization),
+        without rasterizing anything; frames with equal keys look exactly the same
+        :return: list with one key per frame
+        """
+        fps = self.output_fps()
+        W, H = self.frame_size()
+        background = None if self.has_alpha() else self._replace_globals('${Global.background}')
+        keys = []
+        for index in range(int(math.ceil(self.duration() * fps))):
+            svg = self.svg_plan.render(self._resolve_placeholder_values(self._frame_position(index / fps, fps)))
+            keys.append(FrameCache.key(svg, W, H, background))
+        return keys
+
+    def _frame_manifest(self):
+        """
+        helper function to build the FrameManifest of the clip (after initialization)
+        """
+        rasterizer_version = self._get_rasterizer().version()
+        return FrameManifest(self.frame_keys(), {'rasterizer': rasterizer_version, 'fps': self.output_fps(),
+                                                'static_layers': self.options.static_layers,
+                                                'per_line': self.options.per_line})
+
+    def _build_make_frame(self, fps):
+        """
+        helper function to generate a make_frame function that can be used by moviepy
+        :param fps: frames per second
+        :return: a function that is suitable as make_frame function in moviepy
+        """
+        W, H = self.frame_size()
+        background = None if self.has_alpha() else self._replace_globals('${Global.background}')
 
-            result = subprocess.run([self.inkscape,
-                                     f'--export-background={background}',
-                                     '--export-type=png',
-                                     '--export-filename=-',
-                                     f'--export-width={W}',
-                                     f'--export-height={H}',
-                                     '--pipe'],
-                                    input=svg.encode(),
-                                    capture_output=True)
-            pngdata = result.stdout
-            img = PIL.Image.open(io.BytesIO(pngdata), formats=["PNG"])
-            return to_numpy(img, W, H)
+        def make_frame(t):
+            current_frame = self._frame_position(t, fps)
+            frame_index = int(round(current_frame))
+            values = self._resolve_placeholder_values(current_frame)
+            with self._stage("render svg", frame_index):
+                svg = self.svg_plan.render(values)
+
+            with self._stage("frame cache", frame_index):
+                key = FrameCache.key(svg, W, H, background)
+                frame = self.frame_cache.get(key)
+            if frame is None:
+                frame = self._rasterize(key, svg, W, H, background, frame_index, values)
+                frame = self.frame_cache.put(key, frame)  # only copies frames that the rasterizer will overwrite
+            return frame
 
         return make_frame
 
+    def _build_parallel_make_frame(self, fps):
+        """
+        helper function to generate a make_frame function that pre-renders frames on options.jobs worker processes
+        :param fps: frames per second with which the frames will be requested
+        :return: a function that is suitable as make_frame function in moviepy
+        """
+        self._start_parallel_renderer()
+        nr_of_frames = int(math.ceil(self.duration() * fps))
+        source = OrderedFrameSource(self.parallel_renderer, fps, nr_of_frames, self.frame_maker,
+                                    stride=self.options.frame_stride)
+        return source.make_frame
+
+    def _start_parallel_renderer(self):
+        """
+        helper function to start the worker processes that render frames in parallel
+        """
+        if self.rasterizer is not None:
+            # e.g. used for the gif palette samples: stop its inkscape process, so the workers don't share it
+            self.rasterizer.close()
+        self.parallel_renderer = ParallelFrameRenderer(self.spec_contents, self.options.jobs, self._worker_options(),
+                                                       rasterizer=self.rasterizer, profiler=self.profiler)
+
+    def _iter_frames(self, fps):
+        """
+        renders all frames of the clip in order (on options.jobs worker processes if jobs > 1)
+        the worker processes are started immediately, not when the first frame is requested
+        :param fps: frames per second
+        :return: generator of frames
+        """
+        nr_of_frames = int(math.ceil(self.duration() * fps))
+        stride = self.options.frame_stride
+        times = [index / fps for index in range(0, nr_of_frames, stride)]
+        if self.options.jobs > 1:
+            self._start_parallel_renderer()
+            frames = (frame for _, frame in self.parallel_renderer.iter_frames(times))
+        else:
+            frames = (self.frame_maker(t) for t in times)
+        return (frame for index, frame in enumerate(frames)
+                for _ in range(min(stride, nr_of_frames - index * stride)))
+
+    def _worker_options(self):
+        """
+        helper function to collect the options with which the worker processes build their own CaptionGenerator,
+        so that they render exactly the same frames as this one
+        :return: RenderOptions
+        """
+        return dataclasses.replace(self.options,
+                                   jobs=1,
+                                   inkscape=self.inkscape,
+                                   cache_dir=self.disk_cache.directory if self.disk_cache else None,
+                                   cache_size=self.disk_cache.max_bytes if self.disk_cache else 0,
+                                   profile=self.profiler is not None,
+                                   trace=False,
+                                   cprofile=False,
+                                   incremental=False)
+
+    def _clip_make_frame(self):
+        """
+        helper function to select the make_frame function to use in the moviepy clip
+        :return: a function that is suitable as make_frame function in moviepy
+        """
+        if self.options.jobs > 1:
+            return self._build_parallel_make_frame(self.output_fps())
+        return self.frame_maker
+
+    def _make_clip(self):
+        """
+        helper function to create the moviepy VideoClip; for output formats with an alpha channel,
+        the alpha channel of the rendered frames becomes the mask of the clip
+        :return: a moviepy.video.VideoClip.VideoClip
+        """
+        make_frame = self._clip_make_frame()
+        if not self.has_alpha():
+            return moviepy.video.VideoClip.VideoClip(make_frame=make_frame, duration=self.duration())
+
+        last_frame = {}
+
+        def make_rgba_frame(t):
+            # moviepy asks for the color and the mask of a frame separately, so remember the last frame
+            if last_frame.get('t') != t:
+                last_frame['t'] = t
+                last_frame['frame'] = make_frame(t)
+            return last_frame['frame']
+
+        txt_clip = moviepy.video.VideoClip.VideoClip(make_frame=lambda t: make_rgba_frame(t)[:, :, :3],
+                                                     duration=self.duration())
+        mask = moviepy.video.VideoClip.VideoClip(make_frame=lambda t: make_rgba_frame(t)[:, :, 3] / 255.0,
+                                                 ismask=True, duration=self.duration())
+        return txt_clip.set_mask(mask)
+
     def make_txt_clip(self, path_to_input_file):
         """
         function to generate a moviepy VideoClip with animated text from a .toml spec
@@ -1263,8 +1590,7 @@ class CaptionGenerator(object):
         if not success:
             print("Fatal error. Giving up.")
             return None
-        txt_clip = moviepy.video.VideoClip.VideoClip(make_frame=self.frame_maker, duration=self.duration())
-        return txt_clip
+        return self._make_clip()
 
     def make_txt_clip_from_string(self, input):
         """
@@ -1276,8 +1602,150 @@ class CaptionGenerator(object):
         if not success:
             print("Fatal error. Giving up.")
             return None
-        txt_clip = moviepy.video.VideoClip.VideoClip(make_frame=self.frame_maker, duration=self.duration())
-        return txt_clip
+        return self._make_clip()
+
+    def write_svg_frame(self, t, filename):
+        """
+        function to resolve the svg document of a single frame (after initialization) and write it to a file
+        :param t: time in seconds
+        :param filename: full path of the file; if it ends in .svgz, the svg is gzip-compressed
+        """
+        current_frame = self._frame_position(t, self.output_fps())
+        frame_index = int(round(current_frame))
+        values = self._resolve_placeholder_values(current_frame)
+        with self._stage("render svg", frame_index):
+            svg = self.svg_plan.render(values)
+        with self._stage("write svg", frame_index):
+            if filename.endswith(".svgz"):
+                with open(filename, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as compressed:
+                    compressed.write(svg.encode("utf-8"))
+            else:
+                with open(filename, "w", encoding="utf-8") as f:
+                    f.write(svg)
+
+    def _write_svg_sequence(self, filename_base):
+        """
+        helper function to write the svg document of every frame (<filename_base>_00000000.svg, ...), without
+        rasterizing or encoding anything, and an index (<filename_base>.index.json) that lists the frames with their
+        time stamps; with a frame stride, only every frame_stride-th frame is written and the index refers to it for
+        the frames in between
+        :param filename_base: output file without extension
+        :return: True if ok; False if nok
+        """
+        fps = self.output_fps()
+        W, H = self.frame_size()
+        nr_of_frames = int(math.ceil(self.duration() * fps))
+        stride = self.options.frame_stride
+        extension = "svgz" if self.options.svgz else "svg"
+        rendered = list(range(0, nr_of_frames, stride))
+        times = [index / fps for index in rendered]
+        filenames = [f"{filename_base}_{index:08}.{extension}" for index in rendered]
+        if self.options.jobs > 1:
+            self._start_parallel_renderer()
+            written = self.parallel_renderer.write_svg_frames(times, filenames)
+        else:
+            written = (self.write_svg_frame(t, filename) for t, filename in zip(times, filenames))
+        logger = proglog.default_bar_logger('bar')
+        logger(message=f"Writing {len(rendered)} svg frames of {filename_base}_%08d.{extension}")
+        for _ in zip(logger.iter_bar(frame_index=rendered), written):
+            pass
+        background = self.spec['Global'].get('background')
+        name = os.path.basename(filename_base)
+        index = {'fps': fps,
+                 'duration': self.duration(),
+                 'width': W,
+                 'height': H,
+                 'background': self._replace_globals(str(background)) if background is not None else None,
+                 'frames': [{'index': index, 'time': index / fps,
+                             'file': f"{name}_{index // stride * stride:08}.{extension}"}
+                            for index in range(nr_of_frames)]}
+        with open(f"{filename_base}.index.json", "w") as f:
+            json.dump(index, f, indent=1)
+        return True
+
+    def _write_png_sequence(self, filename_base, changed_frames):
+        """
+        helper function to (re)write the frames of a png sequence that changed since the previous render;
+        the png files of the other frames are kept
+        :param filename_base: output file without extension (frames are written to <filename_base>_00000000.png, ...)
+        :param changed_frames: indices of the frames that changed
+        :return: True if ok; False if nok
+        """
+        fps = self.output_fps()
+        nr_of_frames = int(math.ceil(self.duration() * fps))
+        indices = sorted(set(changed_frames) |
+                         {index for index in range(nr_of_frames) if not os.path.exists(f"{filename_base}_{index:08}.png")})
+        times = [index / fps for index in indices]
+        if self.options.jobs > 1 and indices:
+            self._start_parallel_renderer()
+            frames = (frame for _, frame in self.parallel_renderer.iter_frames(times))
+        else:
+            frames = (self.frame_maker(t) for t in times)
+        logger = proglog.default_bar_logger('bar')
+        logger(message=f"Writing {len(indices)} of {nr_of_frames} frames of {filename_base}_%08d.png")
+        for index, frame in zip(logger.iter_bar(frame_index=indices), frames):
+            with self._stage("encode", index):
+                PIL.Image.fromarray(frame, "RGBA" if frame.shape[2] == 4 else "RGB").save(f"{filename_base}_{index:08}.png")
+        index = nr_of_frames
+        while os.path.exists(f"{filename_base}_{index:08}.png"):  # frames of a previous, longer render
+            os.remove(f"{filename_base}_{index:08}.png")
+            index += 1
+        return True
+
+    def _write_gif(self, filename, nr_of_samples=16):
+        """
+        helper function to render all frames into an animated gif with a single palette computed from sample frames
+        :param filename: full path of the gif file
+        :param nr_of_samples: number of evenly spread frames from which the palette is computed
+        :return: True if ok; False if nok
+        """
+        fps = self.output_fps()
+        W, H = self.frame_size()
+        nr_of_frames = int(math.ceil(self.duration() * fps))
+        sample_indices = sorted(set(np.linspace(0, max(0, nr_of_frames - 1), nr_of_samples).round().astype(int)))
+        samples = [self.frame_maker(index / fps) for index in sample_indices]
+        with self._stage("build palette"):
+            palette = build_palette(samples, self.options.gif_colors)
+        frames = self._iter_frames(fps)
+        writer = GifWriter(filename, W, H, fps, palette, dither=self.options.gif_dither)
+        logger = proglog.default_bar_logger('bar')
+        logger(message=f"Writing gif {filename}")
+        try:
+            for index, frame in zip(logger.iter_bar(frame_index=range(nr_of_frames)), frames):
+                with self._stage("encode", index):
+                    writer.write_frame(frame)
+        finally:
+            with self._stage("finish encoding"):
+                writer.close()
+        return True
+
+    def _write_streamed_videofile(self, filename, container):
+        """
+        helper function to render all frames and stream them straight into ffmpeg (without moviepy clips)
+        :param filename: full path of the video file
+        :param container: one of the formats in encoder.FORMAT_SETTINGS (mp4, webm, mov)
+        :return: True if ok; False if nok
+        """
+        fps = self.output_fps()
+        W, H = self.frame_size()
+        settings = encoder_settings(container, self.options.encoder_options)
+        frames = self._iter_frames(fps)  # start the workers before ffmpeg, so they don't inherit its stdin pipe
+        encoder = FFmpegEncoder(filename, W, H, fps, alpha=self.has_alpha(), **settings)
+        nr_of_frames = int(math.ceil(self.duration() * fps))
+        logger = proglog.default_bar_logger('bar')
+        logger(message=f"Writing video {filename}")
+        success = True
+        try:
+            for index, frame in zip(logger.iter_bar(frame_index=range(nr_of_frames)), frames):
+                with self._stage("encode", index):
+                    written = encoder.write_frame(frame)
+                if not written:
+                    success = False
+                    break
+        finally:
+            with self._stage("finish encoding"):
+                success = encoder.close() and success
+        return success
 
     def write_videofile(self, input):
         """
@@ -1285,33 +1753,130 @@ class CaptionGenerator(object):
         :param input: full path to .toml spec
         :return: True if ok; False if nok
         """
-        txt_clip = self.make_txt_clip(input)
-        if not txt_clip:
+        output_base = self.output_file
+        if self.profiler is None:
+            return self._write_videofile(input, output_base)
+        with self.profiler.start(trace_file=f"{output_base}.trace.json" if self.options.trace else None,
+                                 use_cprofile=self.options.cprofile):
+            try:
+                return self._write_videofile(input, output_base)
+            finally:
+                self._finish_profile(output_base)
+
+    def _finish_profile(self, output_base):
+        """
+        helper function to stop the profiler, print a summary and save the report next to the output
+        :param output_base: output file without extension
+        """
+        self.profiler.stop()
+        self.last_profile_report = self.profiler.report()
+        print(profile_table(self.last_profile_report))
+        with open(f"{output_base}.profile.json", "w") as f:
+            json.dump(self.last_profile_report, f, indent=2)
+        if self.options.cprofile:
+            print(self.last_profile_report['cprofile'])
+            self.profiler.dump_cprofile(f"{output_base}.prof")
+
+    def _prepare_incremental_render(self, output_base):
+        """
+        helper function to compare the frames of the clip with those of the previous render to the same output
+        :param output_base: output file without extension
+        :return: tuple (manifest of this render, indices of the frames that changed)
+        """
+        manifest = self._frame_manifest()
+        changed = manifest.changed_frames(FrameManifest.load(f"{output_base}.manifest.json"))
+        if len(changed) < len(manifest.keys):
+            description = frame_ranges(changed) if changed else "none"
+            print(f"Incremental render: {len(changed)} of {len(manifest.keys)} frames changed ({description}).")
+        return manifest, changed
+
+    def _write_videofile(self, input, output_base):
+        """
+        helper function that does the actual work of write_videofile
+        :param input: full path to .toml spec
+        :param output_base: output file without extension
+        :return: True if ok; False if nok
+        """
+        if not self.initialize_from_file(input):
+            print("Fatal error. Giving up.")
             return False
 
         vf = self.video_format()
-        if vf in ['gif', 'mp4', 'svg']:
-            video = CompositeVideoClip([txt_clip])
-            if vf == 'gif':
+        success = True
+        manifest = None
+        if self.options.incremental and vf != 'png':
+            print(f"Warning: --incremental only applies to png sequences, {vf} output is rendered completely "
+                  f"(use --cache-dir to reuse the frames that were rasterized before).")
+        try:
+            if self.options.incremental and vf == 'png':
+                with self._stage("compare frames"):
+                    manifest, changed_frames = self._prepare_incremental_render(output_base)
+            if vf in FORMAT_SETTINGS:
+                if not self.output_file.endswith(f".{vf}"):
+                    self.output_file += f".{vf}"
+                success = self._write_streamed_videofile(self.output_file, vf)
+            elif vf == 'svg':
+                success = self._write_svg_sequence(self.output_file)
+            elif vf == 'gif':
                 if not self.output_file.endswith(".gif"):
                     self.output_file += ".gif"
-                video.write_gif(self.output_file, fps=self.fps())
-            elif vf == 'mp4' or vf == "svg":  # if we don't write a video file/gif the system stops after a single frame
-                if not self.output_file.endswith(".mp4"):
-                    self.output_file += ".mp4"
-                video.write_videofile(self.output_file, fps=self.fps())
-        return True
+                success = self._write_gif(self.output_file)
+            elif vf == 'png' and self.options.incremental:
+                success = self._write_png_sequence(self.output_file, changed_frames)
+            elif vf == 'png':
+                video = CompositeVideoClip([self._make_clip()])  # no background color: the mask of the clip is kept
+                video.write_images_sequence(f"{self.output_file}_%08d.png", fps=self.output_fps(), withmask=True)
+            else:
+                print(f"Error! Unsupported format {vf}. Supported formats are gif, mp4, svg, png, webm and mov.")
+                return False
+            if success and manifest is not None:  # remember the frames of this render for the next one
+                manifest.save(f"{output_base}.manifest.json")
+        finally:
+            statistics = self.cache_statistics()
+            if self.parallel_renderer is not None:
+                for key, value in self.parallel_renderer.cache_statistics.items():
+                    statistics[key] += value
+                self.parallel_renderer.close()
+                self.parallel_renderer = None
+            if self.rasterizer is not None:
+                self.rasterizer.close()
+            self.last_cache_statistics = statistics
+            print(cache_report(statistics))
+        return success
 
 
 if __name__ == "__main__":
-    filenames = ['simple', 'simple-colorchange', 'simple-animatedstyle', 'simple-animatedstyle2',
-                 'sequential-style-animation', 'position-animation', 'position-sumanimation',
-                 'complex', 'textprovider', 'howtomakeapianosing', 'thisvideomaycontaintracesofmath', 'introducing',
-                 'textfilter', 'textfilters2', 'textpath',
-                 'gradient']
-    for index, filename in enumerate(filenames):
-        output_file = str(Path(__file__).absolute().parent.joinpath(f"../examples/gettingstarted/outputs/{filename}"))
-        print(f"[{index+1}/{len(filenames)}] Processing {output_file}.")
-        c = CaptionGenerator(output_file)
-        input_file = str(Path(__file__).absolute().parent.joinpath(f"../examples/gettingstarted/{filename}.toml"))
+    parser = argparse.ArgumentParser(description="Generate animated captions from .toml specifications. "
+                                                 "Without arguments, all examples from the documentation are regenerated.")
+    parser.add_argument("specs", nargs="*", help="paths to .toml specifications")
+    parser.add_argument("-o", "--output-folder", help="folder for the results (default: next to each specification)")
+    parser.add_argument("-j", "--jobs", type=positive_int, default=1, help="number of worker processes used to render frames")
+    add_render_arguments(parser)
+    args = parser.parse_args()
+    options = render_options_from_arguments(parser, args)
+    options.jobs = args.jobs
+
+    if args.clear_cache:
+        DiskFrameCache(args.cache_dir).clear()
+
+    jobs_to_run = []
+    if args.specs:
+        for spec in args.specs:
+            output_folder = Path(args.output_folder) if args.output_folder else Path(spec).absolute().parent
+            output_name = Path(spec).stem + ("-draft" if args.draft else "")
+            jobs_to_run.append((str(Path(spec).absolute()), str(output_folder.joinpath(output_name))))
+    else:
+        filenames = ['simple', 'simple-colorchange', 'simple-animatedstyle', 'simple-animatedstyle2',
+                     'sequential-style-animation', 'position-animation', 'position-sumanimation',
+                     'complex', 'textprovider', 'howtomakeapianosing', 'thisvideomaycontaintracesofmath', 'introducing',
+                     'textfilter', 'textfilters2', 'textpath',
+                     'gradient']
+        for filename in filenames:
+            input_file = str(Path(__file__).absolute().parent.joinpath(f"../examples/gettingstarted/{filename}.toml"))
+            output_file = str(Path(__file__).absolute().parent.joinpath(f"../examples/gettingstarted/outputs/{filename}"))
+            jobs_to_run.append((input_file, output_file))
+
+    for index, (input_file, output_file) in enumerate(jobs_to_run):
+        print(f"[{index+1}/{len(jobs_to_run)}] Processing {output_file}.")
+        c = CaptionGenerator(output_file, options)
         c.write_videofile(input=input_file)
@@ -0,0 +1,84 @@
+import argparse
+import contextlib
+import io
+import sys
+import numpy as np
+from pathlib import Path
+from captiongenerator import CaptionGenerator
+from renderoptions import RenderOptions
+from rasterizer import make_rasterizer, available_backends
+
+
+def compare_frames(reference, candidate, tolerance):
+    """
+    :param reference: frame rendered by the reference rasterizer (numpy array)
+    :param candidate: frame rendered by the rasterizer under test (numpy array of the same shape)
+    :param tolerance: maximum difference per color channel for a pixel to count as equal
+    :return: tuple (percentage of pixels that differ more than tolerance, mean absolute difference)
+    """
+    difference = np.abs(reference.astype(np.int16) - candidate.astype(np.int16))
+    mismatching = (difference.max(axis=2) > tolerance).mean() * 100
+    return mismatching, difference.mean()
+
+
+def check_spec(spec_file, reference, candidate, nr_of_frames, scale, tolerance):
+    """
+    renders a few frames of a specification with two rasterizers and compares them
+    :param spec_file: path to a .toml specification
+    :param reference: reference Rasterizer (inkscape)
+    :param candidate: Rasterizer under test
+    :param nr_of_frames: number of evenly spread frames to compare
+    :param scale: scale factor for the size of the compared frames
+    :param tolerance: maximum difference per color channel for a pixel to count as equal
+    :return: list of (time, percentage of mismatching pixels, mean absolute difference), or None if the
+             specification could not be loaded
+    """
+    c = CaptionGenerator("", RenderOptions(scale=scale))
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not c.initialize_from_file(str(spec_file)):
+            return None
+    W, H = c.frame_size()
+    background = c._replace_globals('${Global.background}')
+    results = []
+    for t in np.linspace(0, c.duration(), nr_of_frames, endpoint=False):
+        svg = c.make_svg(t)
+        mismatching, mean_difference = compare_frames(reference.rasterize(svg, W, H, background),
+                                                      candidate.rasterize(svg, W, H, background), tolerance)
+        results.append((t, mismatching, mean_difference))
+    return results
+
+
+if __name__ == "__main__":
+    examples = Path(__file__).absolute().parent.joinpath("../examples/gettingstarted")
+    parser = argparse.ArgumentParser(description="Compare the output of a rasterizer backend with inkscape for every "
+                                                 "example (or for the given specifications).")
+    parser.add_argument("specs", nargs="*", help="paths to .toml specifications (default: all examples)")
+    parser.add_argument("--inkscape", default=CaptionGenerator("").inkscape, help="path to the inkscape executable")
+    parser.add_argument("--backend", default="cairosvg", help="rasterizer backend to compare with inkscape")
+    parser.add_argument("--frames", type=int, default=3, help="number of frames to compare per specification")
+    parser.add_argument("--scale", type=float, default=0.5, help="scale factor for the size of the compared frames")
+    parser.add_argument("--tolerance", type=int, default=32,
+                        help="maximum difference per color channel (0-255) for a pixel to count as equal")
+    parser.add_argument("--max-mismatch", type=float, default=2.0,
+                        help="maximum percentage of differing pixels for a frame to pass")
+    args = parser.parse_args()
+    if args.backend not in available_backends():
+        parser.error(f"the {args.backend} rasterizer is not available (pip install {args.backend})")
+
+    specs = [Path(spec) for spec in args.specs] if args.specs else sorted(examples.glob("*.toml"))
+    failures = 0
+    with make_rasterizer(args.inkscape) as reference, make_rasterizer(args.inkscape, backend=args.backend) as candidate:
+        for spec in specs:
+            results = check_spec(spec, reference, candidate, args.frames, args.scale, args.tolerance)
+            if results is None:
+                print(f"{spec.name:40} ERROR  specification could not be loaded")
+                failures += 1
+                continue
+            worst = max(mismatching for _, mismatching, _ in results)
+            status = "ok" if worst <= args.max_mismatch else "FAIL"
+            failures += status != "ok"
+            details = ", ".join(f"t={t:.2f}s: {mismatching:.2f}% ({mean_difference:.1f})"
+                                for t, mismatching, mean_difference in results)
+            print(f"{spec.name:40} {status:6} {details}")
+    print(f"{len(specs) - failures} of {len(specs)} specifications within tolerance.")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,142 @@
+import queue
+import subprocess
+import tempfile
+import threading
+import numpy as np
+from moviepy.config import get_setting
+
+# default encoder settings per output format; crf and preset are left out for codecs that don't use them
+FORMAT_SETTINGS = {
+    'mp4': {'codec': 'libx264', 'crf': 23, 'preset': 'medium', 'pix_fmt': 'yuv420p', 'extra_params': []},
+    'webm': {'codec': 'libvpx-vp9', 'crf': 30, 'preset': None, 'pix_fmt': 'yuva420p',
+             'extra_params': ['-b:v', '0', '-auto-alt-ref', '0']},
+    'mov': {'codec': 'prores_ks', 'crf': None, 'preset': None, 'pix_fmt': 'yuva444p10le',
+            'extra_params': ['-profile:v', '4444']},
+}
+
+
+def encoder_settings(video_format, overrides=None):
+    """
+    :param video_format: one of the keys of FORMAT_SETTINGS
+    :param overrides: optional dictionary with settings (codec, crf, preset, pix_fmt) that replace the defaults;
+                      None values are ignored
+    :return: dictionary with the encoder settings for the given format
+    """
+    settings = dict(FORMAT_SETTINGS[video_format])
+    for key, value in (overrides or {}).items():
+        if value is not None:
+            settings[key] = value
+    return settings
+
+
+class FFmpegEncoder(object):
+    """
+    Streams raw frames into a single ffmpeg process. Frames are handed over through a bounded queue to a writer
+    thread, so that rendering the next frames overlaps with encoding the previous ones, while memory use
+    stays bounded. Metadata that changes between runs (encoder version, creation time) is left out,
+    so the same frames and settings always result in the same file.
+    """
+    def __init__(self, filename, width, height, fps, codec='libx264', crf=None, preset=None, pix_fmt='yuv420p',
+                 extra_params=None, alpha=False, queue_size=8):
+        """
+        :param filename: full path of the video file to write
+        :param width: width of the frames in pixels
+        :param height: height of the frames in pixels
+        :param fps: frames per second
+        :param codec: ffmpeg video codec (e.g. libx264, libvpx-vp9, prores_ks)
+        :param crf: constant rate factor (quality) or None to use the codec's default
+        :param preset: encoder preset (e.g. medium, slow) or None to use the codec's default
+        :param pix_fmt: pixel format of the encoded video (e.g. yuv420p)
+        :param extra_params: list of extra ffmpeg output parameters
+        :param alpha: True if the frames are RGBA, False if they are RGB
+        :param queue_size: maximum number of frames waiting to be encoded
+        """
+        self.filename = filename
+        self.frame_shape = (height, width, 4 if alpha else 3)
+        command = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-vcodec', 'rawvideo',
+                   '-s', f'{width}x{height}', '-pix_fmt', 'rgba' if alpha else 'rgb24',
+                   '-r', f'{fps}', '-i', '-', '-an',
+                   '-vcodec', codec, '-pix_fmt', pix_fmt]
+        if crf is not None:
+            command.extend(['-crf', str(crf)])
+        if preset is not None:
+            command.extend(['-preset', preset])
+        if pix_fmt.startswith(('yuv420', 'yuva420', 'yuv422', 'yuva422')) and (width % 2 or height % 2):
+            command.extend(['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2'])  # chroma subsampling needs even sizes
+        command.extend(extra_params or [])
+        command.extend(['-map_metadata', '-1', '-fflags', '+bitexact', '-flags:v', '+bitexact', filename])
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                        stderr=self.stderr)
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.writer = threading.Thread(target=self._write_frames, daemon=True)
+        self.writer.start()
+
+    def _write_frames(self):
+        """
+        helper function that runs in the writer thread: passes the queued frames to ffmpeg
+        """
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue  # keep emptying the queue so write_frame never blocks forever
+            try:
+                self.process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+            except Exception as e:  # e.g. ffmpeg exited early (broken pipe)
+                self.error = e
+
+    def _put(self, item):
+        """
+        helper function to queue an item for the writer thread, without blocking forever if the thread has stopped
+        :return: True if the item was queued; False if the writer thread is no longer running
+        """
+        while self.writer.is_alive():
+            try:
+                self.frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def write_frame(self, frame):
+        """
+        queues a frame for encoding; blocks while the queue is full, but fails fast once ffmpeg or the writer
+        thread has stopped
+        :param frame: numpy array of shape (height, width, 3) or (height, width, 4)
+        :return: True if ok; False if nok
+        """
+        if self.error is None and self.process.poll() is not None:
+            self.error = OSError(f"ffmpeg exited with code {self.process.returncode} before all frames were written")
+        if self.error is not None:
+            return False
+        if frame.shape != self.frame_shape:
+            print(f"Error! Frame of shape {frame.shape} can't be encoded in a video of shape {self.frame_shape}.")
+            return False
+        if not self._put(frame):
+            self.error = RuntimeError("the thread that writes frames to ffmpeg stopped")
+            return False
+        return True
+
+    def close(self):
+        """
+        waits until all queued frames are encoded and ffmpeg has finished writing the file
+        :return: True if ok; False if nok
+        """
+        if self._put(None):
+            self.writer.join()
+        try:
+            self.process.stdin.close()
+        except OSError as e:
+            self.error = self.error or e
+        returncode = self.process.wait()
+        self.stderr.seek(0)
+        messages = self.stderr.read().decode(errors="replace").strip()
+        self.stderr.close()
+        if returncode != 0 or self.error is not None:
+            print(f"Error! ffmpeg failed to write {self.filename}.\n{messages or self.error}")
+            return False
+        return True
@@ -0,0 +1,146 @@
+import ast
+import copy
+import math
+import operator
+import re
+
+
+class ExpressionError(ValueError):
+    """
+    Raised when a value in the .toml specification is not a valid expression; the message names the offending
+    entry of the specification (e.g. Animations.Position.slide.begin).
+    """
+    pass
+
+
+class NotAFormula(Exception):
+    """
+    Raised while folding an expression that contains something other than numbers, lists, operators, ${Global.xxx}
+    references and the supported functions; such values are not formulas and are used as they are.
+    """
+    pass
+
+
+def clamp(value, lowest, highest):
+    """
+    :param value: a number
+    :param lowest: smallest allowed result
+    :param highest: largest allowed result
+    :return: value, limited to the range [lowest, highest]
+    """
+    return max(lowest, min(highest, value))
+
+
+class ExpressionEvaluator(object):
+    """
+    Evaluates the numerical expressions in a .toml specification: numbers, lists of numbers and simple formulas
+    with the operators + - * / // % ** and a small set of math functions, e.g. "[0.5*${Global.W}, clamp(3, 0, 2)]".
+    References ${Global.xxx} are bound to the (evaluated) value of xxx in the [Global] section, and since
+    expressions have no other free variables, every expression is folded into a constant. The result of every
+    distinct expression string is cached, so repeated lookups (e.g. of ${Global.duration}) cost a dictionary lookup.
+    Strings that are not formulas (e.g. "red" or "hello world") are returned unchanged, so that the caller can report
+    a value of the wrong type; formulas that can't be evaluated (a reference to an undefined or circular global, a
+    division by zero, ...) raise ExpressionError.
+    """
+    FUNCTIONS = {'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'sqrt': math.sqrt, 'abs': abs,
+                 'min': min, 'max': max, 'clamp': clamp}
+    CONSTANTS = {'pi': math.pi}
+    BINARY_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+                        ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+                        ast.Pow: operator.pow}
+    UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+    GLOBAL_REFERENCE = re.compile(r"\$\{Global\.([^}]+)\}")
+
+    def __init__(self, global_section):
+        """
+        :param global_section: dictionary with the [Global] section of the .toml specification
+        """
+        self.global_section = global_section
+        self.cache = {}
+        self.busy = set()  # globals that are being evaluated (to detect circular references)
+
+    def global_value(self, key):
+        """
+        :param key: name of an entry in the [Global] section
+        :return: the evaluated value of that entry
+        """
+        if key not in self.global_section:
+            raise ExpressionError(f"Global.{key} is referenced, but not defined in the [Global] section.")
+        if key in self.busy:
+            raise ExpressionError(f"Invalid expression in Global.{key}: Global.{key} refers to itself.")
+        self.busy.add(key)
+        try:
+            return self.evaluate(self.global_section[key], f"Global.{key}")
+        finally:
+            self.busy.discard(key)
+
+    def evaluate(self, expr, path):
+        """
+        :param expr: a string containing something numerical (values that are not strings are returned unchanged)
+        :param path: location of expr in the .toml specification (used in error messages)
+        :return: the numerical result (a number or a list), or expr itself if it is not a formula
+        """
+        if not isinstance(expr, str):
+            return expr
+        try:
+            value = self.cache[expr]
+        except KeyError:
+            value = self.cache[expr] = self._compile(expr, path)
+        return copy.deepcopy(value) if isinstance(value, list) else value
+
+    def _compile(self, expr, path):
+        """
+        helper function to bind the global references in expr and fold it into a constant
+        :return: the value of expr, or expr itself if it is not a formula
+        """
+        names = {}
+
+        def bind(match):
+            name = f"_global_{len(names)}"
+            names[name] = match.group(1)
+            return name
+
+        source = self.GLOBAL_REFERENCE.sub(bind, expr.strip())
+        try:
+            tree = ast.parse(source, mode='eval')
+        except SyntaxError:
+            return expr  # not a python expression
+        bound = {}
+        for name, key in names.items():
+            bound[name] = self.global_value(key)
+            if isinstance(bound[name], str):
+                raise ExpressionError(f"Invalid expression in {path}: Global.{key} = '{bound[name]}' is not a number.")
+        try:
+            return self._fold(tree.body, bound)
+        except NotAFormula:
+            return expr  # e.g. a name or a string, not a mathematical expression
+        except (ArithmeticError, TypeError, ValueError) as e:
+            raise ExpressionError(f"Invalid expression in {path}: evaluating '{expr}' failed ({e}).")
+
+    def _fold(self, node, bound):
+        """
+        helper function to evaluate a node of the syntax tree of an expression
+        :param node: ast node
+        :param bound: dictionary with the values of the names that refer to globals
+        :return: the value of the node
+        """
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+                and not isinstance(node.value, bool):
+            return node.value
+        if isinstance(node, ast.List):
+            return [self._fold(element, bound) for element in node.elts]
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.UNARY_OPERATORS:
+            return self.UNARY_OPERATORS[type(node.op)](self._fold(node.operand, bound))
+        if isinstance(node, ast.BinOp) and type(node.op) in self.BINARY_OPERATORS:
+            return self.BINARY_OPERATORS[type(node.op)](self._fold(node.left, bound), self._fold(node.right, bound))
+        if isinstance(node, ast.Name):
+            if node.id in bound:
+                return bound[node.id]
+            if node.id in self.CONSTANTS:
+                return self.CONSTANTS[node.id]
+            raise NotAFormula(f"unknown name '{node.id}'.")
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            if node.func.id not in self.FUNCTIONS:
+                raise NotAFormula(f"unknown function '{node.func.id}'.")
+            return self.FUNCTIONS[node.func.id](*[self._fold(argument, bound) for argument in node.args])
+        raise NotAFormula(f"'{ast.unparse(node)}' is not allowed.")
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import shutil
+import numpy as np
+from collections import OrderedDict
+
+
+class FrameCache(object):
+    """
+    In-memory, content-addressed cache of rasterized frames. Frames are keyed on a hash of the fully resolved svg
+    and the export options, so frames that look identical (e.g. static captions) are only rasterized once.
+    The least recently used frames are evicted when the cache grows beyond max_bytes.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        :param max_bytes: maximum total size (in bytes) of the frames kept in the cache
+        """
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(svg, width, height, background):
+        """
+        :param svg: fully resolved svg string
+        :param width: width of the rasterized frame
+        :param height: height of the rasterized frame
+        :param background: background color of the rasterized frame
+        :return: a string that identifies the rasterized frame
+        """
+        h = hashlib.sha1(svg.encode())
+        h.update(f"\0{width}\0{height}\0{background}".encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        :param key: key as returned by FrameCache.key
+        :return: the cached frame, or None if the frame is not in the cache
+        """
+        frame = self.frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.frames.move_to_end(key)
+        return frame
+
+    def put(self, key, frame):
+        """
+        :param key: key as returned by FrameCache.key
+        :param frame: rasterized frame (numpy array); a read-only frame is a view on a buffer that the rasterizer
+                      reuses for the next frame, so the cache keeps a copy of it
+        :return: the frame as it is kept (a copy if frame was read-only), so it stays valid for the caller too
+        """
+        if isinstance(frame, np.ndarray) and not frame.flags.writeable:
+            frame = frame.copy()
+        if key in self.frames or frame.nbytes > self.max_bytes:
+            return frame
+        self.frames[key] = frame
+        self.size += frame.nbytes
+        while self.size > self.max_bytes:
+            _, evicted = self.frames.popitem(last=False)
+            self.size -= evicted.nbytes
+        return frame
+
+    def clear(self):
+        """
+        removes all frames from the cache (the hit/miss counters are kept)
+        """
+        self.frames.clear()
+        self.size = 0
+
+
+class DiskFrameCache(object):
+    """
+    Persistent, content-addressed cache of rasterized frames in a directory, shared between runs (and between
+    worker processes). Frames are keyed on the resolved svg, the export options and the rasterizer version,
+    so after editing a spec only the frames that actually changed need to be rasterized again.
+    When the directory grows beyond max_bytes, the least recently used frames are removed.
+    """
+    SUFFIX = ".npy"
+
+    def __init__(self, directory, max_bytes=2 * 1024 * 1024 * 1024):
+        """
+        :param directory: directory in which the frames are stored (created if needed)
+        :param max_bytes: maximum total size (in bytes) of the cache directory
+        """
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def key(frame_key, rasterizer_version, layer_mode):
+        """
+        :param frame_key: key as returned by FrameCache.key (covers the svg and the export options)
+        :param rasterizer_version: string identifying the rasterizer that produces the frames
+        :param layer_mode: string identifying how frames are made from their layers (whole frames, static layers
+                           or per line); the modes don't necessarily produce exactly the same pixels
+        :return: a string that identifies the rasterized frame
+        """
+        return hashlib.sha1(f"{frame_key}\0{rasterizer_version}\0{layer_mode}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.SUFFIX)
+
+    def _entries(self):
+        """
+        :return: list of (path, modification time, size) of all frames in the cache directory
+        """
+        entries = []
+        for subdir in os.scandir(self.directory):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith(self.SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # removed by another process in the meantime
+                        continue
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def get(self, key):
+        """
+        :param key: key as returned by DiskFrameCache.key
+        :return: the cached frame, or None if the frame is not in the cache
+        """
+        path = self._path(key)
+        try:
+            frame = np.load(path)
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        """
+        :param key: key as returned by DiskFrameCache.key
+        :param frame: rasterized frame (numpy array)
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, frame)
+        try:
+            replaced_size = os.path.getsize(path)  # the frame was already cached (e.g. by another process)
+        except FileNotFoundError:
+            replaced_size = 0
+        os.replace(temp_path, path)  # atomic, so other processes never see half-written frames
+        self.size += os.path.getsize(path) - replaced_size
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """
+        helper function to remove the least recently used frames until the cache is well below its maximum size
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.size = sum(size for _, _, size in entries)
+        target = 0.9 * self.max_bytes
+        for path, _, size in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def clear(self):
+        """
+        removes all frames from the cache directory
+        """
+        for subdir in os.scandir(self.directory):
+            if subdir.is_dir() and len(subdir.name) == 2:
+                shutil.rmtree(subdir.path, ignore_errors=True)
+        self.size = 0
+
+
+def cache_report(statistics):
+    """
+    :param statistics: dictionary with the number of hits and misses of the in-memory cache
+                       ('hits', 'misses'), of the on-disk cache ('disk_hits', 'disk_misses') and of the cache of
+                       rasterized layers in per-line mode ('line_hits', 'line_misses')
+    :return: summary of the cache statistics
+    """
+    hits, misses = statistics['hits'], statistics['misses']
+    total = hits + misses
+    hit_rate = 100.0 * hits / total if total else 0.0
+    report = f"Frame cache: {hits} hits, {misses} misses ({hit_rate:.0f}% of {total} frames reused)."
+    disk_hits, disk_misses = statistics['disk_hits'], statistics['disk_misses']
+    if disk_hits + disk_misses:
+        report += f"\nDisk frame cache: {disk_hits} hits, {disk_misses} misses ({disk_misses} frames rasterized)."
+    line_hits, line_misses = statistics['line_hits'], statistics['line_misses']
+    if line_hits + line_misses:
+        report += f"\nLine cache: {line_hits} hits, {line_misses} misses ({line_misses} layers rasterized)."
+    return report
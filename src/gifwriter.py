@@ -0,0 +1,153 @@
+import collections
+import concurrent.futures
+import os
+import numpy as np
+import PIL.Image
+from PIL import GifImagePlugin
+
+DITHER_METHODS = ['none', 'ordered', 'floyd-steinberg']
+
+# 8x8 Bayer threshold matrix, normalized to [-0.5, 0.5)
+BAYER_MATRIX = (np.array([[0, 32, 8, 40, 2, 34, 10, 42],
+                          [48, 16, 56, 24, 50, 18, 58, 26],
+                          [12, 44, 4, 36, 14, 46, 6, 38],
+                          [60, 28, 52, 20, 62, 30, 54, 22],
+                          [3, 35, 11, 43, 1, 33, 9, 41],
+                          [51, 19, 59, 27, 49, 17, 57, 25],
+                          [15, 47, 7, 39, 13, 45, 5, 37],
+                          [63, 31, 55, 23, 61, 29, 53, 21]]) + 0.5) / 64.0 - 0.5
+
+
+def build_palette(frames, colors=256, max_pixels=1024 * 1024):
+    """
+    computes one palette for a complete animation from a few sample frames, so that all frames are quantized
+    consistently (no flickering colors) and the palette only has to be stored once
+    :param frames: list of sample frames (numpy arrays of shape (height, width, 3))
+    :param colors: maximum number of colors in the palette (at most 256)
+    :param max_pixels: the sample frames are subsampled to at most this many pixels in total
+    :return: a PIL image in mode "P" that carries the palette
+    """
+    pixels_per_frame = frames[0].shape[0] * frames[0].shape[1]
+    step = max(1, int(np.ceil(np.sqrt(pixels_per_frame * len(frames) / max_pixels))))
+    samples = np.concatenate([frame[::step, ::step, :3] for frame in frames], axis=0)
+    palette = PIL.Image.fromarray(np.ascontiguousarray(samples), "RGB").quantize(colors=colors,
+                                                                              method=PIL.Image.Quantize.MEDIANCUT)
+    # PIL pads the palette with black up to 256 colors; quantizing against it would also use the padding
+    palette.putpalette(palette.palette.palette[:3 * colors], "RGB")
+    return palette
+
+
+def quantize(frame, palette, dither='none'):
+    """
+    maps a frame onto the colors of a palette
+    :param frame: numpy array of shape (height, width, 3)
+    :param palette: PIL image in mode "P" as returned by build_palette
+    :param dither: one of DITHER_METHODS
+    :return: numpy array of shape (height, width) with palette indices
+    """
+    if dither == 'ordered':
+        height, width = frame.shape[:2]
+        spread = 255.0 / (len(palette.getpalette()) // 3) ** (1 / 3)  # typical distance between palette colors
+        threshold = np.tile(BAYER_MATRIX, (height // 8 + 1, width // 8 + 1))[:height, :width, np.newaxis]
+        frame = np.clip(frame[:, :, :3] + threshold * spread, 0, 255).astype(np.uint8)
+    image = PIL.Image.fromarray(np.ascontiguousarray(frame[:, :, :3]), "RGB")
+    pil_dither = PIL.Image.Dither.FLOYDSTEINBERG if dither == 'floyd-steinberg' else PIL.Image.Dither.NONE
+    return np.asarray(image.quantize(palette=palette, dither=pil_dither))
+
+
+class GifWriter(object):
+    """
+    Writes an animated gif frame by frame, so the clip never has to be kept in memory. All frames share one global
+    palette; frames are quantized on a pool of threads while earlier frames are written. Only the part of a frame
+    that differs from the previous frame is stored, and identical frames are merged into a single longer frame.
+    """
+    def __init__(self, filename, width, height, fps, palette, dither='none', loop=0, jobs=None):
+        """
+        :param filename: full path of the gif file
+        :param width: width of the frames
+        :param height: height of the frames
+        :param fps: frames per second
+        :param palette: PIL image in mode "P" as returned by build_palette
+        :param dither: one of DITHER_METHODS
+        :param loop: number of times the animation repeats (0 is forever)
+        :param jobs: number of threads used for quantizing (default: number of cpus)
+        """
+        self.fps = fps
+        self.palette = palette
+        self.palette_data = palette.getpalette()
+        self.dither = dither
+        self.jobs = jobs or os.cpu_count() or 1
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs)
+        self.in_flight = collections.deque()
+        self.frame_index = 0
+        self.previous = None  # palette indices of the last frame that was written
+        self.pending = None  # (image, offset, start frame) of the frame that waits for its duration to be known
+        self.file = open(filename, "wb")
+        header_image = PIL.Image.new("P", (width, height))
+        header_image.putpalette(self.palette_data)
+        header, _ = GifImagePlugin.getheader(header_image, info={"loop": loop})
+        for chunk in header:
+            self.file.write(chunk)
+
+    def write_frame(self, frame):
+        """
+        queues a frame for quantizing and writing; blocks while too many frames are waiting
+        :param frame: numpy array of shape (height, width, 3)
+        """
+        self.in_flight.append(self.executor.submit(quantize, frame, self.palette, self.dither))
+        if len(self.in_flight) >= 2 * self.jobs:
+            self._add(self.in_flight.popleft().result())
+
+    def _centiseconds(self, frame_index):
+        """
+        helper function to convert a frame index into a gif time stamp (without accumulating rounding errors)
+        """
+        return int(round(frame_index * 100 / self.fps))
+
+    def _add(self, indices):
+        """
+        helper function to add a quantized frame to the animation
+        :param indices: numpy array of shape (height, width) with palette indices
+        """
+        if self.previous is None:
+            changed_rows = changed_columns = np.arange(1)
+            box = (0, 0, indices.shape[1], indices.shape[0])
+        else:
+            changed = indices != self.previous
+            changed_rows = np.flatnonzero(changed.any(axis=1))
+            changed_columns = np.flatnonzero(changed.any(axis=0))
+            if len(changed_rows):
+                box = (changed_columns[0], changed_rows[0], changed_columns[-1] + 1, changed_rows[-1] + 1)
+        if len(changed_rows):  # identical frames just extend the duration of the pending frame
+            self._flush_pending()
+            left, top, right, bottom = (int(v) for v in box)
+            image = PIL.Image.fromarray(np.ascontiguousarray(indices[top:bottom, left:right]), "P")
+            image.putpalette(self.palette_data)
+            self.pending = (image, (left, top), self.frame_index)
+            self.previous = indices
+        self.frame_index += 1
+
+    def _flush_pending(self):
+        """
+        helper function to write the pending frame, now that its duration is known
+        """
+        if self.pending is None:
+            return
+        image, offset, start_frame = self.pending
+        duration = max(1, self._centiseconds(self.frame_index) - self._centiseconds(start_frame))
+        # graphic control extension: disposal method 1 (keep the frame, the next one is drawn on top), delay
+        self.file.write(b"!\xf9\x04\x04" + duration.to_bytes(2, "little") + b"\x00\x00")
+        for chunk in GifImagePlugin.getdata(image, offset):
+            self.file.write(chunk)
+        self.pending = None
+
+    def close(self):
+        """
+        writes the remaining frames and closes the file
+        """
+        while self.in_flight:
+            self._add(self.in_flight.popleft().result())
+        self._flush_pending()
+        self.file.write(b";")
+        self.file.close()
+        self.executor.shutdown()
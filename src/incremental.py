@@ -0,0 +1,67 @@
+import json
+
+
+class FrameManifest(object):
+    """
+    Remembers the key of every frame of a render (see FrameCache.key). A frame key is a hash of the fully resolved
+    svg of the frame and the export options, so it changes exactly when something the frame depends on changes:
+    the lines, animations, styles, filters and paths that are visible in it, and the svg templates.
+    Comparing the manifest of a new render with the one of the previous render tells which frames must be
+    rasterized again; the other frames can be taken from the previous render.
+    """
+    VERSION = 1
+
+    def __init__(self, keys, settings):
+        """
+        :param keys: list with the key of every frame
+        :param settings: dictionary with the render settings that are not covered by the frame keys
+                         (e.g. the rasterizer version and the fps)
+        """
+        self.keys = keys
+        self.settings = settings
+
+    @staticmethod
+    def load(filename):
+        """
+        :param filename: full path of a manifest saved with save
+        :return: the FrameManifest, or None if there is no (valid) manifest
+        """
+        try:
+            with open(filename, "r") as f:
+                contents = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if contents.get('version') != FrameManifest.VERSION:
+            return None
+        return FrameManifest(contents['frames'], contents['settings'])
+
+    def save(self, filename):
+        """
+        :param filename: full path of the manifest file
+        """
+        with open(filename, "w") as f:
+            json.dump({'version': self.VERSION, 'settings': self.settings, 'frames': self.keys}, f)
+
+    def changed_frames(self, previous):
+        """
+        :param previous: FrameManifest of the previous render, or None
+        :return: sorted list of the indices of the frames that differ from the previous render
+        """
+        if previous is None or previous.settings != self.settings:
+            return list(range(len(self.keys)))
+        return [index for index, key in enumerate(self.keys)
+                if index >= len(previous.keys) or previous.keys[index] != key]
+
+
+def frame_ranges(indices):
+    """
+    :param indices: sorted list of frame indices
+    :return: compact description of the indices, e.g. "0-9, 15, 20-24"
+    """
+    ranges = []
+    for index in indices:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ", ".join(f"{first}" if first == last else f"{first}-{last}" for first, last in ranges)
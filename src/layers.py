@@ -0,0 +1,670 @@
+import html
+import math
+import re
+import numpy as np
+import PIL.ImageColor
+from framecache import FrameCache
+from placeholders import PlaceholderPlan
+
+# doc.svgtemplate marks where the RawSvgElementsUnder, every caption line and the RawSvgElementsOver start
+LAYER_MARKER = re.compile(r"<!--camala-layer ([^>]*)-->")
+CLASS_ATTRIBUTE = re.compile(r"""\bclass=(["'])(.*?)\1""")
+ID_ATTRIBUTE = re.compile(r"""\bid=(["'])(.*?)\1""")
+STYLE_PLACEHOLDER = re.compile(r"_for_style_(.+)$")
+
+# svg features that make the pixels of an element depend on the pixels below it: layers that use them
+# can't be rasterized separately
+BACKDROP_FEATURES = ["mix-blend-mode", "backdrop-filter", "BackgroundImage", "BackgroundAlpha"]
+
+# to estimate the bounding box of a caption line, only the attributes and style properties below are understood;
+# a line that uses anything else (e.g. a textPath, a transform or letter-spacing) is rasterized uncropped
+ROOT_ELEMENT = re.compile(r"<svg\b[^>]*>")
+TEXT_ELEMENT = re.compile(r"<text\b([^>]*)>(.*)</text>", re.S)
+TSPAN_ELEMENT = re.compile(r"<tspan\b([^>]*)>(.*?)</tspan>", re.S)
+FILTER_ELEMENT = re.compile(r"<filter\b([^>]*)>")
+STYLE_ELEMENT = re.compile(r"<style\b[^>]*>(.*?)</style>", re.S)
+ATTRIBUTE = re.compile(r"""([\w:-]+)\s*=\s*(["'])(.*?)\2""", re.S)
+CSS_RULE = re.compile(r"([^{}]*)\{([^{}]*)\}")
+CSS_CLASS_SELECTOR = re.compile(r"\s*\.([\w-]+)\s*")
+FILTER_REFERENCE = re.compile(r"\s*url\(#([^)]+)\)\s*")
+LENGTH = re.compile(r"\s*([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)\s*(px|pt|%)?\s*")
+TEXT_ATTRIBUTES = {'x', 'y', 'id', 'class', 'filter', 'text-anchor', 'fill', 'fill-opacity', 'stroke', 'stroke-opacity',
+                   'stroke-width', 'opacity'}
+TSPAN_ATTRIBUTES = {'xml:space', 'class', 'fill', 'fill-opacity', 'stroke', 'stroke-opacity', 'stroke-width',
+                    'opacity'}
+STYLE_PROPERTIES = {'font-size', 'font-family', 'font-weight', 'font-style', 'font-variant', 'text-anchor', 'fill',
+                    'fill-opacity', 'stroke', 'stroke-opacity', 'stroke-width', 'stroke-linecap', 'stroke-linejoin',
+                    'stroke-dasharray', 'stroke-dashoffset', 'opacity', 'color', 'paint-order', 'visibility',
+                    'letter-spacing', 'word-spacing'}
+DEFAULT_FONT_SIZE = 16
+# generous upper bounds (in em) for the advance of a single character, and for the extent of the glyphs
+# above and below the baseline
+ASCII_ADVANCE = 1.25
+WIDE_ADVANCE = 2.0
+ASCENT = 1.6
+DESCENT = 0.8
+
+
+def strip_layer_markers(svg):
+    """
+    :param svg: svg skeleton as rendered from doc.svgtemplate
+    :return: the svg without the layer markers
+    """
+    return LAYER_MARKER.sub("", svg)
+
+
+class LayerGroup(object):
+    """
+    Consecutive layers (in z-order) that are rasterized together, because they are all static or all animated.
+    """
+    def __init__(self, names, static, svg):
+        """
+        :param names: names of the layers in the group (e.g. under, line Line1, over)
+        :param static: True if the layers look the same in every frame
+        :param svg: svg skeleton with only the layers of this group
+        """
+        self.names = names
+        self.static = static
+        self.plan = PlaceholderPlan(svg)
+        self.pixels = None  # tuple ((width, height), premultiplied pixels) of a static group, once rasterized
+
+
+def split_layers(skeleton):
+    """
+    splits the svg skeleton in its layers
+    :param skeleton: svg skeleton with layer markers, as rendered from doc.svgtemplate
+    :return: tuple (prolog, list of (layer name, layer body) in z-order, epilog), or None if the skeleton has no
+             layer markers or its layers can't be rasterized separately
+    """
+    parts = LAYER_MARKER.split(skeleton)  # [prolog, name, body, name, body, ..., 'end', epilog]
+    if len(parts) < 5 or parts[-2] != 'end' or any(feature in skeleton for feature in BACKDROP_FEATURES):
+        return None
+    layers = [(parts[index], parts[index + 1]) for index in range(1, len(parts) - 2, 2) if parts[index + 1].strip()]
+    if _has_references_between(layers):
+        return None
+    return parts[0], layers, parts[-1]
+
+
+def _has_references_between(layers):
+    """
+    helper function to check if an element in one layer refers to an element with an id in another layer
+    (e.g. <use xlink:href="#logo"/>), in which case the layers can't be rasterized separately
+    """
+    for name, body in layers:
+        for _, identifier in ID_ATTRIBUTE.findall(body):
+            if any(f"#{identifier}" in other_body for other_name, other_body in layers if other_name != name):
+                return True
+    return False
+
+
+def layer_line(name):
+    """
+    :param name: name of a layer (under, over, or line <name of the caption line>)
+    :return: name of the caption line of the layer, or None for the RawSvgElementsUnder/Over layers
+    """
+    return name[len("line "):] if name.startswith("line ") else None
+
+
+def animated_dependencies(name, body, animated_names, animated_in_prolog, lines):
+    """
+    :param name: name of the layer (under, over, or line <name of the caption line>)
+    :param body: svg elements of the layer
+    :param animated_names: names of all animated placeholders
+    :param animated_in_prolog: names of the animated placeholders in the <defs> section
+    :param lines: names of the caption lines
+    :return: set with the names of the animated placeholders that can change how the layer looks
+             (an empty set for a layer that looks the same in every frame)
+    """
+    dependencies = PlaceholderPlan(body).slot_names() & animated_names
+    classes = {cls for _, attribute in CLASS_ATTRIBUTE.findall(body) for cls in attribute.split()}
+    line = layer_line(name)
+    for placeholder in animated_in_prolog:
+        style = STYLE_PLACEHOLDER.search(placeholder)
+        if style is not None:
+            if style.group(1) in classes:
+                dependencies.add(placeholder)
+            continue
+        # filters are defined per line (their placeholders end in _<line>); other definitions may be used anywhere
+        owners = [owner for owner in lines if placeholder.endswith(f"_{owner}")]
+        if line is None or not owners or line in owners:
+            dependencies.add(placeholder)
+    return dependencies
+
+
+class LayerPlan(object):
+    """
+    Splits the svg skeleton in layers (RawSvgElementsUnder, one layer per caption line, RawSvgElementsOver) and
+    classifies every layer as static or animated. A layer is animated if its own elements, or the styles and
+    filters it uses, contain a placeholder that is bound to an animation. Static layers only need to be rasterized
+    once; a frame is then made by rasterizing the animated layers and alpha-compositing all layers in z-order.
+    If the skeleton can't be split safely (or there is nothing to gain), groups is empty and frames should be
+    rasterized as a whole.
+    """
+    def __init__(self, skeleton, animated_names, lines):
+        """
+        :param skeleton: svg skeleton with layer markers, as rendered from doc.svgtemplate
+        :param animated_names: set with the names of the placeholders whose value changes from frame to frame
+        :param lines: names of the caption lines
+        """
+        self.groups = []
+        self.leading = None  # composite of the background and the static groups below all animated groups
+        split = split_layers(skeleton)
+        if split is None:
+            return
+        prolog, layers, epilog = split
+        animated_in_prolog = PlaceholderPlan(prolog).slot_names() & animated_names
+        kinds = [not animated_dependencies(name, body, animated_names, animated_in_prolog, lines)
+                 for name, body in layers]
+        if all(kinds) or not any(kinds):
+            return  # a single group: rasterizing the frame as a whole is cheaper
+        for (name, body), static in zip(layers, kinds):
+            if self.groups and self.groups[-1][1] == static:
+                self.groups[-1][0].append((name, body))
+            else:
+                self.groups.append(([(name, body)], static))
+        self.groups = [LayerGroup([name for name, _ in members], static,
+                                  prolog + "".join(body for _, body in members) + epilog)
+                       for members, static in self.groups]
+
+    def is_layered(self):
+        """
+        :return: True if frames should be made by compositing layers
+        """
+        return bool(self.groups)
+
+    def render(self, values, rasterize, width, height, background, stage):
+        """
+        makes a frame by rasterizing the animated layer groups and compositing them with the static ones
+        :param values: dictionary of placeholder name to value for the frame
+        :param rasterize: function (svg, width, height) that turns an svg document into RGBA pixels (with a
+                          transparent background)
+        :param width: width of the frame
+        :param height: height of the frame
+        :param background: background color, or None for a transparent frame
+        :param stage: function that returns a context manager to time a stage of the rendering (for profiling)
+        :return: uint8 numpy array with the frame: RGB if there is a background color, otherwise RGBA
+        """
+        if self.leading is None or self.leading[0] != (width, height, background):
+            # the background and the static groups below the first animated group are the same in every frame
+            canvas = empty_canvas(width, height, background)
+            first = 0
+            while self.groups[first].static:
+                pixels = self._static_pixels(self.groups[first], values, rasterize, width, height)
+                with stage("composite layers"):
+                    composite_over(canvas, pixels)
+                first += 1
+            self.leading = ((width, height, background), canvas, first)
+        _, leading, first = self.leading
+        canvas = leading.copy()
+        for group in self.groups[first:]:
+            if group.static:
+                pixels = self._static_pixels(group, values, rasterize, width, height)
+                with stage("composite layers"):
+                    composite_over(canvas, pixels)
+            else:
+                layer = rasterize(group.plan.render(values), width, height)
+                with stage("composite layers"):
+                    composite_over(canvas, premultiply(layer))
+        with stage("composite layers"):
+            return canvas_to_frame(canvas, alpha=background is None)
+
+    @staticmethod
+    def _static_pixels(group, values, rasterize, width, height):
+        """
+        helper function to rasterize a static group the first time it is needed at the given frame size
+        :return: premultiplied pixels of the group
+        """
+        if group.pixels is None or group.pixels[0] != (width, height):
+            group.pixels = ((width, height), premultiply(rasterize(group.plan.render(values), width, height)))
+        return group.pixels[1]
+
+
+class LayerRaster(object):
+    """
+    The rasterized pixels of a single layer, trimmed to the part of the frame in which the layer is visible.
+    """
+    def __init__(self, x, y, pixels):
+        """
+        :param x: column of the frame at which the pixels start
+        :param y: row of the frame at which the pixels start
+        :param pixels: premultiplied float32 RGBA pixels (possibly with zero width or height)
+        """
+        self.x = x
+        self.y = y
+        self.pixels = pixels
+        self.nbytes = pixels.nbytes  # so that rasterized layers can be kept in a FrameCache
+
+
+class LineLayer(object):
+    """
+    A layer that is rasterized on its own in per-line mode.
+    """
+    def __init__(self, name, body, frozen_names):
+        """
+        :param name: name of the layer (under, over, or line <name of the caption line>)
+        :param body: svg elements of the layer
+        :param frozen_names: animated placeholders in the <defs> section that can't change how the layer looks
+        """
+        self.name = name
+        self.line = layer_line(name)
+        self.plan = PlaceholderPlan(body)
+        self.frozen_names = frozen_names
+        self.frozen_values = None  # values of the frozen_names, taken from the first frame
+
+
+class LinePlan(object):
+    """
+    Splits the svg skeleton in layers (RawSvgElementsUnder, one layer per caption line, RawSvgElementsOver) that
+    are all rasterized separately. The raster of every layer is cached, keyed on its fully resolved svg, so a layer
+    is only rasterized again in frames in which its own values changed. Caption lines are rasterized cropped to a
+    conservative estimate of their bounding box (including stroke and filter effects), and every raster is trimmed
+    to its visible pixels before it is composited into the frame. If the skeleton can't be split safely, layers is
+    empty and frames should be rasterized as a whole.
+    """
+    def __init__(self, skeleton, animated_names, lines, max_bytes=256 * 1024 * 1024):
+        """
+        :param skeleton: svg skeleton with layer markers, as rendered from doc.svgtemplate
+        :param animated_names: set with the names of the placeholders whose value changes from frame to frame
+        :param lines: names of the caption lines
+        :param max_bytes: maximum total size (in bytes) of the cached layer rasters
+        """
+        self.layers = []
+        self.cache = FrameCache(max_bytes)
+        self.previous = None  # tuple (frame settings, layer rasters, frame) of the previous frame
+        split = split_layers(skeleton)
+        if split is None:
+            return
+        prolog, layers, self.epilog = split
+        self.prolog = PlaceholderPlan(prolog)
+        animated_in_prolog = self.prolog.slot_names() & animated_names
+        for name, body in layers:
+            dependencies = animated_dependencies(name, body, animated_names, animated_in_prolog, lines)
+            self.layers.append(LineLayer(name, body, animated_in_prolog - dependencies))
+        root = ROOT_ELEMENT.search(prolog)
+        self.root = root.group(0) if root is not None else None
+        self.viewbox = _viewbox(self.root) if root is not None else None
+
+    def is_layered(self):
+        """
+        :return: True if frames should be made by compositing layers
+        """
+        return bool(self.layers)
+
+    def render(self, values, rasterize, width, height, background, stage):
+        """
+        makes a frame by compositing the (cached or newly rasterized) layers
+        :param values: dictionary of placeholder name to value for the frame
+        :param rasterize: function (svg, width, height) that turns an svg document into RGBA pixels (with a
+                          transparent background)
+        :param width: width of the frame
+        :param height: height of the frame
+        :param background: background color, or None for a transparent frame
+        :param stage: function that returns a context manager to time a stage of the rendering (for profiling)
+        :return: uint8 numpy array with the frame: RGB if there is a background color, otherwise RGBA
+        """
+        prolog = self.prolog.render(values)
+        rasters = [self._layer_raster(layer, values, prolog, rasterize, width, height) for layer in self.layers]
+        with stage("composite layers"):
+            settings = (width, height, background)
+            if self.previous is not None and self.previous[0] == settings:
+                # only the part of the frame in which a layer changed (where it was or where it is now) is composited
+                # again; the rest is taken from the previous frame
+                _, previous_rasters, previous_frame = self.previous
+                changed = [raster for old, new in zip(previous_rasters, rasters) if old is not new
+                           for raster in (old, new)]
+                frame = previous_frame.copy()
+                box = _bounding_box(changed)
+            else:
+                frame = np.empty((height, width, 3 if background is not None else 4), dtype=np.uint8)
+                box = (0, 0, width, height)
+            if box is not None:
+                _composite(frame, rasters, box, background)
+            self.previous = (settings, rasters, frame)  # frames are never modified once they are returned
+            return frame
+
+    def _layer_raster(self, layer, values, prolog, rasterize, width, height):
+        """
+        helper function to look up the raster of a layer in the cache, or to rasterize it if its svg changed
+        :param prolog: the resolved svg up to (and including) the <defs> section
+        :return: LayerRaster
+        """
+        if layer.frozen_names:
+            # changes in styles and filters that the layer doesn't use must not make it look changed
+            if layer.frozen_values is None:
+                layer.frozen_values = {name: values[name] for name in layer.frozen_names}
+            values = {**values, **layer.frozen_values}
+            prolog = self.prolog.render(values)
+        body = layer.plan.render(values)
+        svg = prolog + body + self.epilog
+        key = FrameCache.key(svg, width, height, None)
+        raster = self.cache.get(key)
+        if raster is None:
+            raster = self._rasterize_layer(layer, svg, body, rasterize, width, height)
+            self.cache.put(key, raster)
+        return raster
+
+    def _rasterize_layer(self, layer, svg, body, rasterize, width, height):
+        """
+        helper function to rasterize a layer, cropped to its estimated bounding box if possible
+        :return: LayerRaster
+        """
+        box = self._crop_box(layer, svg, body, width, height)
+        if box is not None:
+            left, top, right, bottom = box
+            if right <= left or bottom <= top:
+                return LayerRaster(0, 0, np.zeros((0, 0, 4), dtype=np.float32))  # outside of the frame
+            pixels = rasterize(self._cropped(svg, box, width, height), right - left, bottom - top)
+            if not _touches_crop_edges(pixels, box, width, height):
+                return _trimmed(pixels, left, top)
+            # the estimate was too small after all: visible pixels may have been cut off
+        return _trimmed(rasterize(svg, width, height), 0, 0)
+
+    def _crop_box(self, layer, svg, body, width, height):
+        """
+        helper function to find the part of the frame that a layer has to be rasterized for
+        :return: tuple (left, top, right, bottom) in pixels, or None if the complete frame has to be rasterized
+        """
+        if layer.line is None or self.viewbox is None:
+            return None
+        box = estimate_text_box(body, svg)
+        if box is None:
+            return None
+        view_x, view_y, view_width, view_height = self.viewbox[:4]
+        left = max(0, int(math.floor((box[0] - view_x) * width / view_width)) - 1)
+        top = max(0, int(math.floor((box[1] - view_y) * height / view_height)) - 1)
+        right = min(width, int(math.ceil((box[2] - view_x) * width / view_width)) + 1)
+        bottom = min(height, int(math.ceil((box[3] - view_y) * height / view_height)) + 1)
+        if (right - left) * (bottom - top) > width * height // 2:
+            return None  # cropping doesn't save enough to be worth the risk of a second rasterization
+        return left, top, right, bottom
+
+    def _cropped(self, svg, box, width, height):
+        """
+        helper function to make an svg document that only shows a part of the frame
+        :param svg: resolved svg document of a layer
+        :param box: tuple (left, top, right, bottom) with the part of the frame to show, in pixels
+        :param width: width of the frame
+        :param height: height of the frame
+        :return: svg document that rasterizes to the pixels in box when exported at (right - left, bottom - top)
+        """
+        left, top, right, bottom = box
+        view_x, view_y, view_width, view_height, document_width, document_height = self.viewbox
+        units_x, units_y = view_width / width, view_height / height  # user units per pixel
+        root = self.root
+        for attribute, value in (('width', (right - left) * document_width / width),
+                                 ('height', (bottom - top) * document_height / height),
+                                 ('viewBox', f"{view_x + left * units_x} {view_y + top * units_y} "
+                                             f"{(right - left) * units_x} {(bottom - top) * units_y}")):
+            root = re.sub(rf"""(?<=\s){attribute}\s*=\s*(["']).*?\1""", f'{attribute}="{value}"', root, count=1)
+        return svg.replace(self.root, root, 1)
+
+
+def _bounding_box(rasters):
+    """
+    :param rasters: list of LayerRasters
+    :return: tuple (left, top, right, bottom) in pixels of the part of the frame covered by the rasters, or None if
+             none of them has visible pixels
+    """
+    boxes = [(raster.x, raster.y, raster.x + raster.pixels.shape[1], raster.y + raster.pixels.shape[0])
+             for raster in rasters if raster.pixels.size]
+    if not boxes:
+        return None
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+def _composite(frame, rasters, box, background):
+    """
+    composites the layer rasters (in z-order) over the background, and writes the result into a part of the frame
+    :param frame: uint8 frame (RGB if there is a background color, otherwise RGBA)
+    :param rasters: list of LayerRasters
+    :param box: tuple (left, top, right, bottom) in pixels of the part of the frame to write
+    :param background: background color, or None for a transparent frame
+    """
+    left, top, right, bottom = box
+    canvas = empty_canvas(right - left, bottom - top, background)
+    for raster in rasters:
+        rows, columns = raster.pixels.shape[:2]
+        x0, y0 = max(left, raster.x), max(top, raster.y)
+        x1, y1 = min(right, raster.x + columns), min(bottom, raster.y + rows)
+        if x0 < x1 and y0 < y1:
+            composite_over(canvas[y0 - top:y1 - top, x0 - left:x1 - left],
+                           raster.pixels[y0 - raster.y:y1 - raster.y, x0 - raster.x:x1 - raster.x])
+    frame[top:bottom, left:right] = canvas_to_frame(canvas, alpha=background is None)
+
+
+def _attributes(text):
+    """
+    :param text: the attributes of an xml element, as written in its start tag
+    :return: dictionary of attribute name to value
+    """
+    return {name: value for name, _, value in ATTRIBUTE.findall(text)}
+
+
+def _length(text):
+    """
+    :param text: a number, optionally followed by px, pt or %
+    :return: the number (in px, or as a fraction for percentages), or None if text is not understood
+    """
+    match = LENGTH.fullmatch(text) if text is not None else None
+    if match is None:
+        return None
+    factor = {None: 1, 'px': 1, 'pt': 4 / 3, '%': 0.01}[match.group(2)]
+    return float(match.group(1)) * factor
+
+
+def _spacing(text):
+    """
+    :param text: value of the letter-spacing or word-spacing property
+    :return: the extra space in px (0 for normal), or None if text is not understood or negative (which can move
+             glyphs in front of the start of the text)
+    """
+    if text.strip() == 'normal':
+        return 0
+    spacing = _length(text)
+    return spacing if spacing is not None and spacing >= 0 and not text.strip().endswith("%") else None
+
+
+def _viewbox(root):
+    """
+    :param root: start tag of the <svg> element
+    :return: tuple (x, y, width, height, document width, document height) describing the viewBox and the size of
+             the document, or None if they are not understood
+    """
+    attributes = _attributes(root[len("<svg"):])
+    try:
+        view = [float(number) for number in attributes['viewBox'].replace(",", " ").split()]
+    except (KeyError, ValueError):
+        return None
+    document_width, document_height = _length(attributes.get('width')), _length(attributes.get('height'))
+    if len(view) != 4 or view[2] <= 0 or view[3] <= 0 or not document_width or not document_height:
+        return None
+    return view[0], view[1], view[2], view[3], document_width, document_height
+
+
+def _class_rules(svg):
+    """
+    :param svg: resolved svg document
+    :return: dictionary of class name to the list of dictionaries with the style properties of the css rules for
+             that class, or None if a style sheet uses other selectors (whose effect isn't understood)
+    """
+    rules = {}
+    for sheet in STYLE_ELEMENT.findall(svg):
+        sheet = re.sub(r"/\*.*?\*/", "", sheet.replace("<![CDATA[", "").replace("]]>", ""), flags=re.S)
+        if CSS_RULE.sub("", sheet).strip():
+            return None
+        for selector, declarations in CSS_RULE.findall(sheet):
+            selected = CSS_CLASS_SELECTOR.fullmatch(selector)
+            if selected is None:
+                return None
+            properties = {}
+            for declaration in declarations.split(";"):
+                if declaration.strip():
+                    name, _, value = declaration.partition(":")
+                    properties[name.strip()] = value.strip()
+            rules.setdefault(selected.group(1), []).append(properties)
+    return rules
+
+
+def _filter_region(svg, identifier, box):
+    """
+    :param svg: resolved svg document
+    :param identifier: id of a <filter> element
+    :param box: tuple (left, top, right, bottom) that contains the bounding box of the filtered element
+    :return: tuple (left, top, right, bottom) that contains the filter region, or None if it can't be determined
+    """
+    for match in FILTER_ELEMENT.finditer(svg):
+        attributes = _attributes(match.group(1))
+        if attributes.get('id') == identifier:
+            break
+    else:
+        return None
+    if attributes.get('filterUnits', 'objectBoundingBox') != 'objectBoundingBox':
+        return None
+    x, y = _length(attributes.get('x', '-10%')), _length(attributes.get('y', '-10%'))
+    region_width, region_height = _length(attributes.get('width', '120%')), _length(attributes.get('height', '120%'))
+    if None in (x, y, region_width, region_height):
+        return None
+    # the region is relative to the bounding box; if it covers the bounding box, the region relative to a larger
+    # box also covers the region relative to the (unknown) exact one
+    if x > 0 or y > 0 or x + region_width < 1 or y + region_height < 1:
+        return None
+    left, top, right, bottom = box
+    box_width, box_height = right - left, bottom - top
+    return (left + x * box_width, top + y * box_height,
+            left + (x + region_width) * box_width, top + (y + region_height) * box_height)
+
+
+def estimate_text_box(body, svg):
+    """
+    estimates a conservative bounding box of a caption line, including its stroke and the effect of its filter
+    :param body: resolved svg elements of the caption line (a <text> element with <tspan> elements)
+    :param svg: resolved svg document of the line (for the styles and filters it uses)
+    :return: tuple (left, top, right, bottom) in user units, or None if the box can't be estimated
+    """
+    text = TEXT_ELEMENT.fullmatch(body.strip())
+    if text is None:
+        return None
+    text_attributes = _attributes(text.group(1))
+    spans = TSPAN_ELEMENT.findall(text.group(2))
+    if not text_attributes.keys() <= TEXT_ATTRIBUTES or TSPAN_ELEMENT.sub("", text.group(2)).strip():
+        return None
+    rules = _class_rules(svg)
+    if rules is None:
+        return None
+    properties = [text_attributes]
+    characters = []
+    for attributes, content in spans:
+        attributes = _attributes(attributes)
+        if not attributes.keys() <= TSPAN_ATTRIBUTES or "<" in content:
+            return None
+        properties.append(attributes)
+        characters.append(" " + html.unescape(content))  # the white space between the tspans counts as a space
+    for attributes in properties[:]:
+        for cls in attributes.get('class', '').split():
+            for style in rules.get(cls, []):
+                if not style.keys() <= STYLE_PROPERTIES:
+                    return None
+                properties.append(style)
+    font_sizes = [_length(p['font-size']) for p in properties if 'font-size' in p]
+    stroke_widths = [_length(p['stroke-width']) for p in properties if 'stroke-width' in p]
+    letter_spacings = [_spacing(p['letter-spacing']) for p in properties if 'letter-spacing' in p]
+    word_spacings = [_spacing(p['word-spacing']) for p in properties if 'word-spacing' in p]
+    anchors = {p['text-anchor'] for p in properties if 'text-anchor' in p} or {'start'}
+    x, y = _length(text_attributes.get('x')), _length(text_attributes.get('y'))
+    if None in font_sizes + stroke_widths + letter_spacings + word_spacings + [x, y] \
+            or not anchors <= {'start', 'middle', 'end'}:
+        return None
+    font_size = max(font_sizes, default=DEFAULT_FONT_SIZE)
+    letter_spacing, word_spacing = max(letter_spacings, default=0), max(word_spacings, default=0)
+    advance = sum((ASCII_ADVANCE if ord(character) < 128 else WIDE_ADVANCE) * font_size + letter_spacing
+                  + (word_spacing if character == " " else 0)
+                  for text in characters for character in text)
+    left = x - advance if 'end' in anchors else (x - advance / 2 if 'middle' in anchors else x)
+    right = x + advance if 'start' in anchors else (x + advance / 2 if 'middle' in anchors else x)
+    # wide stroke joins (miters) can stick out further than half the stroke width
+    padding = 2 * max(stroke_widths, default=1) + 1
+    box = (left - padding, y - ASCENT * font_size - padding, right + padding, y + DESCENT * font_size + padding)
+    if 'filter' in text_attributes and text_attributes['filter'].strip() != 'none':
+        reference = FILTER_REFERENCE.fullmatch(text_attributes['filter'])
+        if reference is None:
+            return None
+        return _filter_region(svg, reference.group(1), box)
+    return box
+
+
+def _touches_crop_edges(pixels, box, width, height):
+    """
+    :param pixels: RGBA pixels of a layer rasterized cropped to box
+    :param box: tuple (left, top, right, bottom) in pixels
+    :param width: width of the frame
+    :param height: height of the frame
+    :return: True if visible pixels touch an edge of the box that is not an edge of the frame
+    """
+    left, top, right, bottom = box
+    alpha = pixels[:, :, 3]
+    return bool((left > 0 and alpha[:, 0].any()) or (right < width and alpha[:, -1].any())
+                or (top > 0 and alpha[0].any()) or (bottom < height and alpha[-1].any()))
+
+
+def _trimmed(pixels, left, top):
+    """
+    :param pixels: rasterized RGBA pixels (uint8, straight alpha) of a layer
+    :param left: column of the frame at which the pixels start
+    :param top: row of the frame at which the pixels start
+    :return: LayerRaster with only the (premultiplied) rows and columns of pixels that have visible pixels
+    """
+    alpha = pixels[:, :, 3]
+    rows = np.flatnonzero(alpha.any(axis=1))
+    columns = np.flatnonzero(alpha.any(axis=0))
+    if not rows.size:
+        return LayerRaster(0, 0, np.zeros((0, 0, 4), dtype=np.float32))
+    return LayerRaster(left + int(columns[0]), top + int(rows[0]),
+                       premultiply(pixels[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]))
+
+
+def premultiply(layer):
+    """
+    :param layer: rasterized RGBA layer (uint8, straight alpha)
+    :return: float32 array with the colors premultiplied by alpha, all channels in [0, 1]
+    """
+    pixels = layer.astype(np.float32) / 255
+    pixels[:, :, :3] *= pixels[:, :, 3:4]
+    return pixels
+
+
+def empty_canvas(width, height, background):
+    """
+    :param width: width of the frame
+    :param height: height of the frame
+    :param background: background color (#rrggbb hex color or color name), or None for a transparent background
+    :return: premultiplied float32 RGBA canvas on which layers can be composited with composite_over
+    """
+    canvas = np.zeros((height, width, 4), dtype=np.float32)
+    if background is not None:
+        canvas[:, :, :3] = np.array(PIL.ImageColor.getrgb(background)[:3], dtype=np.float32) / 255
+        canvas[:, :, 3] = 1
+    return canvas
+
+
+def composite_over(canvas, pixels):
+    """
+    alpha-composites a layer over the canvas (in place)
+    :param canvas: premultiplied float32 RGBA canvas
+    :param pixels: premultiplied float32 RGBA layer of the same size
+    """
+    canvas *= 1 - pixels[:, :, 3:4]
+    canvas += pixels
+
+
+def canvas_to_frame(canvas, alpha):
+    """
+    :param canvas: premultiplied float32 RGBA canvas
+    :param alpha: if True, return RGBA pixels, otherwise RGB pixels (for an opaque canvas)
+    :return: uint8 numpy array with the frame
+    """
+    if not alpha:
+        return np.rint(canvas[:, :, :3] * 255).astype(np.uint8)
+    coverage = canvas[:, :, 3:4]
+    colors = np.divide(canvas[:, :, :3], coverage, out=np.zeros_like(canvas[:, :, :3]), where=coverage > 0)
+    return np.rint(np.concatenate([colors, coverage], axis=2) * 255).astype(np.uint8)
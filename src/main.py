@@ -1,30 +1,63 @@
 from captiongenerator import CaptionGenerator
+from renderoptions import RenderOptions
+from preview import PreviewRenderer
+from framecache import FrameCache
 import ttkbootstrap as ttkb
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import Messagebox
 from tkinter.filedialog import askopenfilename, askdirectory 
+import PIL.Image
+import PIL.ImageTk
 import pathlib
 import contextlib
+import os
+import queue
+import threading
 
 
 class StdoutRedirector: # https://gist.github.com/kylenahas/a07f2ce8ced689975eae56d6eaad770f
     def __init__(self, parent, text_widget):
         self.text_space = text_widget
         self.parent = parent
+        self.pending = queue.Queue()
+        self.quiet_threads = set()
 
     def write(self,string):
+        if threading.get_ident() in self.quiet_threads:
+            return
+        if threading.current_thread() is not threading.main_thread():
+            self.pending.put(string)  # tk may only be used from the main thread: shown with the next flush
+            return
+        self.flush()
         self.text_space.insert('end', string)
         self.text_space.see('end')
         self.parent.update_idletasks()
 
+    def flush(self):
+        # shows what the other threads wrote (only possible in the main thread)
+        if threading.current_thread() is not threading.main_thread() or self.pending.empty():
+            return
+        while not self.pending.empty():
+            self.text_space.insert('end', self.pending.get())
+        self.text_space.see('end')
+
+    @contextlib.contextmanager
+    def quiet(self):
+        # drops what the current thread writes (contextlib.redirect_stdout would silence all threads)
+        self.quiet_threads.add(threading.get_ident())
+        try:
+            yield
+        finally:
+            self.quiet_threads.discard(threading.get_ident())
+
 class Gui(ttkb.Frame):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.pack(fill=BOTH, expand=YES)
 
         browse_frm = ttkb.Frame(self)
-        browse_frm.rowconfigure(tuple(range(3)), weight=1, minsize=10)
-        browse_frm.rowconfigure((4,), weight=100, minsize=10)
+        browse_frm.rowconfigure(tuple(range(7)), weight=1, minsize=10)
+        browse_frm.rowconfigure((7,), weight=100, minsize=10)
         browse_frm.columnconfigure((0,2), weight=1, minsize=10)
         browse_frm.columnconfigure((1,), weight=5, minsize=10)
         browse_frm.pack(side=TOP, fill=X, padx=5, pady=5)
@@ -78,12 +111,52 @@ class Gui(ttkb.Frame):
         )
         toml_file_button.grid(column=2, row=2, padx=10, pady=10, ipadx=5, ipady=5)
 
+        # number of parallel render workers
+        jobs_label = ttkb.Label(browse_frm, text="Parallel jobs: ")
+        jobs_label.grid(column=0, row=3, padx=10, pady=10, ipadx=5, ipady=5, sticky="w")
+
+        jobs_spinbox = ttkb.Spinbox(browse_frm, textvariable='jobs', from_=1, to=os.cpu_count() or 1)
+        jobs_spinbox.grid(column=1, row=3, padx=10, pady=10, ipadx=5, ipady=5, sticky="w")
+        self.setvar('jobs', 1)
+
+        # draft mode
+        draft_checkbutton = ttkb.Checkbutton(browse_frm, text="Draft preview (25% size, 10 fps)", variable='draft',
+                                             bootstyle="round-toggle")
+        draft_checkbutton.grid(column=1, row=4, padx=10, pady=10, ipadx=5, ipady=5, sticky="w")
+        self.setvar('draft', False)
+
+        # watch mode
+        watch_checkbutton = ttkb.Checkbutton(browse_frm, text="Watch the toml file and show a live preview",
+                                             variable='watch', bootstyle="round-toggle", command=self.toggle_watch)
+        watch_checkbutton.grid(column=1, row=5, padx=10, pady=10, ipadx=5, ipady=5, sticky="w")
+        self.setvar('watch', False)
+
         # generate button
-        generate_btn = ttkb.Button(master=browse_frm, text="Generate", command=self.generate)
-        generate_btn.grid(column=0, columnspan=3, padx=10, pady=10, ipadx=5, ipady=5)
+        self.generate_btn = ttkb.Button(master=browse_frm, text="Generate", command=self.generate)
+        self.generate_btn.grid(column=0, columnspan=3, row=6, padx=10, pady=10, ipadx=5, ipady=5)
+        self.generate_thread = None
+        self.generate_error = None
 
         self.terminal_output = ttkb.ScrolledText(master=browse_frm)
-        self.terminal_output.grid(column=0, columnspan=3, row=4, padx=10, pady=10, ipadx=5, ipady=5, sticky="news")
+        self.terminal_output.grid(column=0, columnspan=3, row=7, padx=10, pady=10, ipadx=5, ipady=5, sticky="news")
+        self.console = StdoutRedirector(self, self.terminal_output)  # stdout and stderr while the gui runs
+        self.after(100, self.show_console_output)
+
+        # live preview (only shown in watch mode)
+        self.preview_frm = ttkb.Frame(self)
+        self.preview_label = ttkb.Label(self.preview_frm)
+        self.preview_label.pack(side=TOP, padx=5, pady=5)
+        self.scrub_scale = ttkb.Scale(self.preview_frm, from_=0, to=0, command=self.scrub)
+        self.scrub_scale.pack(side=TOP, fill=X, padx=10, pady=5)
+        self.preview_status = ttkb.Label(self.preview_frm, text="")
+        self.preview_status.pack(side=TOP, padx=5, pady=5)
+        self.preview = None
+        self.preview_frames = FrameCache()  # (frame index, generation) -> preview frame, the oldest are evicted
+        self.preview_latest = {}  # frame index -> generation of its most recent preview frame
+        self.preview_generation = 0  # generation of the preview frames that are up to date
+        self.preview_done = set()  # frames that are up to date with the current version of the spec
+        self.preview_image = None
+        self.preview_position = 0
 
 
     def get_path_to_inkscape(self):
@@ -119,20 +192,148 @@ class Gui(ttkb.Frame):
             Messagebox.ok(message=f"{output_folder} is not an existing folder.\nPlease select an existing result folder first.")
             return
 
-        output_file = output_folder.joinpath(toml.stem)
+        draft = self.getboolean(self.getvar('draft'))
+        output_file = output_folder.joinpath(toml.stem + ("-draft" if draft else ""))
 
         try:
-            with contextlib.redirect_stdout(StdoutRedirector(self, self.terminal_output)),\
-                    contextlib.redirect_stderr(StdoutRedirector(self, self.terminal_output)):
-                c = CaptionGenerator(str(output_file))
-                c.write_videofile(input=str(toml))
+            jobs = int(self.getvar('jobs'))
+        except ValueError:
+            Messagebox.ok(message=f"{self.getvar('jobs')} is not a valid number of parallel jobs.")
+            return
+        if jobs < 1:
+            Messagebox.ok(message="The number of parallel jobs must be at least 1.")
+            return
+
+        options = RenderOptions(jobs=jobs, inkscape=str(inkscape))
+        if draft:
+            options.render_fps, options.scale = 10, 0.25
+        self.generate_btn.configure(state=DISABLED)
+        self.generate_error = None
+        self.generate_thread = threading.Thread(target=self.render_in_background,
+                                                args=(str(output_file), options, str(toml)), daemon=True)
+        self.generate_thread.start()
+        self.after(100, self.wait_for_render)
+
+    def render_in_background(self, output_file, options, toml):
+        # runs in a background thread, so the gui keeps responding while the video is written
+        try:
+            c = CaptionGenerator(output_file, options)
+            c.write_videofile(input=toml)
         except Exception as e:
-            Messagebox.ok(message=f"An exception occurred while processing your file.\n{e}")
+            self.generate_error = e
+
+    def wait_for_render(self):
+        if self.generate_thread.is_alive():
+            self.after(100, self.wait_for_render)
+            return
+        self.generate_btn.configure(state=NORMAL)
+        if self.generate_error is not None:
+            Messagebox.ok(message=f"An exception occurred while processing your file.\n{self.generate_error}")
+
+    def show_console_output(self):
+        # shows what background threads printed
+        self.console.flush()
+        self.after(100, self.show_console_output)
+
+    def toggle_watch(self):
+        if not self.getboolean(self.getvar('watch')):
+            self.stop_watching()
+            return
+        inkscape = pathlib.Path(self.getvar('inkscape-path'))
+        toml = pathlib.Path(self.getvar('toml-file'))
+        try:
+            jobs = max(1, int(self.getvar('jobs')))
+        except ValueError:
+            jobs = 1
+        if not inkscape.is_file() or not toml.is_file():
+            Messagebox.ok(message="Please select a valid path to inkscape and to a .toml file first.")
+            self.setvar('watch', False)
+            return
+        self.preview = PreviewRenderer(str(toml), str(inkscape), workers=jobs, quiet=self.console.quiet)
+        self.preview.has_changed()
+        self.preview_frames.clear()
+        self.preview_latest = {}
+        self.preview_generation = 0
+        self.preview_done = set()
+        self.preview_position = 0
+        self.preview_frm.pack(side=TOP, fill=X, padx=5, pady=5)
+        self.reload_preview()
+        self.after(500, self.watch_files)
+        self.after(40, self.show_preview_frames)
+
+    def stop_watching(self):
+        if self.preview is not None:
+            self.preview.close()
+            self.preview = None
+        self.preview_frm.pack_forget()
+
+    def reload_preview(self):
+        # the worker threads of the preview initialize the specification; show_preview_frames follows the result
+        self.preview.reload(position=self.preview_position)
+
+    def follow_preview_generation(self):
+        # a reloaded specification replaces the preview frames
+        self.preview_generation = self.preview.generation
+        self.preview_done = set()
+        last_frame = max(0, self.preview.nr_of_frames - 1)
+        self.scrub_scale.configure(to=last_frame)
+        self.preview_position = min(self.preview_position, last_frame)
+
+    def watch_files(self):
+        # polls the spec and the templates; reinitializes the preview when one of them is saved
+        if self.preview is None:
+            return
+        if self.preview.has_changed():
+            self.reload_preview()
+        self.after(500, self.watch_files)
+
+    def show_preview_frames(self):
+        # takes the frames that the worker threads rendered since the last call, without blocking the gui
+        if self.preview is None:
+            return
+        if self.preview.generation != self.preview_generation:
+            self.follow_preview_generation()
+        try:
+            while True:
+                generation, index, frame = self.preview.results.get_nowait()
+                if generation > self.preview_generation:
+                    self.follow_preview_generation()
+                if generation == self.preview_generation and frame is not None:
+                    self.preview_frames.put((index, generation), frame)
+                    self.preview_latest[index] = generation
+                    self.preview_done.add(index)
+                    if index == self.preview_position:
+                        self.show_frame(index)
+        except queue.Empty:
+            pass
+        status = self.preview.status()
+        if status == 'failed':
+            self.preview_status.configure(text="Errors in the specification: showing the last valid preview.")
+        elif status == 'loading':
+            self.preview_status.configure(text="Loading the specification...")
+        else:
+            self.preview_status.configure(text=f"Frame {self.preview_position}: "
+                                               f"{len(self.preview_done)} of {self.preview.nr_of_frames} frames ready.")
+        self.after(40, self.show_preview_frames)
+
+    def scrub(self, value):
+        self.preview_position = int(float(value))
+        if self.preview is not None:
+            self.preview.request(self.preview_position)
+        self.show_frame(self.preview_position)
+
+    def show_frame(self, index):
+        frame = self.preview_frames.get((index, self.preview_latest.get(index)))
+        if frame is None:  # not rendered yet, or evicted
+            return
+        self.preview_image = PIL.ImageTk.PhotoImage(PIL.Image.fromarray(frame))
+        self.preview_label.configure(image=self.preview_image)
 
 def main():
     app = ttkb.Window("Caption Generator", themename="darkly")
-    Gui(app)
-    app.mainloop()
+    gui = Gui(app)
+    with contextlib.redirect_stdout(gui.console), contextlib.redirect_stderr(gui.console):
+        app.mainloop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
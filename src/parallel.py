@@ -0,0 +1,171 @@
+import collections
+import concurrent.futures
+import contextlib
+import io
+import multiprocessing.util
+import time
+
+_worker_generator = None
+
+
+def _init_worker(spec_contents, options, rasterizer):
+    """
+    initializer for the worker processes: every worker builds its own CaptionGenerator (and its own rasterizer)
+    :param spec_contents: string containing the .toml specification
+    :param options: RenderOptions for the CaptionGenerator of the worker
+    :param rasterizer: optional (picklable) Rasterizer; every worker gets its own copy
+    """
+    global _worker_generator
+    from captiongenerator import CaptionGenerator
+    _worker_generator = CaptionGenerator("", options, rasterizer=rasterizer)
+    if _worker_generator.profiler is not None:
+        _worker_generator.profiler.collect = True  # the timings are sent back with every frame
+    with contextlib.redirect_stdout(io.StringIO()):  # warnings were already shown by the main process
+        _worker_generator.initialize_from_string(spec_contents)
+    multiprocessing.util.Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    """
+    helper function to shut down the rasterizer of a worker process when the worker exits
+    """
+    if _worker_generator is not None and _worker_generator.rasterizer is not None:
+        _worker_generator.rasterizer.close()
+
+
+def _render_frame(t):
+    """
+    renders a single frame in a worker process
+    :param t: time in seconds
+    :return: tuple of the rendered frame, the changes in the frame cache statistics it caused and the timings
+             recorded by the profiler of the worker (empty if profiling is disabled)
+    """
+    before = _worker_generator.cache_statistics()
+    frame = _worker_generator.frame_maker(t)
+    after = _worker_generator.cache_statistics()
+    timings = _worker_generator.profiler.drain() if _worker_generator.profiler is not None else []
+    return frame, {key: after[key] - before[key] for key in after}, timings
+
+
+def _write_svg_frame(t, filename):
+    """
+    resolves the svg of a single frame and writes it to a file in a worker process
+    :param t: time in seconds
+    :param filename: full path of the .svg or .svgz file
+    :return: filename
+    """
+    _worker_generator.write_svg_frame(t, filename)
+    return filename
+
+
+class ParallelFrameRenderer(object):
+    """
+    Renders frames on a pool of worker processes (each with its own rasterizer) and hands them back in order.
+    """
+    def __init__(self, spec_contents, jobs, options, rasterizer=None, profiler=None):
+        """
+        :param spec_contents: string containing the .toml specification
+        :param jobs: number of worker processes
+        :param options: RenderOptions for the CaptionGenerator in the workers (e.g. inkscape, cache_dir, render_fps)
+        :param rasterizer: optional (picklable) Rasterizer for the workers (default: one made from the options)
+        :param profiler: optional Profiler in which the timings recorded in the workers are collected
+        """
+        self.jobs = jobs
+        self.profiler = profiler
+        self.cache_statistics = collections.Counter()
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                               initializer=_init_worker,
+                                                               initargs=(spec_contents, options, rasterizer))
+        # make sure the workers exist now: forked workers would otherwise inherit files and pipes that are opened
+        # later on (e.g. the stdin of an encoder), which then never get closed
+        self.executor.submit(int).result()
+
+    def iter_frames(self, times):
+        """
+        generator that renders all requested frames in parallel, but yields them in the order they were requested
+        at most a few frames per worker are in flight at any time, so memory use stays bounded
+        :param times: iterable of times (in seconds)
+        :return: generator of (t, frame) tuples
+        """
+        max_in_flight = 4 * self.jobs
+        in_flight = collections.deque()
+        for t in times:
+            in_flight.append((t, self.executor.submit(_render_frame, t)))
+            if len(in_flight) >= max_in_flight:
+                yield self._collect(*in_flight.popleft())
+        while in_flight:
+            yield self._collect(*in_flight.popleft())
+
+    def write_svg_frames(self, times, filenames):
+        """
+        generator that resolves and writes svg frames in parallel (without rasterizing them)
+        :param times: list of times (in seconds)
+        :param filenames: list with the full path of the file of every frame
+        :return: generator of the filenames, in order, as the frames are written
+        """
+        chunksize = max(1, min(16, len(times) // (4 * self.jobs)))
+        return self.executor.map(_write_svg_frame, times, filenames, chunksize=chunksize)
+
+    def _collect(self, t, future):
+        """
+        helper function to wait for a frame rendered by a worker and update the cache statistics
+        :return: tuple (t, frame)
+        """
+        start = time.perf_counter()
+        frame, statistics, timings = future.result()
+        self.cache_statistics.update(statistics)
+        if self.profiler is not None:
+            self.profiler.add("wait for workers", start, time.perf_counter() - start)
+            self.profiler.merge(timings)
+        return t, frame
+
+    def close(self):
+        """
+        shuts down the worker processes
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class OrderedFrameSource(object):
+    """
+    Adapter between the ordered stream of frames coming from a ParallelFrameRenderer and moviepy,
+    which asks for frames by time. Frames that are requested out of order (e.g. moviepy asking for the first frame
+    to determine the clip size) are rendered directly with a fallback make_frame function.
+    """
+    def __init__(self, renderer, fps, nr_of_frames, fallback_make_frame, keep=2, stride=1):
+        """
+        :param renderer: a ParallelFrameRenderer
+        :param fps: frames per second with which moviepy will request the frames
+        :param nr_of_frames: total number of frames in the clip
+        :param fallback_make_frame: make_frame function used for frames that are not available from the stream
+        :param keep: number of recently produced frames to remember for repeated requests
+        :param stride: only every stride-th frame is rendered; the frames in between repeat the last rendered frame
+        """
+        self.fps = fps
+        self.stride = stride
+        self.fallback_make_frame = fallback_make_frame
+        self.stream = renderer.iter_frames(index / fps for index in range(0, nr_of_frames, stride))
+        self.next_index = 0
+        self.recent = collections.OrderedDict()
+        self.keep = keep
+
+    def make_frame(self, t):
+        """
+        make_frame function suitable for moviepy
+        :param t: time in seconds
+        :return: the rendered frame
+        """
+        index = (int(round(t * self.fps)) // self.stride) * self.stride
+        if index in self.recent:
+            return self.recent[index]
+        if index < self.next_index:
+            return self.fallback_make_frame(t)
+        for _, frame in self.stream:
+            current_index = self.next_index
+            self.next_index += self.stride
+            if current_index == index:
+                self.recent[index] = frame
+                if len(self.recent) > self.keep:
+                    self.recent.popitem(last=False)
+                return frame
+        return self.fallback_make_frame(t)
@@ -0,0 +1,55 @@
+import re
+
+# ${name} is a placeholder; like in python's string.Template, $$ is an escaped (literal) $
+PLACEHOLDER_PATTERN = re.compile(r"\$(?:\$|\{([^${}]*)\})")
+
+
+class PlaceholderPlan(object):
+    """
+    A pre-compiled version of an svg string with placeholders like ${Line1_x} or ${Animations.Style.grow_for_style_h1}.
+    The svg is split once into literal chunks and slots, so that filling in the placeholders for a frame
+    is a single join instead of a search and replace over the complete document for every placeholder.
+    Only the innermost ${...} of nested placeholders (e.g. ${a${b}}) is a placeholder, and the values that are filled
+    in are never searched for placeholders themselves.
+    """
+    def __init__(self, svg):
+        """
+        :param svg: svg string with placeholders
+        """
+        self.chunks = []
+        self.slots = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(svg):
+            self.chunks.append(svg[position:match.start()])
+            if match.group(1) is None:
+                self.chunks.append("$")  # $$
+            else:
+                self.slots.append((len(self.chunks), match.group(1)))
+                self.chunks.append(match.group(0))
+            position = match.end()
+        self.chunks.append(svg[position:])
+
+    def slot_names(self):
+        """
+        :return: set with the names of all placeholders in the svg (without the surrounding ${ })
+        """
+        return {name for _, name in self.slots}
+
+    def missing(self, values):
+        """
+        :param values: dictionary of placeholder name to value
+        :return: sorted list of placeholder names that would not be resolved by values
+        """
+        return sorted(self.slot_names() - set(values))
+
+    def render(self, values):
+        """
+        fills in all placeholders
+        :param values: dictionary of placeholder name to value; placeholders not in values are preserved
+        :return: svg string in which the placeholders have been replaced with their values
+        """
+        parts = self.chunks.copy()
+        for index, name in self.slots:
+            if name in values:
+                parts[index] = str(values[name])
+        return "".join(parts)
@@ -0,0 +1,238 @@
+import collections
+import contextlib
+import io
+import math
+import os
+import queue
+import threading
+from pathlib import Path
+from captiongenerator import CaptionGenerator
+from renderoptions import RenderOptions
+from framecache import FrameCache
+from rasterizer import make_rasterizer
+
+
+class PreviewRenderer(object):
+    """
+    Renders preview frames of a specification in the background, for live previews while editing it.
+    The frame at the current (scrub) position is rendered first, then the other frames in order of their distance
+    to that position. Every worker thread initializes its own CaptionGenerator and has its own rasterizer and frame
+    cache, which are kept when the specification is reloaded, so only the frames that look different after an edit
+    are rasterized again. Rendered frames are put in the results queue as (generation, frame index, frame) tuples;
+    frames of an older generation (rendered before the last successful reload) should be ignored.
+    """
+    def __init__(self, spec_file, inkscape, workers=2, max_width=640, backend='inkscape', quiet=None):
+        """
+        :param spec_file: full path to the .toml specification
+        :param inkscape: (full) path to the inkscape executable
+        :param workers: number of worker threads that render frames
+        :param max_width: frames are scaled down to at most this width
+        :param backend: rasterizer backend (see rasterizer.BACKENDS)
+        :param quiet: optional function that returns a context manager that silences what the current thread prints;
+                      used while the other workers repeat the initialization that the first worker reported on
+        """
+        self.spec_file = str(spec_file)
+        self.inkscape = inkscape
+        self.max_width = max_width
+        self.quiet = quiet or contextlib.nullcontext
+        self.results = queue.Queue()
+        self.condition = threading.Condition()
+        self.generation = 0  # incremented every time a reloaded specification replaces the frames
+        self.generators = [None] * workers
+        self.worker_generations = [0] * workers  # generation of the CaptionGenerator of every worker
+        self.pending = collections.deque()  # indices of the frames that still have to be rendered
+        self.nr_of_frames = 0
+        self.fps = 1
+        self.position = 0  # frame that the user wants to see
+        self.reloads = 0  # number of reloads
+        self.contents = None  # contents of the specification of the last reload
+        self.loaded = [0] * workers  # last reload that every worker loaded (or skipped because it failed)
+        self.lead = 0  # last reload that a worker started to load as the first one
+        self.accepted = 0  # last reload that was loaded successfully
+        self.failed = 0  # last reload that could not be loaded
+        self.scale = 1.0
+        self.modification_times = {}
+        self.stopped = False
+        self.rasterizers = [make_rasterizer(inkscape, backend=backend) for _ in range(workers)]
+        self.frame_caches = [FrameCache(max_bytes=64 * 1024 * 1024) for _ in range(workers)]
+        self.threads = [threading.Thread(target=self._work, args=(worker,), daemon=True) for worker in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def watched_files(self):
+        """
+        :return: list of the files that influence the preview: the specification and the svg templates
+        """
+        template_folder = Path(CaptionGenerator("").template_folder)
+        templates = [str(path) for path in template_folder.rglob("*")
+                     if path.is_file() and path.relative_to(template_folder).parts[0] != "modules"]
+        return [self.spec_file] + sorted(templates)
+
+    def has_changed(self):
+        """
+        :return: True if one of the watched files changed (or appeared or disappeared) since the previous call
+        """
+        modification_times = {}
+        for filename in self.watched_files():
+            try:
+                modification_times[filename] = os.stat(filename).st_mtime_ns
+            except OSError:
+                modification_times[filename] = None
+        changed = modification_times != self.modification_times
+        self.modification_times = modification_times
+        return changed
+
+    def reload(self, position=0):
+        """
+        reads the specification again and restarts rendering, starting with the frame at position; the specification
+        is initialized in the worker threads (the first one prints the warnings and errors), see status
+        :param position: index of the frame that should be rendered first
+        :return: True if ok; False if nok (the file could not be read)
+        """
+        try:
+            contents = Path(self.spec_file).read_text("utf-8")
+        except IOError as e:
+            print(f"Error opening file {self.spec_file}\n{e}")
+            return False
+        with self.condition:
+            self.reloads += 1
+            self.contents = contents
+            self.position = position
+            self.condition.notify_all()
+        return True
+
+    def status(self):
+        """
+        :return: 'loading' while the last reloaded specification is initialized, 'failed' if it has errors (the
+                 frames of the last valid specification are still rendered), otherwise 'ready'
+        """
+        with self.condition:
+            if self.failed == self.reloads:
+                return 'failed'
+            return 'ready' if self.accepted == self.reloads else 'loading'
+
+    def _frames_in_order(self, position):
+        """
+        helper function to sort all frames by their distance to position (ties: the frame after position first)
+        """
+        return sorted(range(self.nr_of_frames), key=lambda index: (abs(index - position), index < position))
+
+    def request(self, position):
+        """
+        makes sure the frames around position are rendered next (e.g. because the user moved the scrub bar there)
+        :param position: index of the frame the user wants to see
+        """
+        with self.condition:
+            self.position = position
+            waiting = set(self.pending)
+            self.pending = collections.deque(index for index in self._frames_in_order(position) if index in waiting)
+
+    def _must_load(self, worker):
+        """
+        helper function to check if a worker has to initialize (or skip) the last reloaded specification: the first
+        worker that sees it loads it right away, the others wait until that worked
+        (call with the condition held)
+        """
+        return self.loaded[worker] != self.reloads and \
+            (self.lead != self.reloads or self.accepted == self.reloads or self.failed == self.reloads)
+
+    def _can_render(self, worker):
+        """
+        helper function to check if a worker can render one of the pending frames (call with the condition held)
+        """
+        return bool(self.pending) and self.worker_generations[worker] == self.generation
+
+    def _load(self, worker, request, contents, lead):
+        """
+        helper function that runs in a worker thread: initializes a CaptionGenerator for the worker
+        :param request: number of the reload
+        :param contents: contents of the specification
+        :param lead: True for the first worker that loads this specification: it reports the warnings and errors,
+                     and decides the size of the preview frames
+        """
+        scale = self.scale
+        if lead:
+            probe = CaptionGenerator("")
+            if not probe.initialize_from_string(contents):
+                with self.condition:
+                    self.failed = request
+                    self.loaded[worker] = request
+                    self.condition.notify_all()
+                return
+            width, _ = probe.frame_size()
+            scale = min(1.0, self.max_width / width)
+        generator = CaptionGenerator("", RenderOptions(scale=scale, inkscape=self.inkscape),
+                                     rasterizer=self.rasterizers[worker])
+        generator.frame_cache = self.frame_caches[worker]
+        with self.quiet():  # the warnings were already shown for the probe
+            ok = generator.initialize_from_string(contents)
+        with self.condition:
+            self.loaded[worker] = request
+            if not ok and lead:
+                self.failed = request
+            if not ok or request != self.reloads:  # failed, or reloaded again in the meantime
+                self.condition.notify_all()
+                return
+            if lead:
+                self.scale = scale
+                self.fps = probe.output_fps()
+                self.nr_of_frames = int(math.ceil(probe.duration() * self.fps))
+                self.pending = collections.deque(self._frames_in_order(self.position))
+                self.generation += 1
+                self.accepted = request
+            self.generators[worker] = generator
+            self.worker_generations[worker] = self.generation
+            self.condition.notify_all()
+
+    def _work(self, worker):
+        """
+        helper function that runs in a worker thread: loads reloaded specifications and renders frames until the
+        renderer is closed
+        :param worker: index of the worker thread
+        """
+        while True:
+            with self.condition:
+                while not self.stopped and not self._must_load(worker) and not self._can_render(worker):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                if self._must_load(worker):
+                    if self.failed == self.reloads:  # no use trying again
+                        self.loaded[worker] = self.reloads
+                        continue
+                    request, contents, lead = self.reloads, self.contents, self.lead != self.reloads
+                    self.lead = request
+                else:
+                    request = None
+                    index = self.pending.popleft()
+                    generation = self.generation
+                    generator = self.generators[worker]
+                    fps = self.fps
+            if request is not None:
+                try:
+                    self._load(worker, request, contents, lead)
+                except Exception as e:  # e.g. an unexpected error in the specification; keep the previous frames
+                    print(f"Error! Couldn't load {self.spec_file}: {e}")
+                    with self.condition:
+                        self.failed = request
+                        self.loaded[worker] = request
+                        self.condition.notify_all()
+                continue
+            try:
+                frame = generator.frame_maker(index / fps)
+            except Exception as e:  # e.g. the rasterizer failed; report it and keep serving the other frames
+                print(f"Error! Couldn't render preview frame {index}: {e}")
+                frame = None
+            self.results.put((generation, index, frame))
+
+    def close(self):
+        """
+        stops the worker threads and the rasterizers
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        for rasterizer in self.rasterizers:
+            rasterizer.close()
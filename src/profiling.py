@@ -0,0 +1,189 @@
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import math
+import os
+import pstats
+import time
+
+
+class Profiler(object):
+    """
+    Records how long every stage of the rendering pipeline takes (template rendering, resolving the animations,
+    rasterizing, png decoding, encoding, ...), both in total and per frame. Timings recorded in worker processes
+    can be merged into the profiler of the main process. Optionally, every timing is also streamed to a trace file
+    in the Chrome trace event format (open it in chrome://tracing or https://ui.perfetto.dev), and the main process
+    can be profiled with cProfile.
+    """
+    def __init__(self, collect=False):
+        """
+        :param collect: if True, remember the recorded timings until they are fetched with drain
+                        (used in worker processes to send their timings to the main process)
+        """
+        self.collect = collect
+        self.pending = []
+        self.trace = None
+        self.cprofile = None
+        self.reset()
+
+    def reset(self):
+        """
+        forgets all recorded timings
+        """
+        self.origin = time.perf_counter()
+        self.stop_time = None
+        self.timings = collections.defaultdict(list)  # stage name -> list of durations in seconds
+        self.frame_timings = collections.defaultdict(lambda: collections.defaultdict(float))  # frame -> stage -> s
+        self.pending = []
+
+    def start(self, trace_file=None, use_cprofile=False):
+        """
+        resets the profiler and starts a new measurement
+        :param trace_file: optional path of a Chrome trace file to which all timings are streamed
+        :param use_cprofile: if True, also profile all python functions in this process with cProfile
+        :return: the profiler itself, so that "with profiler.start(...):" stops it at the end of the block
+        """
+        self.stop()  # an earlier measurement that was never stopped mustn't leave its trace file open
+        self.reset()
+        try:
+            if trace_file is not None:
+                self.trace = open(trace_file, "w")
+                self.trace.write("[\n")
+                self._write_trace_event({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+                                         'args': {'name': 'camala'}}, first=True)
+            self.cprofile = None
+            if use_cprofile:
+                profile = cProfile.Profile()
+                profile.enable()  # fails (python 3.12+) if another profiler is active in this process
+                self.cprofile = profile
+        except Exception:
+            self.stop()
+            raise
+        return self
+
+    def stop(self):
+        """
+        ends the measurement: stops cProfile and closes the trace file (does nothing if the measurement was stopped
+        already)
+        """
+        if self.stop_time is None:
+            self.stop_time = time.perf_counter()
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self.trace is not None:
+            self.trace.write("\n]\n")
+            self.trace.close()
+            self.trace = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name, frame=None):
+        """
+        context manager that records the time spent in its body
+        :param name: name of the stage
+        :param frame: index of the frame the stage belongs to, or None for stages that don't belong to a frame
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter() - start, frame)
+
+    def add(self, name, start, seconds, frame=None, pid=None):
+        """
+        records a timing
+        :param name: name of the stage
+        :param start: value of time.perf_counter() at the start of the stage
+        :param seconds: duration of the stage
+        :param frame: index of the frame the stage belongs to, or None
+        :param pid: id of the process in which the stage ran (default: this process)
+        """
+        self.timings[name].append(seconds)
+        if frame is not None:
+            self.frame_timings[frame][name] += seconds
+        if self.collect:
+            self.pending.append((name, start, seconds, frame, pid or os.getpid()))
+        if self.trace is not None:
+            event = {'name': name, 'cat': 'frame' if frame is not None else 'setup', 'ph': 'X',
+                     'ts': (start - self.origin) * 1e6, 'dur': seconds * 1e6, 'pid': pid or os.getpid(), 'tid': 0}
+            if frame is not None:
+                event['args'] = {'frame': frame}
+            self._write_trace_event(event)
+
+    def _write_trace_event(self, event, first=False):
+        """
+        helper function to append an event to the trace file
+        """
+        self.trace.write(("" if first else ",\n") + json.dumps(event))
+
+    def drain(self):
+        """
+        :return: list of the timings recorded since the previous call (only if the profiler was made with collect=True)
+        """
+        timings, self.pending = self.pending, []
+        return timings
+
+    def merge(self, timings):
+        """
+        adds timings that were recorded by the profiler of another process
+        :param timings: list as returned by drain
+        """
+        for name, start, seconds, frame, pid in timings:
+            self.add(name, start, seconds, frame, pid)
+
+    def report(self, nr_of_functions=15):
+        """
+        :param nr_of_functions: number of functions to include from the cProfile statistics (if cProfile was used)
+        :return: dictionary with the statistics per stage and the timings per frame (can be saved as json)
+        """
+        stages = {}
+        for name, durations in self.timings.items():
+            ordered = sorted(durations)
+            stages[name] = {'count': len(durations),
+                            'total': sum(durations),
+                            'mean': sum(durations) / len(durations),
+                            'max': ordered[-1],
+                            'p95': ordered[math.ceil(0.95 * len(ordered)) - 1]}  # nearest-rank percentile
+        frames = [{'frame': frame, 'total': sum(timings.values()), 'stages': dict(timings)}
+                  for frame, timings in sorted(self.frame_timings.items())]
+        report = {'wall_time': (self.stop_time or time.perf_counter()) - self.origin,
+                  'stages': stages,
+                  'slowest_frames': sorted(frames, key=lambda f: f['total'], reverse=True)[:10],
+                  'frames': frames}
+        if self.cprofile is not None:
+            output = io.StringIO()
+            pstats.Stats(self.cprofile, stream=output).sort_stats("cumulative").print_stats(nr_of_functions)
+            report['cprofile'] = output.getvalue()
+        return report
+
+    def dump_cprofile(self, filename):
+        """
+        saves the cProfile statistics (if cProfile was used), e.g. for snakeviz or pstats
+        :param filename: full path of the file to write
+        """
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(filename)
+
+
+def profile_table(report):
+    """
+    :param report: dictionary as returned by Profiler.report
+    :return: short human readable table with the time spent per stage (stages in worker processes included)
+    """
+    total = sum(stage['total'] for stage in report['stages'].values()) or 1.0
+    lines = [f"{'stage':<40}{'count':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}{'share':>8}"]
+    for name, stage in sorted(report['stages'].items(), key=lambda item: item[1]['total'], reverse=True):
+        lines.append(f"{name:<40}{stage['count']:>8}{stage['total']:>10.3f}{stage['mean'] * 1000:>10.2f}"
+                     f"{stage['p95'] * 1000:>10.2f}{stage['max'] * 1000:>10.2f}{stage['total'] / total:>8.1%}")
+    lines.append(f"wall time: {report['wall_time']:.3f} s")
+    if report['slowest_frames']:
+        slowest = report['slowest_frames'][0]
+        lines.append(f"slowest frame: {slowest['frame']} ({slowest['total'] * 1000:.1f} ms)")
+    return "\n".join(lines)
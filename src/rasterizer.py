@@ -0,0 +1,334 @@
+import io
+import os
+import selectors
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+import PIL.Image
+
+try:
+    import cairosvg
+except (ImportError, OSError):  # optional dependency: only needed for the cairosvg backend (OSError: no libcairo)
+    cairosvg = None
+
+BACKENDS = ['inkscape', 'cairosvg']
+
+
+def to_numpy(image, width, height, alpha=False):
+    '''  Converts an RGBA image into numpy RGB format (or RGBA format if alpha is True)  '''
+    arr = np.array(image).reshape(height, width, 4)  # Copies the data
+    if alpha:
+        return arr
+    return arr[:, :, :3]  # remove alpha channel
+
+
+class PngDecoder(object):
+    """
+    Decodes png images into a preallocated RGBA buffer that is reused for every frame, so decoding a frame doesn't
+    allocate memory for its pixels (PIL decodes straight into the buffer, and the result is a numpy view on it).
+    The arrays returned by decode are read-only and only valid until the next call to decode: copy them if you need
+    to keep them.
+    """
+    def __init__(self):
+        self.buffer = None
+        self.image = None
+        self.last_decode_time = 0.0  # seconds spent in the last call to decode (for profiling)
+
+    def _prepare(self, width, height):
+        """
+        helper function to (re)allocate the buffer when the frame size changes
+        """
+        if self.buffer is None or self.buffer.shape != (height, width, 4):
+            self.buffer = np.empty((height, width, 4), dtype=np.uint8)
+            self.image = PIL.Image.frombuffer("RGBA", (width, height), self.buffer, "raw", "RGBA", 0, 1)
+
+    def _decode_into_buffer(self, img):
+        """
+        helper function to let PIL decode an RGBA image of the size of the buffer straight into the buffer
+        PIL has no public api for decoding into existing memory, but it only allocates pixel memory for an image
+        that has none yet, so the image gets the memory of the buffer before it is loaded. This relies on the
+        Pillow version in requirements.txt (see tests/test_rasterizer.py); if PIL decoded into memory of its own
+        after all, the pixels are copied into the buffer.
+        """
+        try:
+            img.im = self.image.im
+        except AttributeError:  # a Pillow version in which the pixel memory of an image can't be replaced
+            pass
+        img.load()
+        if img.im.id != self.image.im.id:
+            np.copyto(self.buffer, np.asarray(img))
+
+    def decode(self, pngdata, width, height, alpha=False):
+        """
+        :param pngdata: bytes with a png image
+        :param width: expected width of the image
+        :param height: expected height of the image
+        :param alpha: if True return RGBA pixels, otherwise RGB pixels
+        :return: read-only numpy array of shape (height, width, 4) or (height, width, 3); a view on the reused buffer
+        """
+        start = time.perf_counter()
+        img = PIL.Image.open(io.BytesIO(pngdata), formats=["PNG"])
+        self._prepare(width, height)
+        if img.mode == "RGBA" and img.size == (width, height):
+            self._decode_into_buffer(img)
+        else:
+            np.copyto(self.buffer, to_numpy(img.convert("RGBA"), width, height, alpha=True))
+        self.last_decode_time = time.perf_counter() - start
+        pixels = self.buffer if alpha else self.buffer[:, :, :3]  # remove alpha channel
+        pixels = pixels.view()
+        pixels.flags.writeable = False  # the next frame is decoded into the same memory
+        return pixels
+
+    def __getstate__(self):
+        return {'buffer': None, 'image': None, 'last_decode_time': 0.0}  # the buffer is not worth sending to other processes
+
+
+class Rasterizer(object):
+    """
+    Base class for everything that can turn an svg string into pixels.
+    The frame maker in CaptionGenerator only talks to this interface, so different backends can be plugged in.
+    """
+    def rasterize(self, svg, width, height, background):
+        """
+        :param svg: string containing a complete svg document
+        :param width: width in pixels of the resulting image
+        :param height: height in pixels of the resulting image
+        :param background: background color (#rrggbb hex color or color name), or None for a transparent background
+        :return: numpy array of shape (height, width, 3) with the rendered frame,
+                 or of shape (height, width, 4) (RGBA) if the background is transparent;
+                 a read-only array may be a view on a buffer that is reused for the next frame
+        """
+        raise NotImplementedError
+
+    def version(self):
+        """
+        :return: string identifying the rasterizer (used to invalidate cached frames when the rasterizer changes)
+        """
+        return type(self).__name__
+
+    def close(self):
+        """
+        releases resources held by the rasterizer (e.g. background processes)
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class InkscapeRasterizer(Rasterizer):
+    """
+    Rasterizer that starts a new inkscape process for every frame. Slow, but it works with every inkscape version.
+    """
+    def __init__(self, inkscape):
+        """
+        :param inkscape: (full) path to the inkscape executable
+        """
+        self.inkscape = inkscape
+        self.inkscape_version = None
+        self.decoder = PngDecoder()
+
+    def version(self):
+        if self.inkscape_version is None:
+            try:
+                result = subprocess.run([self.inkscape, '--version'], stdin=subprocess.DEVNULL, capture_output=True,
+                                        timeout=60)
+                self.inkscape_version = result.stdout.decode(errors="replace").strip()
+            except (OSError, subprocess.TimeoutExpired):
+                self.inkscape_version = "unknown"
+        return f"inkscape {self.inkscape_version}"
+
+    def rasterize(self, svg, width, height, background):
+        if background is None:
+            background_options = ['--export-background-opacity=0']
+        else:
+            background_options = [f'--export-background={background}']
+        result = subprocess.run([self.inkscape,
+                                 *background_options,
+                                 '--export-type=png',
+                                 '--export-filename=-',
+                                 f'--export-width={width}',
+                                 f'--export-height={height}',
+                                 '--pipe'],
+                                input=svg.encode(),
+                                capture_output=True)
+        return self.decoder.decode(result.stdout, width, height, alpha=background is None)
+
+
+class InkscapeShellRasterizer(Rasterizer):
+    """
+    Rasterizer that keeps a single inkscape process alive (inkscape --shell) and streams all frames through it.
+    This avoids paying the inkscape start-up cost for every frame. If the shell process cannot be used
+    (e.g. because the inkscape version does not support the required actions), it falls back to
+    starting one inkscape process per frame.
+    """
+    PROMPT = b"> "
+
+    def __init__(self, inkscape, timeout=60):
+        """
+        :param inkscape: (full) path to the inkscape executable
+        :param timeout: maximum number of seconds to wait for inkscape to start, or to export a frame, before
+                        falling back to one inkscape process per frame
+        """
+        self.inkscape = inkscape
+        self.timeout = timeout
+        self.fallback = InkscapeRasterizer(inkscape)
+        self.decoder = self.fallback.decoder
+        self.process = None
+        self.workdir = None
+        self.use_fallback = False
+
+    def version(self):
+        return self.fallback.version()
+
+    def _start(self):
+        """
+        helper function to start the inkscape shell process and wait for its first prompt
+        :return: True if ok; False if nok
+        """
+        self.workdir = tempfile.mkdtemp(prefix="camala-")
+        try:
+            self.process = subprocess.Popen([self.inkscape, '--shell'],
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.DEVNULL,
+                                            cwd=self.workdir)
+        except OSError as e:
+            print(f"Warning: couldn't start inkscape in shell mode ({e}). Falling back to one inkscape process per frame.")
+            return False
+        return self._wait_for_prompt()
+
+    def _wait_for_prompt(self):
+        """
+        helper function to read inkscape's output until it asks for the next command
+        :return: True if the prompt was seen; False if the process ended or didn't answer within the timeout
+        """
+        output = b""
+        deadline = time.monotonic() + self.timeout
+        with selectors.DefaultSelector() as selector:
+            try:
+                selector.register(self.process.stdout, selectors.EVENT_READ)
+                selectable = True
+            except (OSError, ValueError):  # pipes can't be selected on windows: wait without a timeout
+                selectable = False
+            while not output.endswith(self.PROMPT):
+                if selectable:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not selector.select(remaining):
+                        print(f"Warning: inkscape shell mode didn't answer within {self.timeout} seconds.")
+                        self.process.kill()  # a stalled shell won't react to quit either
+                        return False
+                chunk = os.read(self.process.stdout.fileno(), 4096)
+                if not chunk:
+                    return False
+                output += chunk
+        return True
+
+    def _export(self, svg, width, height, background):
+        """
+        helper function to let the running inkscape shell convert one svg into a png
+        :return: png data, or None if the export failed
+        """
+        svg_file = os.path.join(self.workdir, "frame.svg")
+        png_file = os.path.join(self.workdir, "frame.png")
+        with open(svg_file, "w", encoding="utf-8") as f:
+            f.write(svg)
+        if os.path.exists(png_file):
+            os.remove(png_file)
+        if background is None:
+            background_action = "export-background-opacity:0; "
+        else:
+            background_action = f"export-background:{background}; "
+        command = (f"file-open:{svg_file}; "
+                   f"{background_action}"
+                   f"export-type:png; "
+                   f"export-width:{width}; "
+                   f"export-height:{height}; "
+                   f"export-filename:{png_file}; "
+                   f"export-do; "
+                   f"file-close\n")
+        try:
+            self.process.stdin.write(command.encode())
+            self.process.stdin.flush()
+        except OSError:
+            return None
+        if not self._wait_for_prompt() or not os.path.exists(png_file):
+            return None
+        with open(png_file, "rb") as f:
+            return f.read()
+
+    def rasterize(self, svg, width, height, background):
+        if not self.use_fallback and self.process is None:
+            self.use_fallback = not self._start()
+            if self.use_fallback:
+                self.close()
+        if not self.use_fallback:
+            pngdata = self._export(svg, width, height, background)
+            if pngdata is not None:
+                return self.decoder.decode(pngdata, width, height, alpha=background is None)
+            print("Warning: inkscape shell mode failed to export a frame. Falling back to one inkscape process per frame.")
+            self.close()
+            self.use_fallback = True
+        return self.fallback.rasterize(svg, width, height, background)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.write(b"quit\n")
+                self.process.stdin.close()
+                self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+            self.process = None
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+
+class CairoSvgRasterizer(Rasterizer):
+    """
+    Rasterizer that renders the svg in-process with cairosvg, so no inkscape installation is needed.
+    It supports text on paths and css styles, but only a subset of the svg filter primitives
+    (see conformance.py to compare its output with inkscape).
+    """
+    def __init__(self):
+        if cairosvg is None:
+            raise ImportError("the cairosvg rasterizer needs the cairosvg package (pip install cairosvg)")
+        self.decoder = PngDecoder()
+
+    def version(self):
+        return f"cairosvg {cairosvg.__version__}"
+
+    def rasterize(self, svg, width, height, background):
+        pngdata = cairosvg.svg2png(bytestring=svg.encode(), output_width=width, output_height=height,
+                                   background_color=background)
+        return self.decoder.decode(pngdata, width, height, alpha=background is None)
+
+
+def available_backends():
+    """
+    :return: list with the names of the rasterizer backends that can be used on this system
+    """
+    return [backend for backend in BACKENDS if backend != 'cairosvg' or cairosvg is not None]
+
+
+def make_rasterizer(inkscape, persistent=True, backend='inkscape'):
+    """
+    factory function for the default rasterizers
+    :param inkscape: (full) path to the inkscape executable
+    :param persistent: if True, keep a single inkscape process running for all frames
+    :param backend: one of BACKENDS
+    :return: a Rasterizer
+    """
+    if backend == 'cairosvg':
+        return CairoSvgRasterizer()
+    if backend != 'inkscape':
+        raise ValueError(f"Unknown rasterizer backend {backend}. Supported backends are {', '.join(BACKENDS)}.")
+    if persistent:
+        return InkscapeShellRasterizer(inkscape)
+    return InkscapeRasterizer(inkscape)
@@ -0,0 +1,153 @@
+import argparse
+from dataclasses import dataclass
+from gifwriter import DITHER_METHODS
+from rasterizer import available_backends, BACKENDS
+
+
+@dataclass
+class RenderOptions:
+    """
+    Everything that configures how a CaptionGenerator renders a specification (as opposed to what it renders).
+    The command line, the batch renderer and the gui all build one of these, so a new render setting is a new field
+    here instead of another keyword argument of the CaptionGenerator constructor.
+    """
+    jobs: int = 1  # number of worker processes used to render frames in parallel (1 renders in this process)
+    backend: str = 'inkscape'  # rasterizer backend if no rasterizer is given: 'inkscape' or 'cairosvg'
+    inkscape: str = None  # (full) path to the inkscape executable (None: the default location for the platform)
+    cache_dir: str = None  # optional directory in which rasterized frames are kept between runs
+    cache_size: int = 2 * 1024 * 1024 * 1024  # maximum size (in bytes) of the cache directory
+    # optional frame rate that overrides the fps from the [Global] section (e.g. for cheap low fps previews);
+    # animation timing in seconds is not affected
+    render_fps: float = None
+    # factor applied to the exported frame size (e.g. 0.25 for quick drafts); the svg viewBox is not changed
+    scale: float = 1.0
+    frame_stride: int = 1  # only render every frame_stride-th frame and repeat it in between (1 renders all frames)
+    # optional dictionary with ffmpeg settings (codec, crf, preset, pix_fmt) that replace the defaults for the
+    # video formats (mp4, webm, mov)
+    encoder_options: dict = None
+    gif_colors: int = 256  # number of colors in the palette of gif output (at most 256)
+    gif_dither: str = 'none'  # dithering for gif output: 'none', 'ordered' or 'floyd-steinberg'
+    # record how long every stage of the rendering takes; write_videofile then prints a table and saves a json
+    # report next to the output (<output>.profile.json)
+    profile: bool = False
+    trace: bool = False  # also stream all timings to a Chrome trace file next to the output (<output>.trace.json)
+    cprofile: bool = False  # also profile the python functions of the main process with cProfile (<output>.prof)
+    # png sequences only: only write the frames that changed since the previous render to the same output and keep
+    # the files of the other frames (<output>.manifest.json remembers which frames the previous render produced)
+    incremental: bool = False
+    svgz: bool = False  # the svg format writes gzip-compressed frames (.svgz) instead of plain .svg files
+    # rasterize the layers of the svg (RawSvgElementsUnder, every caption line and RawSvgElementsOver) that look the
+    # same in every frame only once, and composite them with the animated layers (opt-in: compositing isn't
+    # guaranteed to give exactly the same pixels as rasterizing whole frames)
+    static_layers: bool = False
+    # rasterize every layer on its own (caption lines cropped to their estimated bounding box) and keep its pixels,
+    # so that a layer is only rasterized again in frames in which it looks different; replaces static_layers
+    per_line: bool = False
+
+    def __post_init__(self):
+        self.frame_stride = max(1, int(self.frame_stride))
+
+    def profiling(self):
+        """
+        :return: True if any kind of profiling is enabled
+        """
+        return self.profile or self.trace or self.cprofile
+
+
+def positive_int(text):
+    """
+    argparse type for options that need a whole number of at least 1 (e.g. the number of worker processes)
+    :param text: value given on the command line
+    :return: the value as an int
+    """
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{text}'")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def add_render_arguments(parser):
+    """
+    adds the command line options that fill in RenderOptions to an argparse parser
+    (shared by the command line of captiongenerator.py and the batch renderer)
+    :param parser: argparse.ArgumentParser
+    """
+    parser.add_argument("--fps", type=float, help="render with this frame rate instead of the fps from the spec "
+                                                   "(e.g. for quick low fps previews)")
+    parser.add_argument("--scale", type=float, help="scale factor for the size of the rendered frames (e.g. 0.25)")
+    parser.add_argument("--frame-stride", type=int, default=1,
+                        help="only render every n-th frame and repeat it in between")
+    parser.add_argument("--draft", action="store_true",
+                        help="quick preview: render at 25%% of the size and 10 fps unless --scale or --fps is given")
+    parser.add_argument("--codec", help="ffmpeg video codec for mp4, webm and mov output (e.g. libx265)")
+    parser.add_argument("--crf", type=int, help="constant rate factor (quality) for the video codec")
+    parser.add_argument("--preset", help="encoder preset for the video codec (e.g. slow)")
+    parser.add_argument("--pix-fmt", help="pixel format of the encoded video (e.g. yuv444p)")
+    parser.add_argument("--gif-colors", type=int, default=256, help="number of colors in gif output (2-256)")
+    parser.add_argument("--gif-dither", choices=DITHER_METHODS, default="none", help="dithering for gif output")
+    parser.add_argument("--rasterizer", choices=BACKENDS, default="inkscape",
+                        help="svg rasterizer: inkscape, or cairosvg to render in-process without inkscape")
+    parser.add_argument("--inkscape", help="(full) path to the inkscape executable")
+    parser.add_argument("--cache-dir", help="directory in which rasterized frames are cached between runs")
+    parser.add_argument("--cache-size", type=int, default=2048, help="maximum size of the frame cache directory in MB")
+    parser.add_argument("--clear-cache", action="store_true", help="empty the frame cache directory before rendering")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time spent per rendering stage and save it in <output>.profile.json")
+    parser.add_argument("--trace", action="store_true",
+                        help="save a Chrome trace of all rendering stages in <output>.trace.json (implies --profile)")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="profile the python functions with cProfile and save the statistics in <output>.prof "
+                             "(implies --profile)")
+    parser.add_argument("--svgz", action="store_true", help="write gzip-compressed .svgz frames for the svg format")
+    parser.add_argument("--incremental", action="store_true",
+                        help="png sequences: only render the frames that changed since the previous render of the "
+                             "same output")
+    parser.add_argument("--static-layers", action="store_true",
+                        help="rasterize the layers that don't change only once and composite them with the animated ones")
+    parser.add_argument("--per-line", action="store_true",
+                        help="rasterize every caption line on its own, cropped to its bounding box, and only when it "
+                             "changed")
+
+
+def render_options_from_arguments(parser, args):
+    """
+    validates the options added by add_render_arguments and converts them into RenderOptions
+    (exits with an error message if the options are invalid)
+    :param parser: argparse.ArgumentParser
+    :param args: parsed arguments
+    :return: RenderOptions
+    """
+    if args.draft:
+        args.scale = args.scale or 0.25
+        args.fps = args.fps or 10
+    if args.scale is not None and args.scale <= 0:
+        parser.error("--scale must be larger than 0")
+    if args.frame_stride < 1:
+        parser.error("--frame-stride must be at least 1")
+    if not 2 <= args.gif_colors <= 256:
+        parser.error("--gif-colors must be between 2 and 256")
+    if args.rasterizer not in available_backends():
+        parser.error(f"the {args.rasterizer} rasterizer is not available (pip install {args.rasterizer})")
+    if args.clear_cache and not args.cache_dir:
+        parser.error("--clear-cache requires --cache-dir")
+    return RenderOptions(backend=args.rasterizer,
+                         inkscape=args.inkscape,
+                         cache_dir=args.cache_dir,
+                         cache_size=args.cache_size * 1024 * 1024,
+                         render_fps=args.fps,
+                         scale=args.scale or 1.0,
+                         frame_stride=args.frame_stride,
+                         encoder_options={'codec': args.codec, 'crf': args.crf, 'preset': args.preset,
+                                          'pix_fmt': args.pix_fmt},
+                         gif_colors=args.gif_colors,
+                         gif_dither=args.gif_dither,
+                         profile=args.profile,
+                         trace=args.trace,
+                         cprofile=args.cprofile,
+                         incremental=args.incremental,
+                         svgz=args.svgz,
+                         static_layers=args.static_layers,
+                         per_line=args.per_line)
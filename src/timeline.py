@@ -0,0 +1,242 @@
+import numpy as np
+from vectortween.NumberAnimation import NumberAnimation
+from vectortween.PointAnimation import PointAnimation
+from vectortween.SequentialAnimation import SequentialAnimation
+from vectortween.SumAnimation import SumAnimation
+
+
+def _ease_out_bounce(n):
+    return np.select([n < 1 / 2.75, n < 2 / 2.75, n < 2.5 / 2.75],
+                     [7.5625 * n * n,
+                      7.5625 * (n - 1.5 / 2.75) * (n - 1.5 / 2.75) + 0.75,
+                      7.5625 * (n - 2.25 / 2.75) * (n - 2.25 / 2.75) + 0.9375],
+                     7.5625 * (n - 2.65 / 2.75) * (n - 2.65 / 2.75) + 0.984375)
+
+
+def _ease_in_bounce(n):
+    return 1 - _ease_out_bounce(1 - n)
+
+
+def _ease_in_out_bounce(n):
+    return np.where(n < 0.5, _ease_in_bounce(n * 2) * 0.5, _ease_out_bounce(n * 2 - 1) * 0.5 + 0.5)
+
+
+def _ease_in_out_expo(n):
+    with np.errstate(over='ignore'):
+        return np.select([n == 0, n == 1, n * 2 < 1],
+                         [0.0, 1.0, 0.5 * 2 ** (10 * (n * 2 - 1))],
+                         0.5 * (-1 * (2 ** (-10 * (n * 2 - 1))) + 2))
+
+
+# vectorized versions of the pytweening functions used by vectortween (see CaptionGenerator._supported_tween_methods)
+# note: vectortween maps 'easeInOutCirc' to pytweening.easeOutCirc, and so do we
+TWEENS = {
+    'linear': lambda n: n,
+    'easeInQuad': lambda n: n ** 2,
+    'easeOutQuad': lambda n: -n * (n - 2),
+    'easeInOutQuad': lambda n: np.where(n < 0.5, 2 * n ** 2, -0.5 * ((n * 2 - 1) * ((n * 2 - 1) - 2) - 1)),
+    'easeInCubic': lambda n: n ** 3,
+    'easeOutCubic': lambda n: (n - 1) ** 3 + 1,
+    'easeInOutCubic': lambda n: np.where(n * 2 < 1, 0.5 * (n * 2) ** 3, 0.5 * ((n * 2 - 2) ** 3 + 2)),
+    'easeInQuart': lambda n: n ** 4,
+    'easeOutQuart': lambda n: -((n - 1) ** 4 - 1),
+    'easeInOutQuart': lambda n: np.where(n * 2 < 1, 0.5 * (n * 2) ** 4, -0.5 * ((n * 2 - 2) ** 4 - 2)),
+    'easeInQuint': lambda n: n ** 5,
+    'easeOutQuint': lambda n: (n - 1) ** 5 + 1,
+    'easeInOutQuint': lambda n: np.where(n * 2 < 1, 0.5 * (n * 2) ** 5, 0.5 * ((n * 2 - 2) ** 5 + 2)),
+    'easeInSine': lambda n: -1 * np.cos(n * np.pi / 2) + 1,
+    'easeOutSine': lambda n: np.sin(n * np.pi / 2),
+    'easeInOutSine': lambda n: -0.5 * (np.cos(np.pi * n) - 1),
+    'easeInExpo': lambda n: np.where(n == 0, 0.0, 2 ** (10 * (n - 1))),
+    'easeOutExpo': lambda n: np.where(n == 1, 1.0, -(2 ** (-10 * n)) + 1),
+    'easeInOutExpo': _ease_in_out_expo,
+    'easeInCirc': lambda n: -1 * (np.sqrt(1 - n * n) - 1),
+    'easeOutCirc': lambda n: np.sqrt(1 - ((n - 1) * (n - 1))),
+    'easeInOutCirc': lambda n: np.sqrt(1 - ((n - 1) * (n - 1))),
+    'easeInBounce': _ease_in_bounce,
+    'easeOutBounce': _ease_out_bounce,
+    'easeInOutBounce': _ease_in_out_bounce,
+}
+
+
+def _linlin(value, in_min, in_max, out_min, out_max):
+    """
+    vectorized version of vectortween's Mapping.linlin (with clipping); returns NaN where Mapping.linlin returns None
+    """
+    if in_min == in_max:
+        if out_min == out_max:
+            return np.where(value == in_min, float(out_min), np.nan)
+        return np.full(np.shape(value), np.nan)
+    output = ((out_min + out_max) + (out_max - out_min) * (
+        (2 * value - (in_min + in_max)) / float(in_max - in_min))) / 2.0
+    return np.clip(output, min(out_min, out_max), max(out_min, out_max))
+
+
+def _tween(method, t):
+    """
+    applies the tween method with the given name to an array of values between 0 and 1
+    """
+    if method not in TWEENS:
+        raise TypeError(f"Unsupported tween method {method}")
+    with np.errstate(invalid='ignore'):
+        return np.asarray(TWEENS[method](t), dtype=float)
+
+
+def _sample_number(animation, frames, birth_frame, start_frame, stop_frame, death_frame):
+    result = np.full(frames.shape, np.nan)
+    result[frames < start_frame] = animation.frm
+    result[frames > stop_frame] = animation.to
+    evolving = (frames >= start_frame) & (frames <= stop_frame)
+    if start_frame == stop_frame:
+        result[evolving] = animation.to  # vectortween divides by zero here; the animation completes at once
+    else:
+        t = _tween(animation.T.method, _linlin(frames[evolving], start_frame, stop_frame, 0, 1))
+        result[evolving] = _linlin(t, 0, 1, animation.frm, animation.to)
+    result[(frames < birth_frame) | (frames > death_frame)] = np.nan
+    return result
+
+
+def _sample_sequential(animation, frames, birth_frame, start_frame, stop_frame, death_frame):
+    animations = animation.ListOfAnimations
+    result = np.full(frames.shape + _value_shape(animations[0]), np.nan)
+    before = frames < start_frame
+    if before.any():
+        result[before] = sample(animations[0], frames[before], birth_frame, start_frame, stop_frame, death_frame)
+    after = frames > stop_frame
+    if after.any():
+        result[after] = sample(animations[-1], frames[after], birth_frame, start_frame, stop_frame, death_frame)
+
+    evolving = ~before & ~after
+    if start_frame == stop_frame:
+        if evolving.any():  # the animation completes at once, like a NumberAnimation with the same frames
+            result[evolving] = sample(animations[-1], frames[evolving], birth_frame, start_frame, stop_frame,
+                                      death_frame)
+        result[(frames < birth_frame) | (frames > death_frame)] = np.nan
+        return result
+    t = _tween(animation.T.method, _linlin(frames, start_frame, stop_frame, 0, 1))
+    unassigned = evolving & ~np.isnan(t)
+    cumulative_weights = animation.CumulativeNormalizedTimeWeights
+    for i, w in enumerate(cumulative_weights):
+        selected = unassigned & (t <= w)
+        if not selected.any():
+            continue
+        relative_start_frame = 0 if i == 0 else cumulative_weights[i - 1]
+        relative_stop_frame = cumulative_weights[i]
+        abs_start_frame = _linlin(relative_start_frame, 0, 1, start_frame, stop_frame)
+        abs_stop_frame = _linlin(relative_stop_frame, 0, 1, start_frame, stop_frame)
+        result[selected] = sample(animations[i], frames[selected], birth_frame, float(abs_start_frame),
+                                  float(abs_stop_frame), death_frame)
+        unassigned &= ~selected
+
+    result[(frames < birth_frame) | (frames > death_frame)] = np.nan
+    return result
+
+
+def _value_shape(animation):
+    """
+    :return: () for animations of numbers, (2,) for animations of points
+    """
+    if isinstance(animation, PointAnimation):
+        return (2,)
+    if isinstance(animation, (SequentialAnimation, SumAnimation)):
+        children = animation.ListOfAnimations if isinstance(animation, SequentialAnimation) else animation.list_of_animations
+        if children:
+            return _value_shape(children[0])
+    return ()
+
+
+def sample(animation, frames, birth_frame, start_frame, stop_frame, death_frame):
+    """
+    evaluates a vectortween animation for many frames at once
+    :param animation: a NumberAnimation, PointAnimation, SumAnimation or SequentialAnimation
+    :param frames: numpy array of frame numbers
+    :param birth_frame: frame before which the animation has no value
+    :param start_frame: frame from which the animation starts to evolve
+    :param stop_frame: frame in which the animation is completed
+    :param death_frame: frame after which the animation has no value
+    :return: numpy array with one value (NumberAnimation) or one (x, y) row (PointAnimation) per frame;
+             frames for which vectortween returns None contain NaN
+    """
+    frames = np.asarray(frames, dtype=float)
+    if isinstance(animation, NumberAnimation):
+        if animation.noise_fn is not None:
+            raise TypeError("Animations with a noise function cannot be sampled.")
+        return _sample_number(animation, frames, birth_frame, start_frame, stop_frame, death_frame)
+    if isinstance(animation, PointAnimation):
+        if animation.xy_noise_fn is not None:
+            raise TypeError("Animations with a noise function cannot be sampled.")
+        return np.stack([sample(animation.anim_x, frames, birth_frame, start_frame, stop_frame, death_frame),
+                         sample(animation.anim_y, frames, birth_frame, start_frame, stop_frame, death_frame)], axis=-1)
+    if isinstance(animation, SumAnimation):
+        if not animation.list_of_animations:
+            return np.full(frames.shape, np.nan)
+        total = 0
+        for element in animation.list_of_animations:
+            total = total + sample(element, frames, birth_frame, start_frame, stop_frame, death_frame)
+        return total
+    if isinstance(animation, SequentialAnimation):
+        return _sample_sequential(animation, frames, birth_frame, start_frame, stop_frame, death_frame)
+    raise TypeError(f"Animations of type {type(animation).__name__} cannot be sampled.")
+
+
+def sample_frame(animation, frame, birth_frame, start_frame, stop_frame, death_frame):
+    """
+    evaluates a vectortween animation for a single (possibly fractional) frame, with the same results as sample:
+    an animation that starts and stops on the same frame completes at once instead of making vectortween raise a
+    TypeError (division by zero)
+    :param animation: a vectortween animation
+    :param frame: frame number
+    :return: what vectortween's animation.make_frame returns (None, a number, or an (x, y) tuple for points)
+    """
+    try:
+        return _to_python(sample(animation, [frame], birth_frame, start_frame, stop_frame, death_frame).tolist()[0])
+    except TypeError:  # e.g. animations with a noise function
+        if start_frame == stop_frame == frame:
+            # in any later frame vectortween holds the final value, so let the animation end one frame earlier
+            start_frame = stop_frame = frame - 1
+        return animation.make_frame(frame, birth_frame, start_frame, stop_frame, death_frame)
+
+
+def _to_python(value):
+    """
+    converts one sampled value back into what vectortween would return (None instead of NaN, tuples for points)
+    """
+    if isinstance(value, list):
+        return tuple(_to_python(v) for v in value)
+    return None if value != value else value
+
+
+class Timeline(object):
+    """
+    Precomputed values of a list of AnimationBindings for every frame in the clip, so that generating a frame
+    becomes a lookup instead of evaluating the animations.
+    """
+    def __init__(self, bindings, nr_of_frames):
+        """
+        :param bindings: list of AnimationBindings (see CaptionGenerator._bind_animations)
+        :param nr_of_frames: number of frames to precompute (frame 0 up to and including frame nr_of_frames)
+        """
+        self.nr_of_frames = nr_of_frames
+        frames = np.arange(nr_of_frames + 1, dtype=float)
+        self.values = []
+        for binding in bindings:
+            try:
+                samples = sample(binding.animation, frames, binding.birth_frame, binding.begin_frame,
+                                 binding.end_frame, binding.death_frame)
+            except TypeError:
+                samples = None  # evaluated frame by frame instead
+            self.values.append(None if samples is None else [_to_python(v) for v in samples.tolist()])
+
+    def lookup(self, binding_index, current_frame):
+        """
+        :param binding_index: index of the binding in the list of bindings the timeline was built from
+        :param current_frame: current frame in the animation
+        :return: tuple of (found, value); found is False if the value was not precomputed
+        """
+        frame_index = int(round(current_frame))
+        if abs(current_frame - frame_index) > 1e-6 or not 0 <= frame_index <= self.nr_of_frames:
+            return False, None
+        values = self.values[binding_index]
+        if values is None:
+            return False, None
+        return True, values[frame_index]
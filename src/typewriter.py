@@ -0,0 +1,125 @@
+import math
+import unicodedata
+from vectortween.Mapping import Mapping
+
+ZERO_WIDTH_JOINER = "\u200d"
+
+
+def _hangul_kind(character):
+    """
+    helper function to classify hangul jamo and syllables (for the grapheme cluster rules)
+    :return: one of 'L', 'V', 'T', 'LV', 'LVT', or None for other characters
+    """
+    code = ord(character)
+    if 0x1100 <= code <= 0x115F or 0xA960 <= code <= 0xA97C:
+        return 'L'
+    if 0x1160 <= code <= 0x11A7 or 0xD7B0 <= code <= 0xD7C6:
+        return 'V'
+    if 0x11A8 <= code <= 0x11FF or 0xD7CB <= code <= 0xD7FB:
+        return 'T'
+    if 0xAC00 <= code <= 0xD7A3:
+        return 'LV' if (code - 0xAC00) % 28 == 0 else 'LVT'
+    return None
+
+
+def _extends(character):
+    """
+    helper function to check if a character belongs to the grapheme cluster of the character before it:
+    combining marks, variation selectors, emoji skin tone modifiers, tag characters and the zero width joiner
+    """
+    code = ord(character)
+    return (unicodedata.category(character) in ('Mn', 'Mc', 'Me')
+            or character == ZERO_WIDTH_JOINER
+            or 0x1F3FB <= code <= 0x1F3FF
+            or 0xE0020 <= code <= 0xE007F)
+
+
+def _is_regional_indicator(character):
+    return 0x1F1E6 <= ord(character) <= 0x1F1FF
+
+
+def grapheme_boundaries(text):
+    """
+    splits a text in user-perceived characters (a simplified version of the extended grapheme clusters of
+    unicode annex #29), so that combining characters, emoji sequences and flags are never split
+    :param text: a string
+    :return: list with the index in text at which every grapheme cluster starts, followed by len(text)
+    """
+    boundaries = []
+    previous = None
+    regional_indicators = 0  # number of regional indicators in a row (flags are pairs of them)
+    for index, character in enumerate(text):
+        joins = False
+        if previous is not None:
+            if previous == "\r" and character == "\n":
+                joins = True
+            elif previous in "\r\n":
+                joins = False
+            elif _extends(character) or previous == ZERO_WIDTH_JOINER:
+                joins = True
+            elif _is_regional_indicator(character) and regional_indicators % 2 == 1:
+                joins = True
+            else:
+                previous_kind, kind = _hangul_kind(previous), _hangul_kind(character)
+                joins = ((previous_kind == 'L' and kind in ('L', 'V', 'LV', 'LVT'))
+                         or (previous_kind in ('LV', 'V') and kind in ('V', 'T'))
+                         or (previous_kind in ('LVT', 'T') and kind == 'T'))
+        if not joins:
+            boundaries.append(index)
+        regional_indicators = regional_indicators + 1 if _is_regional_indicator(character) else 0
+        previous = character
+    boundaries.append(len(text))
+    return boundaries
+
+
+class TypewriterIndex(object):
+    """
+    Precomputed structure to reveal the text of a caption line (spread over its segments) like a typewriter.
+    The text is split in grapheme clusters once; revealing part of it then only computes one slice per segment.
+    """
+    def __init__(self, line, text_per_segment):
+        """
+        :param line: name of the caption line (used in the placeholder names text_<line>_<segment>)
+        :param text_per_segment: dictionary with the text of every segment of the line, in order
+        """
+        self.texts = [text for text in text_per_segment.values()]
+        self.placeholders = [f"text_{line}_{segment}" for segment in text_per_segment]
+        self.boundaries = [grapheme_boundaries(text) for text in self.texts]
+        self.offsets = []  # number of grapheme clusters in the segments before every segment
+        total = 0
+        for boundaries in self.boundaries:
+            self.offsets.append(total)
+            total += len(boundaries) - 1
+        self.length = total
+
+    def visible_count(self, animated_value):
+        """
+        :param animated_value: value between -100 and 100; 0 reveals 1 grapheme cluster, 100 (or -100) all of them
+        :return: number of grapheme clusters that are visible
+        """
+        end_index = Mapping.linlin(abs(animated_value), 0, 100, 0, self.length - 1, clip=True)
+        if end_index < 0:
+            return 0
+        return min(self.length, int(math.floor(end_index)) + 1)
+
+    def reveal(self, animated_value):
+        """
+        :param animated_value: value between -100 and 100 to indicate how much of the text is visible; positive
+                               values reveal the text from front to back, negative values from back to front.
+                               None hides the complete text.
+        :return: dictionary of placeholder name to the visible part of the text of every segment
+        """
+        if animated_value is None:
+            return {placeholder: "" for placeholder in self.placeholders}
+        count = self.visible_count(animated_value)
+        if animated_value >= 0:
+            first, last = 0, count  # range of visible grapheme clusters in the complete line
+        else:
+            first, last = self.length - count, self.length
+        values = {}
+        for placeholder, text, boundaries, offset in zip(self.placeholders, self.texts, self.boundaries, self.offsets):
+            nr_of_clusters = len(boundaries) - 1
+            begin = min(max(first - offset, 0), nr_of_clusters)
+            end = min(max(last - offset, 0), nr_of_clusters)
+            values[placeholder] = text[boundaries[begin]:boundaries[end]] if begin < end else ""
+        return values
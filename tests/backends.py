@@ -0,0 +1,11 @@
+import os
+import shutil
+from captiongenerator import CaptionGenerator
+from rasterizer import available_backends
+
+# inkscape is looked up in the CAMALA_INKSCAPE environment variable, then on the PATH, then in the default location
+INKSCAPE = os.environ.get('CAMALA_INKSCAPE') or shutil.which('inkscape') or CaptionGenerator("").inkscape
+HAS_INKSCAPE = os.path.exists(INKSCAPE)
+HAS_CAIROSVG = 'cairosvg' in available_backends()
+# real rasterizer backends that can be used to render the tests on this machine
+REAL_BACKENDS = (['inkscape'] if HAS_INKSCAPE else []) + (['cairosvg'] if HAS_CAIROSVG else [])
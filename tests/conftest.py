@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the modules in src import each other by name, like when captiongenerator.py is run from src
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent.joinpath("src")))
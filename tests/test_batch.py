@@ -0,0 +1,56 @@
+import contextlib
+import io
+from pathlib import Path
+import pytest
+from batch import is_up_to_date, write_stamp, job_digest, run_batch, plan_workers
+from renderoptions import RenderOptions
+
+SPEC = Path(__file__).absolute().parent.parent / "examples" / "gettingstarted" / "simple.toml"
+TEMPLATES = Path(__file__).absolute().parent.parent / "src" / "templates"
+
+
+@pytest.mark.parametrize("video_format, produced", [('gif', "simple.gif"), ('mp4', "simple.mp4"),
+                                                    ('png', "simple_00000000.png"), ('svg', "simple.index.json")])
+def test_up_to_date_needs_the_files_of_the_format(tmp_path, video_format, produced):
+    output = str(tmp_path / "simple")
+    write_stamp(output, "digest", str(SPEC), video_format)
+    # files of other jobs and of the job itself that aren't its result don't count
+    for other in ("simple.log", "simple-colorchange.gif", "simple-colorchange_00000000.png", "simple.manifest.json"):
+        (tmp_path / other).write_text("")
+    assert not is_up_to_date(output, "digest")
+    (tmp_path / produced).write_text("")
+    assert is_up_to_date(output, "digest")
+    assert not is_up_to_date(output, "other digest")
+
+
+def test_stamps_without_a_format_are_outdated(tmp_path):
+    output = str(tmp_path / "simple")
+    (tmp_path / "simple.gif").write_text("")
+    (tmp_path / "simple.camala-stamp").write_text('{"digest": "digest", "spec": "simple.toml"}')
+    assert not is_up_to_date(output, "digest")
+    (tmp_path / "simple.camala-stamp").write_text('not json')
+    assert not is_up_to_date(output, "digest")
+
+
+def test_digest_depends_on_the_options_that_change_the_output():
+    digest = job_digest(str(SPEC), str(TEMPLATES), RenderOptions())
+    assert job_digest(str(SPEC), str(TEMPLATES), RenderOptions(jobs=4, cache_dir="cache", profile=True)) == digest
+    assert job_digest(str(SPEC), str(TEMPLATES), RenderOptions(scale=0.5)) != digest
+
+
+def test_up_to_date_jobs_are_skipped(tmp_path):
+    options = RenderOptions()
+    output = str(tmp_path / "simple")
+    write_stamp(output, job_digest(str(SPEC), str(TEMPLATES), options), str(SPEC), 'gif')
+    (tmp_path / "simple.gif").write_text("")
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = run_batch([(str(SPEC), output)], options, 2)
+    assert [entry['status'] for entry in summary] == ['skipped']
+    assert not (tmp_path / "simple.log").exists()  # nothing was rendered
+
+
+def test_plan_workers_shares_the_budget():
+    assert plan_workers(8, 1) == (1, 8)
+    assert plan_workers(8, 2) == (2, 4)
+    assert plan_workers(8, 20) == (8, 1)
+    assert plan_workers(3, 2) == (2, 1)
@@ -0,0 +1,69 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from pathlib import Path
+from backends import INKSCAPE, HAS_INKSCAPE, HAS_CAIROSVG
+from captiongenerator import CaptionGenerator
+from conformance import check_spec, compare_frames
+from rasterizer import make_rasterizer
+from renderoptions import RenderOptions
+
+EXAMPLES = sorted(Path(__file__).absolute().parent.parent.joinpath("examples", "gettingstarted").glob("*.toml"))
+FRAMES = 3
+SCALE = 0.5
+TOLERANCE = 32  # maximum difference per color channel for a pixel to count as equal
+MAX_MISMATCH = 2.0  # maximum percentage of differing pixels per frame
+
+needs_inkscape = pytest.mark.skipif(not HAS_INKSCAPE, reason="inkscape not found (set CAMALA_INKSCAPE)")
+needs_cairosvg = pytest.mark.skipif(not HAS_CAIROSVG, reason="cairosvg not installed (pip install cairosvg)")
+
+
+@pytest.fixture(scope="module")
+def inkscape():
+    with make_rasterizer(INKSCAPE) as rasterizer:
+        yield rasterizer
+
+
+@pytest.fixture(scope="module")
+def cairo():
+    with make_rasterizer(INKSCAPE, backend='cairosvg') as rasterizer:
+        yield rasterizer
+
+
+def test_compare_frames():
+    reference = np.zeros((10, 10, 3), dtype=np.uint8)
+    candidate = reference.copy()
+    candidate[0, :5] = 255  # 5 of 100 pixels differ
+    candidate[1, 0] = 10  # within the tolerance
+    mismatching, mean_difference = compare_frames(reference, candidate, tolerance=32)
+    assert mismatching == pytest.approx(5.0)
+    assert mean_difference == pytest.approx((5 * 3 * 255 + 3 * 10) / 300)
+
+
+@needs_cairosvg
+@pytest.mark.parametrize("spec", EXAMPLES, ids=lambda spec: spec.stem)
+def test_cairosvg_renders_example(spec, cairo):
+    c = CaptionGenerator("", RenderOptions(scale=0.25))
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert c.initialize_from_file(str(spec))
+    W, H = c.frame_size()
+    frame = cairo.rasterize(c.make_svg(c.duration() / 2), W, H, None)
+    assert frame.shape == (H, W, 4)
+
+
+def uses_filters(spec):
+    return "[Filters" in spec.read_text(encoding="utf-8")
+
+
+@needs_inkscape
+@needs_cairosvg
+@pytest.mark.parametrize("spec", [pytest.param(spec, marks=pytest.mark.xfail(
+    reason="cairosvg doesn't support all svg filter primitives")) if uses_filters(spec) else spec
+                                  for spec in EXAMPLES], ids=lambda spec: spec.stem)
+def test_cairosvg_matches_inkscape(spec, inkscape, cairo):
+    results = check_spec(spec, inkscape, cairo, FRAMES, SCALE, TOLERANCE)
+    assert results is not None, "specification could not be loaded"
+    for t, mismatching, mean_difference in results:
+        assert mismatching <= MAX_MISMATCH, \
+            f"t={t:.2f}s: {mismatching:.2f}% of the pixels differ (mean difference {mean_difference:.1f})"
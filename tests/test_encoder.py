@@ -0,0 +1,78 @@
+import threading
+import numpy as np
+import pytest
+from moviepy.editor import VideoFileClip
+from encoder import FFmpegEncoder, encoder_settings
+
+
+def frames(width, height, count=12):
+    """
+    :return: list of RGB frames with a moving gradient
+    """
+    x = np.arange(width)[None, :, None]
+    y = np.arange(height)[:, None, None]
+    return [np.broadcast_to((x * 2 + y * 3 + index * 8 + np.array([0, 40, 80])) % 256, (height, width, 3))
+            .astype(np.uint8) for index in range(count)]
+
+
+def encode(filename, width, height, video_format='mp4', **options):
+    encoder = FFmpegEncoder(str(filename), width, height, 25, **{**encoder_settings(video_format), **options})
+    for frame in frames(width, height):
+        assert encoder.write_frame(frame)
+    return encoder.close()
+
+
+def test_same_frames_give_the_same_file(tmp_path):
+    assert encode(tmp_path / "a.mp4", 64, 48)
+    assert encode(tmp_path / "b.mp4", 64, 48)
+    assert (tmp_path / "a.mp4").read_bytes() == (tmp_path / "b.mp4").read_bytes()
+
+
+def test_odd_sizes_are_padded_for_chroma_subsampling(tmp_path):
+    assert encode(tmp_path / "odd.mp4", 33, 17)
+    clip = VideoFileClip(str(tmp_path / "odd.mp4"))
+    try:
+        assert tuple(clip.size) == (34, 18)
+        decoded = clip.get_frame(0).astype(int)
+    finally:
+        clip.close()
+    # the padding is added at the right and bottom edge; the frame itself is kept (up to compression)
+    assert np.abs(decoded[:17, :33] - frames(33, 17)[0]).mean() < 12
+
+
+def test_odd_sizes_are_kept_without_chroma_subsampling(tmp_path):
+    assert encode(tmp_path / "odd.mp4", 33, 17, pix_fmt='yuv444p')
+    clip = VideoFileClip(str(tmp_path / "odd.mp4"))
+    try:
+        assert tuple(clip.size) == (33, 17)
+    finally:
+        clip.close()
+
+
+def finishes(function, timeout=30):
+    """
+    :return: True if function returns within timeout seconds
+    """
+    thread = threading.Thread(target=function, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_write_fails_fast_when_ffmpeg_exits_early(tmp_path, capsys):
+    encoder = FFmpegEncoder(str(tmp_path / "broken.mp4"), 64, 48, 25, codec='no-such-codec', queue_size=2)
+    results = []
+    assert finishes(lambda: results.extend(encoder.write_frame(frame) for frame in frames(64, 48, count=50)))
+    assert not results[-1]
+    assert not encoder.close()
+    assert "ffmpeg failed" in capsys.readouterr().out
+
+
+def test_write_fails_fast_when_the_writer_thread_stopped(tmp_path, capsys):
+    encoder = FFmpegEncoder(str(tmp_path / "stopped.mp4"), 64, 48, 25, queue_size=2)
+    encoder.frames.put(None)  # makes the writer thread stop
+    encoder.writer.join()
+    results = []
+    assert finishes(lambda: results.extend(encoder.write_frame(frame) for frame in frames(64, 48, count=10)))
+    assert results == [False] * 10
+    assert finishes(encoder.close)
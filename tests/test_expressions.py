@@ -0,0 +1,128 @@
+import contextlib
+import io
+import math
+import pytest
+from pathlib import Path
+from captiongenerator import CaptionGenerator
+from expressions import ExpressionEvaluator, ExpressionError, clamp
+
+
+def evaluate(expr, **global_section):
+    return ExpressionEvaluator(global_section).evaluate(expr, "Animations.Position.slide.begin")
+
+
+def test_constant_folding():
+    assert evaluate("3") == 3
+    assert evaluate(" 1 + 2*3 - 4/8 ") == 6.5
+    assert evaluate("7 // 2 + 7 % 2 + 2**3") == 12
+    assert evaluate("-(2) + +3") == 1
+    assert evaluate("[1, -2.5, 2*3]") == [1, -2.5, 6]
+    assert evaluate("[[0, 1], [2, 3]]") == [[0, 1], [2, 3]]
+
+
+def test_functions_and_constants():
+    assert evaluate("clamp(3, 0, 2)") == 2
+    assert evaluate("clamp(-1, 0, 2)") == 0
+    assert evaluate("clamp(1.5, 0, 2)") == 1.5
+    assert evaluate("min(3, 1, 2) + max(3, 1, 2)") == 4
+    assert evaluate("sqrt(16) + abs(-2)") == 6
+    assert evaluate("sin(pi/2) + cos(0) + tan(0)") == pytest.approx(2)
+    assert evaluate("2*pi") == pytest.approx(2 * math.pi)
+    assert clamp(5, 0, 10) == 5
+
+
+def test_global_references():
+    assert evaluate("${Global.W}", W="1920") == 1920
+    assert evaluate("[0.5*${Global.W}, ${Global.H}/2]", W="1920", H="1080") == [960, 540]
+    assert evaluate("max(${Global.duration}-2, 1)", duration="${Global.fps}/5", fps="25") == 3
+    evaluator = ExpressionEvaluator({'W': "1920"})
+    assert evaluator.global_value('W') == 1920
+    with pytest.raises(ExpressionError, match="Global.H is referenced, but not defined"):
+        evaluator.global_value('H')
+
+
+def test_results_are_cached_and_lists_are_copies():
+    evaluator = ExpressionEvaluator({'W': "100"})
+    first = evaluator.evaluate("[${Global.W}, 2]", "a")
+    first.append(3)
+    assert evaluator.evaluate("[${Global.W}, 2]", "b") == [100, 2]
+    assert set(evaluator.cache) == {"[${Global.W}, 2]", "100"}
+
+
+def test_values_that_are_not_strings_are_returned_unchanged():
+    assert evaluate(5) == 5
+    assert evaluate(None) is None
+    values = [1, 2]
+    assert evaluate(values) is values
+
+
+@pytest.mark.parametrize("expr", ["red", "hello world", "1 +", "mx(1, 2)", "__import__('os')",
+                                  "(1).real", "'text'", "True", "[1, x]", "clamp(value=1)", "lambda: 1"])
+def test_strings_that_are_not_formulas_are_returned_unchanged(expr):
+    assert evaluate(expr) == expr
+
+
+@pytest.mark.parametrize("global_section, message", [
+    ({'W': "${Global.W}"}, "Global.W refers to itself"),
+    ({'W': "${Global.H}", 'H': "${Global.W}+1"}, "Global.W refers to itself"),
+    ({'W': "${Global.H}*2", 'H': "${Global.D}", 'D': "${Global.H}"}, "Global.H refers to itself"),
+    ({'W': "[${Global.H}, ${Global.H}]", 'H': "1"}, None),  # referring to a global twice is fine
+])
+def test_circular_globals(global_section, message):
+    evaluator = ExpressionEvaluator(global_section)
+    if message is None:
+        assert evaluator.global_value('W') == [1, 1]
+    else:
+        with pytest.raises(ExpressionError, match=message):
+            evaluator.global_value('W')
+    assert not evaluator.busy  # a failed evaluation doesn't leave globals marked as busy
+
+
+@pytest.mark.parametrize("expr, global_section, message", [
+    ("1/0", {}, "evaluating '1/0' failed"),
+    ("sqrt(-1)", {}, "evaluating 'sqrt\\(-1\\)' failed"),
+    ("clamp(1)", {}, "evaluating 'clamp\\(1\\)' failed"),
+    ("[1, 2] - 1", {}, "evaluating '\\[1, 2\\] - 1' failed"),
+    ("${Global.color}*2", {'color': "red"}, "Global.color = 'red' is not a number"),
+])
+def test_formulas_that_cannot_be_evaluated(expr, global_section, message):
+    with pytest.raises(ExpressionError, match="Invalid expression in Animations.Position.slide.begin: ") as e:
+        evaluate(expr, **global_section)
+    assert e.match(message)
+
+
+def test_undefined_globals():
+    with pytest.raises(ExpressionError, match="Global.missing is referenced, but not defined in the .Global. section"):
+        evaluate("2*${Global.missing}")
+
+
+SPEC = Path(__file__).absolute().parent.parent / "examples" / "gettingstarted" / "position-animation.toml"
+
+
+def initialize(*replacements):
+    contents = SPEC.read_text("utf-8")
+    for old, new in replacements:
+        assert old in contents
+        contents = contents.replace(old, new)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        ok = CaptionGenerator("").initialize_from_string(contents)
+    return ok, output.getvalue()
+
+
+def test_errors_are_reported_with_their_place_in_the_spec():
+    ok, output = initialize(('begin = "[0, -${Global.H}/3]"', 'begin = "[0, -${Global.H}/0]"'))
+    assert not ok
+    assert "Invalid expression in Animations.Position.top_to_bottom.begin: evaluating '[0, -${Global.H}/0]' failed" in output
+    ok, output = initialize(('duration = "1"', 'duration = "${Global.duration}"'))
+    assert not ok
+    assert "Global.duration refers to itself" in output
+
+
+def test_values_that_are_not_numbers_are_reported_where_a_number_is_expected():
+    ok, output = initialize(('duration = "1"', 'duration = "one"'))
+    assert not ok
+    assert "Global.duration = 'one' is not a number" in output
+    ok, output = initialize(('begin = "[0, -${Global.H}/3]"', 'begin = "[0, minus_a_third]"'))
+    assert not ok
+    assert "Animations.Position.top_to_bottom.begin" in output
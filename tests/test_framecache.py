@@ -0,0 +1,33 @@
+import os
+import numpy as np
+from framecache import DiskFrameCache, FrameCache
+
+
+def test_disk_cache_size_when_a_frame_is_written_again(tmp_path):
+    cache = DiskFrameCache(tmp_path)
+    key = DiskFrameCache.key(FrameCache.key("<svg/>", 4, 4, None), "test", "whole")
+    cache.put(key, np.zeros((4, 4, 4), dtype=np.uint8))
+    size = cache.size
+    cache.put(key, np.zeros((4, 4, 4), dtype=np.uint8))
+    assert cache.size == size == os.path.getsize(cache._path(key))
+    cache.put(key, np.zeros((8, 8, 4), dtype=np.uint8))
+    assert cache.size == os.path.getsize(cache._path(key))
+
+
+def test_disk_cache_key_depends_on_the_layer_mode():
+    frame_key = FrameCache.key("<svg/>", 4, 4, None)
+    keys = {DiskFrameCache.key(frame_key, "test", mode) for mode in ('whole', 'static-layers', 'per-line')}
+    assert len(keys) == 3
+
+
+def test_frame_cache_copies_read_only_frames():
+    cache = FrameCache()
+    buffer = np.zeros((4, 4, 3), dtype=np.uint8)
+    view = buffer.view()
+    view.flags.writeable = False
+    kept = cache.put("a", view)
+    assert kept is not view and kept.flags.writeable and not np.shares_memory(kept, buffer)
+    buffer[:] = 1  # e.g. the rasterizer decodes the next frame
+    assert not cache.get("a").any()
+    frame = np.ones((4, 4, 3), dtype=np.uint8)
+    assert cache.put("b", frame) is frame  # frames that nobody overwrites are kept as they are
@@ -0,0 +1,105 @@
+import numpy as np
+import PIL.Image
+import pytest
+from gifwriter import build_palette, quantize, GifWriter, DITHER_METHODS
+
+COLORS = np.array([[0, 0, 0], [255, 255, 255], [200, 30, 40], [20, 120, 220]], dtype=np.uint8)
+
+
+def frame(width=40, height=30, color=1, box=None):
+    """
+    :return: RGB frame with a background in COLORS[0] and a rectangle (left, top, right, bottom) in COLORS[color]
+    """
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    if box is not None:
+        left, top, right, bottom = box
+        pixels[top:bottom, left:right] = COLORS[color]
+    return pixels
+
+
+def palette_colors(palette):
+    data = palette.getpalette()
+    return {tuple(data[i:i + 3]) for i in range(0, len(data), 3)}
+
+
+def read_gif(filename):
+    """
+    :return: list of (RGB frame, duration in ms, (left, top, right, bottom) of the part stored for the frame)
+    """
+    frames = []
+    with PIL.Image.open(filename) as gif:
+        for index in range(gif.n_frames):
+            gif.seek(index)
+            frames.append((np.array(gif.convert("RGB")), gif.info["duration"], gif.dispose_extent))
+    return frames
+
+
+def test_build_palette_keeps_the_colors_of_the_samples():
+    samples = [frame(color=color, box=(5, 5, 20, 20)) for color in (1, 2, 3)]
+    palette = build_palette(samples)
+    assert palette.mode == "P"
+    assert {tuple(c) for c in COLORS} <= palette_colors(palette)
+    # subsampling the samples doesn't lose large areas of color
+    assert {tuple(c) for c in COLORS} <= palette_colors(build_palette(samples, max_pixels=100))
+
+
+def test_build_palette_limits_the_number_of_colors():
+    gradient = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    palette = build_palette([gradient], colors=16)
+    assert len(set(np.asarray(quantize(gradient, palette)).ravel())) <= 16
+
+
+@pytest.mark.parametrize("dither", DITHER_METHODS)
+def test_quantize_maps_palette_colors_onto_themselves(dither):
+    sample = frame(color=2, box=(0, 0, 20, 30))
+    sample[:, 20:] = COLORS[3]
+    palette = build_palette([sample], colors=4)
+    indices = quantize(sample, palette, dither)
+    assert indices.shape == (30, 40)
+    colors = np.array(palette.getpalette(), dtype=np.uint8).reshape(-1, 3)
+    if dither == 'none':
+        assert np.array_equal(colors[indices], sample)
+    else:  # dithering a flat area of a color that is in the palette should hardly change it
+        assert np.mean(np.all(colors[indices] == sample, axis=2)) > 0.9
+
+
+def test_quantize_ignores_the_alpha_channel():
+    sample = frame(color=3, box=(4, 4, 12, 12))
+    palette = build_palette([sample])
+    rgba = np.concatenate([sample, np.full((30, 40, 1), 128, dtype=np.uint8)], axis=2)
+    assert np.array_equal(quantize(rgba, palette), quantize(sample, palette))
+
+
+def test_gif_round_trip(tmp_path):
+    frames = [frame(),
+              frame(box=(2, 3, 10, 8)),
+              frame(box=(2, 3, 10, 8)),  # identical: extends the previous frame
+              frame(box=(2, 3, 10, 8)),
+              frame(color=2, box=(2, 3, 10, 8)),  # same place, other color
+              frame(color=2, box=(30, 20, 35, 28))]  # moved: the old and the new place change
+    filename = str(tmp_path / "roundtrip.gif")
+    writer = GifWriter(filename, 40, 30, 10, build_palette(frames), jobs=2)
+    for f in frames:
+        writer.write_frame(f)
+    writer.close()
+
+    decoded = read_gif(filename)
+    assert len(decoded) == 4
+    for (pixels, _, _), index in zip(decoded, (0, 1, 4, 5)):
+        assert np.array_equal(pixels, frames[index])
+    assert [duration for _, duration, _ in decoded] == [100, 300, 100, 100]
+    # only the part of a frame that differs from the previous frame is stored
+    assert [extent for _, _, extent in decoded] == [(0, 0, 40, 30), (2, 3, 10, 8), (2, 3, 10, 8), (2, 3, 35, 28)]
+
+
+def test_gif_durations_dont_accumulate_rounding_errors(tmp_path):
+    frames = [frame(box=(i, 0, i + 1, 1)) for i in range(30)]
+    filename = str(tmp_path / "timing.gif")
+    writer = GifWriter(filename, 40, 30, 30, build_palette(frames))
+    for f in frames:
+        writer.write_frame(f)
+    writer.close()
+    durations = [duration for _, duration, _ in read_gif(filename)]
+    assert len(durations) == 30
+    assert set(durations) <= {30, 40}  # 33.3 ms, rounded to centiseconds
+    assert sum(durations) == 1000
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import json
+from pathlib import Path
+from benchmark import BoxRasterizer, CountingRasterizer
+from captiongenerator import CaptionGenerator
+from incremental import FrameManifest, frame_ranges
+from renderoptions import RenderOptions
+
+SPEC = Path(__file__).absolute().parent.parent / "examples" / "gettingstarted" / "position-animation.toml"
+SETTINGS = {'rasterizer': 'test', 'fps': 25, 'static_layers': False, 'per_line': False}
+
+
+def test_frame_ranges():
+    assert frame_ranges([]) == ""
+    assert frame_ranges([4]) == "4"
+    assert frame_ranges([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 15, 20, 21, 22, 23, 24]) == "0-9, 15, 20-24"
+    assert frame_ranges([1, 3, 4]) == "1, 3-4"
+
+
+def test_changed_frames_compares_the_keys():
+    previous = FrameManifest(["a", "b", "c", "d"], SETTINGS)
+    assert FrameManifest(["a", "b", "c", "d"], dict(SETTINGS)).changed_frames(previous) == []
+    assert FrameManifest(["a", "x", "c", "y"], SETTINGS).changed_frames(previous) == [1, 3]
+    assert FrameManifest(["a", "b"], SETTINGS).changed_frames(None) == [0, 1]
+
+
+def test_changed_frames_after_a_settings_change():
+    previous = FrameManifest(["a", "b", "c"], SETTINGS)
+    for change in ({'rasterizer': 'other version'}, {'fps': 30}, {'per_line': True}):
+        assert FrameManifest(["a", "b", "c"], {**SETTINGS, **change}).changed_frames(previous) == [0, 1, 2]
+
+
+def test_changed_frames_after_a_duration_change():
+    previous = FrameManifest(["a", "b", "c"], SETTINGS)
+    assert FrameManifest(["a", "b", "c", "d", "e"], SETTINGS).changed_frames(previous) == [3, 4]
+    assert FrameManifest(["a", "b"], SETTINGS).changed_frames(previous) == []
+
+
+def test_manifests_of_another_version_are_ignored(tmp_path):
+    filename = str(tmp_path / "out.manifest.json")
+    FrameManifest(["a", "b"], SETTINGS).save(filename)
+    loaded = FrameManifest.load(filename)
+    assert (loaded.keys, loaded.settings) == (["a", "b"], SETTINGS)
+    contents = json.loads(Path(filename).read_text())
+    Path(filename).write_text(json.dumps({**contents, 'version': FrameManifest.VERSION + 1}))
+    assert FrameManifest.load(filename) is None
+    assert FrameManifest(["a", "b"], SETTINGS).changed_frames(FrameManifest.load(filename)) == [0, 1]
+    assert FrameManifest.load(str(tmp_path / "missing.json")) is None
+
+
+def render(tmp_path, video_format="png", duration="1"):
+    """
+    renders position-animation.toml at 10 fps in the given format and duration with --incremental
+    :return: tuple (number of rasterized frames, output base)
+    """
+    spec = tmp_path / "spec.toml"
+    spec.write_text(SPEC.read_text("utf-8").replace('format = "gif"', f'format = "{video_format}"')
+                    .replace('duration = "1"', f'duration = "{duration}"'), "utf-8")
+    rasterizer = CountingRasterizer(BoxRasterizer())
+    output = str(tmp_path / "out")
+    c = CaptionGenerator(output, RenderOptions(scale=0.25, render_fps=10, incremental=True), rasterizer=rasterizer)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert c.write_videofile(str(spec))
+    return rasterizer.calls, output
+
+
+def test_incremental_png_sequence(tmp_path):
+    calls, output = render(tmp_path)
+    assert calls > 0
+    frames = sorted(tmp_path.glob("out_*.png"))
+    assert len(frames) == 10
+    modified = {frame.name: frame.stat().st_mtime_ns for frame in frames}
+    assert render(tmp_path)[0] == 0  # nothing changed
+    assert {frame.name: frame.stat().st_mtime_ns for frame in tmp_path.glob("out_*.png")} == modified
+    render(tmp_path, duration="2")
+    assert len(list(tmp_path.glob("out_*.png"))) == 20
+    render(tmp_path, duration="0.5")
+    assert sorted(frame.name for frame in tmp_path.glob("out_*.png")) == [f"out_{i:08}.png" for i in range(5)]
+    assert not (tmp_path / "out.frames").exists()  # the png files are the frames of the previous render
+
+
+def test_incremental_only_applies_to_png_sequences(tmp_path):
+    render(tmp_path, video_format="gif")
+    assert (tmp_path / "out.gif").exists()
+    assert not (tmp_path / "out.manifest.json").exists() and not (tmp_path / "out.frames").exists()
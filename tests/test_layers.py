@@ -0,0 +1,199 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from pathlib import Path
+from backends import INKSCAPE, REAL_BACKENDS
+from benchmark import BoxRasterizer, CountingRasterizer
+from captiongenerator import CaptionGenerator
+from layers import LayerPlan, LinePlan, _filter_region, _touches_crop_edges, estimate_text_box
+from rasterizer import make_rasterizer
+from renderoptions import RenderOptions
+
+TESTS = Path(__file__).absolute().parent
+SPECS = sorted(TESTS.parent.joinpath("examples", "gettingstarted").glob("*.toml")) + [TESTS / "specs" / "layers.toml"]
+
+
+STYLE = "font-size: 20; font-family: sans-serif; fill: white; stroke: black; stroke-width: 2px"
+
+
+def document(body, style=STYLE, defs=""):
+    """
+    :return: svg document as generated from doc.svgtemplate, with a single class "normal" and the given body
+    """
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="1000" height="500" viewBox="-500 -250 1000 500">\n'
+            f'<defs>\n<style type="text/css">\n.normal {{ {style} }}\n</style>\n{defs}</defs>\n{body}</svg>\n')
+
+
+def line(text="Some text", anchor="start", attributes=""):
+    return (f'<text x="0" y="0" text-anchor="{anchor}" {attributes}>\n'
+            f'<tspan xml:space="preserve" class="normal">{text}</tspan>\n</text>')
+
+
+class WideTextRasterizer(BoxRasterizer):
+    """
+    BoxRasterizer that paints text wider than its estimated bounding box (by adding padding characters to every
+    tspan), and remembers the sizes it rasterized
+    """
+    def __init__(self, padding=120):
+        self.padding = padding
+        self.sizes = []
+
+    def rasterize(self, svg, width, height, background):
+        self.sizes.append((width, height))
+        return super().rasterize(svg.replace("</tspan>", "w" * self.padding + "</tspan>"), width, height, background)
+
+
+def generator(spec, rasterizer, **options):
+    c = CaptionGenerator(str(TESTS / "out"), RenderOptions(scale=0.25, **options), rasterizer=rasterizer)
+    c.frame_cache.max_bytes = 0  # every frame is really rendered
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert c.initialize_from_file(str(spec))
+    return c
+
+
+def max_difference(spec, rasterizer, nr_of_frames=8, **options):
+    """
+    :return: largest difference of a color channel between whole frames and frames rendered with options
+    """
+    whole = generator(spec, rasterizer)
+    layered = generator(spec, rasterizer, **options)
+    difference = 0
+    for t in np.linspace(0, whole.duration(), nr_of_frames, endpoint=False):
+        expected = whole.frame_maker(t).astype(np.int16)
+        actual = layered.frame_maker(t).astype(np.int16)
+        assert actual.shape == expected.shape
+        difference = max(difference, int(np.abs(actual - expected).max()))
+    return difference
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=lambda spec: spec.stem)
+def test_static_layers_match_whole_frames(spec):
+    assert max_difference(spec, BoxRasterizer(), static_layers=True) <= 1
+
+
+@pytest.mark.skipif(not REAL_BACKENDS, reason="no real rasterizer backend (inkscape or cairosvg) available")
+@pytest.mark.parametrize("backend", REAL_BACKENDS)
+@pytest.mark.parametrize("spec", SPECS, ids=lambda spec: spec.stem)
+def test_static_layers_match_whole_frames_with_real_backends(spec, backend):
+    # compositing anti-aliased layers rounds differently than rasterizing them together
+    with make_rasterizer(INKSCAPE, backend=backend) as rasterizer:
+        assert max_difference(spec, rasterizer, nr_of_frames=3, static_layers=True) <= 3
+
+
+def test_static_layers_are_split():
+    c = generator(TESTS / "specs" / "layers.toml", BoxRasterizer(), static_layers=True)
+    assert c.layer_plan.is_layered()
+    assert [(group.names, group.static) for group in c.layer_plan.groups] == [
+        (['under'], True), (['line Line1'], False), (['line Line2', 'over'], True)]
+
+
+def test_static_pixels_follow_the_frame_size():
+    c = generator(TESTS / "specs" / "layers.toml", BoxRasterizer(), static_layers=True)
+    plan = LayerPlan(c.svg_skeleton, {'Line1_x', 'Line1_y'}, list(c.spec['Caption']))
+    values = c._resolve_placeholder_values(0)
+    rasterizer = BoxRasterizer()
+    for width, height in [(100, 50), (40, 20), (100, 50)]:
+        frame = plan.render(values, lambda svg, w, h: rasterizer.rasterize(svg, w, h, None), width, height,
+                            "black", lambda name: contextlib.nullcontext())
+        assert frame.shape == (height, width, 3)
+        whole = rasterizer.rasterize(c.svg_plan.render(values), width, height, "black")
+        assert np.abs(frame.astype(np.int16) - whole).max() <= 1
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=lambda spec: spec.stem)
+def test_per_line_matches_whole_frames(spec):
+    # the examples include animated text, filters (textfilter, textfilters2) and transforms (complex, textpath)
+    assert max_difference(spec, BoxRasterizer(), per_line=True) <= 1
+
+
+@pytest.mark.skipif(not REAL_BACKENDS, reason="no real rasterizer backend (inkscape or cairosvg) available")
+@pytest.mark.parametrize("backend", REAL_BACKENDS)
+@pytest.mark.parametrize("spec", SPECS, ids=lambda spec: spec.stem)
+def test_per_line_matches_whole_frames_with_real_backends(spec, backend):
+    with make_rasterizer(INKSCAPE, backend=backend) as rasterizer:
+        assert max_difference(spec, rasterizer, nr_of_frames=3, per_line=True) <= 3
+
+
+def test_per_line_only_rasterizes_changed_lines():
+    rasterizer = CountingRasterizer(BoxRasterizer())
+    c = generator(TESTS / "specs" / "layers.toml", rasterizer, per_line=True)
+    assert [layer.name for layer in c.layer_plan.layers] == ['under', 'line Line1', 'line Line2', 'over']
+    first = c.frame_maker(0.5)
+    calls, hits = rasterizer.calls, c.layer_plan.cache.hits
+    assert calls == 4
+    assert np.array_equal(c.frame_maker(0.5), first)
+    assert rasterizer.calls == calls and c.layer_plan.cache.hits == hits + 4
+    c.frame_maker(0.52)  # only Line1 moves
+    assert rasterizer.calls == calls + 1
+
+
+def test_per_line_falls_back_when_the_estimate_is_too_small():
+    fitting, spilling = WideTextRasterizer(padding=0), WideTextRasterizer()
+    for rasterizer in (fitting, spilling):
+        assert max_difference(TESTS / "specs" / "layers.toml", rasterizer, nr_of_frames=2, per_line=True) <= 1
+    # lines that turn out to be wider than estimated are rasterized again as a complete frame
+    frame_size = fitting.sizes[0]
+    assert spilling.sizes.count(frame_size) > fitting.sizes.count(frame_size)
+
+
+def test_cropped_layers_match_the_complete_frame():
+    c = generator(TESTS / "specs" / "layers.toml", BoxRasterizer(), per_line=True)
+    plan = c.layer_plan
+    values = c._resolve_placeholder_values(0.5)
+    # the boxes of other elements depend on the viewBox in a BoxRasterizer, so only the caption lines are kept
+    svg = plan.prolog.render(values) + "".join(layer.plan.render(values) for layer in plan.layers[1:3]) + plan.epilog
+    width, height = c.frame_size()
+    whole = BoxRasterizer().rasterize(svg, width, height, None)
+    for box in [(10, 20, 60, 45), (0, 0, width, height), (width - 7, height - 3, width, height)]:
+        left, top, right, bottom = box
+        cropped = BoxRasterizer().rasterize(plan._cropped(svg, box, width, height), right - left, bottom - top, None)
+        assert np.array_equal(cropped, whole[top:bottom, left:right])
+
+
+def test_text_box_contains_the_text():
+    left, top, right, bottom = estimate_text_box(line(), document(line()))
+    assert left < 0 < right and top < -20 and bottom > 0
+    # 9 characters of at most 1.25 em each, plus the stroke
+    assert right - left >= 9 * 20
+    wider = estimate_text_box(line("Some longer text"), document(line("Some longer text")))
+    assert wider[2] > right
+    middle = estimate_text_box(line(anchor="middle"), document(line(anchor="middle")))
+    assert middle[0] == pytest.approx(-middle[2])
+    end = estimate_text_box(line(anchor="end"), document(line(anchor="end")))
+    assert end[0] < -9 * 20 and end[2] > 0
+
+
+def test_text_box_of_unsupported_lines():
+    # transforms, text on a path and styles that aren't understood can move the text anywhere
+    rotated = line(attributes='transform="rotate(30)"')
+    assert estimate_text_box(rotated, document(rotated)) is None
+    on_path = '<text x="0" y="0"><tspan class="normal"><textPath href="#p">text</textPath></tspan></text>'
+    assert estimate_text_box(on_path, document(on_path)) is None
+    assert estimate_text_box(line(), document(line(), style=STYLE + "; writing-mode: tb")) is None
+    assert estimate_text_box(line(), document(line(), style=STYLE + "; letter-spacing: -2px")) is None
+    spaced = estimate_text_box(line(), document(line(), style=STYLE + "; letter-spacing: 5px"))
+    assert spaced[2] - spaced[0] >= 9 * 25
+
+
+def test_text_box_includes_the_filter_region():
+    defs = '<filter id="shadow" x="-50%" y="-50%" width="200%" height="200%"><feOffset dx="20"/></filter>\n'
+    filtered = line(attributes='filter="url(#shadow)"')
+    box = estimate_text_box(line(), document(line()))
+    left, top, right, bottom = estimate_text_box(filtered, document(filtered, defs=defs))
+    assert (right - left, bottom - top) == pytest.approx((2 * (box[2] - box[0]), 2 * (box[3] - box[1])))
+    assert estimate_text_box(filtered, document(filtered)) is None  # unknown filter
+    assert _filter_region(document("", defs=defs), "shadow", (0, 0, 10, 10)) == pytest.approx((-5, -5, 15, 15))
+    assert _filter_region(document("", defs=defs.replace('x="-50%"', 'x="10%"')), "shadow", (0, 0, 10, 10)) is None
+    user_space = defs.replace('<filter ', '<filter filterUnits="userSpaceOnUse" ')
+    assert _filter_region(document("", defs=user_space), "shadow", (0, 0, 10, 10)) is None
+
+
+def test_touches_crop_edges():
+    pixels = np.zeros((10, 20, 4), dtype=np.uint8)
+    pixels[4:6, 5:15, 3] = 255
+    assert not _touches_crop_edges(pixels, (10, 10, 30, 20), 100, 50)
+    pixels[4:6, 0, 3] = 255
+    assert _touches_crop_edges(pixels, (10, 10, 30, 20), 100, 50)
+    # the edges of the frame are edges of the crop box that can't cut off visible pixels
+    assert not _touches_crop_edges(pixels, (0, 10, 20, 20), 100, 50)
@@ -0,0 +1,75 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from pathlib import Path
+from benchmark import BoxRasterizer
+from captiongenerator import CaptionGenerator
+from parallel import ParallelFrameRenderer, OrderedFrameSource
+from renderoptions import RenderOptions
+
+SPEC = Path(__file__).absolute().parent.parent / "examples" / "gettingstarted" / "position-animation.toml"
+
+
+def generator(**options):
+    c = CaptionGenerator("", RenderOptions(scale=0.25, **options), rasterizer=BoxRasterizer())
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert c.initialize_from_file(str(SPEC))
+    return c
+
+
+def serial_frames(c):
+    fps = c.output_fps()
+    return [c.frame_maker(index / fps).copy() for index in range(int(np.ceil(c.duration() * fps)))]
+
+
+def test_parallel_frames_match_serial_frames():
+    expected = serial_frames(generator())
+    fps = generator().output_fps()
+    times = [index / fps for index in range(len(expected))]
+    renderer = ParallelFrameRenderer(SPEC.read_text("utf-8"), 3, RenderOptions(scale=0.25), rasterizer=BoxRasterizer())
+    try:
+        rendered = list(renderer.iter_frames(times))
+    finally:
+        renderer.close()
+    assert [t for t, _ in rendered] == times
+    assert len({frame.tobytes() for frame in expected}) > 1  # the frames really differ
+    for (_, frame), serial in zip(rendered, expected):
+        assert np.array_equal(frame, serial)
+
+
+@pytest.mark.parametrize("stride", [1, 3])
+def test_parallel_clip_matches_serial_clip(stride):
+    expected = serial_frames(generator(frame_stride=stride))
+    c = generator(jobs=2, frame_stride=stride)
+    try:
+        frames = list(c._iter_frames(c.output_fps()))
+    finally:
+        c.parallel_renderer.close()
+    assert len(frames) == len(expected)
+    for frame, serial in zip(frames, expected):
+        assert np.array_equal(frame, serial)
+
+
+class StubRenderer(object):
+    """
+    stands in for a ParallelFrameRenderer: the frame at time t is ('stream', t)
+    """
+    def iter_frames(self, times):
+        return ((t, ('stream', t)) for t in times)
+
+
+def test_ordered_frame_source_falls_back_for_out_of_order_requests():
+    source = OrderedFrameSource(StubRenderer(), 10, 5, lambda t: ('fallback', t))
+    assert source.make_frame(0.0) == ('stream', 0.0)
+    assert source.make_frame(0.1) == ('stream', 0.1)
+    assert source.make_frame(0.0) == ('stream', 0.0)  # recently produced frames are remembered
+    assert source.make_frame(0.3) == ('stream', 0.3)  # frame 2 is skipped
+    assert source.make_frame(0.2) == ('fallback', 0.2)  # already passed in the stream
+    assert source.make_frame(0.4) == ('stream', 0.4)
+    assert source.make_frame(0.9) == ('fallback', 0.9)  # past the end of the stream
+
+
+def test_ordered_frame_source_repeats_frames_with_a_stride():
+    source = OrderedFrameSource(StubRenderer(), 10, 6, lambda t: ('fallback', t), stride=3)
+    assert [source.make_frame(index / 10) for index in range(6)] == [('stream', 0.0)] * 3 + [('stream', 0.3)] * 3
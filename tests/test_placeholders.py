@@ -0,0 +1,57 @@
+import contextlib
+import io
+import string
+import numpy as np
+import pytest
+from pathlib import Path
+from captiongenerator import CaptionGenerator
+from layers import strip_layer_markers
+from placeholders import PlaceholderPlan
+
+EXAMPLES = sorted(Path(__file__).absolute().parent.parent.joinpath("examples", "gettingstarted").glob("*.toml"))
+
+
+def substitute(svg, values):
+    """
+    fills in the placeholders the way frames were rendered before there was a PlaceholderPlan: string.Template for
+    the placeholders with simple names, and a search and replace over the document for the dotted ones
+    """
+    svg = string.Template(svg).safe_substitute({name: value for name, value in values.items() if name.isidentifier()})
+    for name, value in values.items():
+        if not name.isidentifier():
+            svg = svg.replace(f"${{{name}}}", str(value))
+    return svg
+
+
+def test_render_fills_in_the_placeholders():
+    plan = PlaceholderPlan('<text x="${Line1_x}" fill="${Animations.Style.c_for_style_h1}">${text}</text>')
+    assert plan.slot_names() == {'Line1_x', 'Animations.Style.c_for_style_h1', 'text'}
+    assert plan.missing({'Line1_x': 1}) == ['Animations.Style.c_for_style_h1', 'text']
+    assert plan.render({'Line1_x': 1.5, 'Animations.Style.c_for_style_h1': 'red', 'text': 'hi'}) == \
+        '<text x="1.5" fill="red">hi</text>'
+    # placeholders without a value are preserved
+    assert plan.render({'text': 'hi'}) == '<text x="${Line1_x}" fill="${Animations.Style.c_for_style_h1}">hi</text>'
+
+
+def test_escaped_and_nested_placeholders():
+    assert PlaceholderPlan("$${x} costs $$5 or $5").render({'x': 1}) == "${x} costs $5 or $5"
+    assert PlaceholderPlan("$$$${x}").render({'x': 1}) == "$${x}"
+    assert PlaceholderPlan("$$${x}").render({'x': 1}) == "$1"
+    assert PlaceholderPlan("$x ${ x}").render({'x': 1}) == "$x ${ x}"  # only ${name} is a placeholder
+    nested = PlaceholderPlan("${a${b}}")
+    assert nested.slot_names() == {'b'}
+    assert nested.render({'b': 'c', 'ac': 'no'}) == "${ac}"
+    # values are filled in as they are, even if they look like placeholders
+    assert PlaceholderPlan("${b}").render({'b': '${x} $$', 'x': 1}) == "${x} $$"
+
+
+@pytest.mark.parametrize("spec", EXAMPLES, ids=lambda spec: spec.stem)
+def test_plan_matches_substituting_every_frame(spec):
+    c = CaptionGenerator("")
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert c.initialize_from_file(str(spec))
+    skeleton = strip_layer_markers(c.svg_skeleton)
+    nr_of_frames = int(np.ceil(c.duration() * c.output_fps()))
+    for frame in np.linspace(0, nr_of_frames - 1, 7):
+        values = c._resolve_placeholder_values(frame)
+        assert c.svg_plan.render(values) == substitute(skeleton, values)
@@ -0,0 +1,88 @@
+import contextlib
+import io
+import threading
+import time
+from pathlib import Path
+import pytest
+import preview
+from benchmark import BoxRasterizer
+from preview import PreviewRenderer
+
+SPEC = Path(__file__).absolute().parent.parent / "examples" / "gettingstarted" / "position-animation.toml"
+
+
+@pytest.fixture
+def renderer(tmp_path, monkeypatch):
+    monkeypatch.setattr(preview, "make_rasterizer", lambda inkscape, backend='inkscape': BoxRasterizer())
+    spec = tmp_path / "spec.toml"
+    spec.write_text(SPEC.read_text("utf-8").replace('fps = "25"', 'fps = "10"'), "utf-8")
+    quiet_threads = []
+
+    @contextlib.contextmanager
+    def quiet():
+        quiet_threads.append(threading.get_ident())
+        yield
+
+    r = PreviewRenderer(str(spec), None, workers=3, max_width=100, quiet=quiet)
+    r.spec = spec
+    r.quiet_threads = quiet_threads
+    yield r
+    r.close()
+
+
+def wait_for(condition, timeout=30):
+    end = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < end, "timed out"
+        time.sleep(0.01)
+
+
+def collect(renderer, generation, nr_of_frames, timeout=30):
+    """
+    :return: dictionary of frame index to frame with the frames of a generation, once all of them arrived
+    """
+    frames = {}
+    end = time.perf_counter() + timeout
+    while len(frames) < nr_of_frames:
+        got_generation, index, frame = renderer.results.get(timeout=max(0.01, end - time.perf_counter()))
+        if got_generation == generation:
+            frames[index] = frame
+    return frames
+
+
+def test_reload_initializes_in_the_workers(renderer):
+    assert renderer.reload(position=4)
+    assert renderer.generators == [None] * 3  # nothing was initialized in the calling thread
+    wait_for(lambda: renderer.status() == 'ready')
+    assert renderer.generation == 1 and renderer.nr_of_frames == 10
+    frames = collect(renderer, 1, 10)
+    assert sorted(frames) == list(range(10))
+    assert all(frame is not None and frame.shape[1] == 100 for frame in frames.values())
+    wait_for(lambda: all(generator is not None for generator in renderer.generators))
+    assert len({id(generator) for generator in renderer.generators}) == 3
+    # every worker initialized its own generator in its own thread, quietly: only the probe reports warnings
+    assert len(set(renderer.quiet_threads)) == 3 and threading.get_ident() not in renderer.quiet_threads
+
+
+def test_failed_reload_keeps_the_last_valid_frames(renderer):
+    assert renderer.reload()
+    wait_for(lambda: renderer.status() == 'ready')
+    collect(renderer, 1, 10)
+    renderer.spec.write_text("[Global\nbroken", "utf-8")
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert renderer.reload()
+        wait_for(lambda: renderer.status() == 'failed')
+    assert renderer.generation == 1
+    renderer.request(0)
+    renderer.spec.write_text(SPEC.read_text("utf-8").replace('duration = "1"', 'duration = "0.5"'), "utf-8")
+    assert renderer.reload()
+    wait_for(lambda: renderer.status() == 'ready')
+    assert renderer.generation == 2 and renderer.nr_of_frames == 13  # 0.5 s at 25 fps
+    assert sorted(collect(renderer, 2, 13)) == list(range(13))
+
+
+def test_reload_of_a_missing_file_fails_right_away(renderer):
+    renderer.spec.unlink()
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        assert not renderer.reload()
+    assert "Error opening file" in output.getvalue()
@@ -0,0 +1,85 @@
+import json
+import os
+import pytest
+import profiling
+from profiling import Profiler, profile_table
+
+
+def test_drain_and_merge_move_timings_between_processes():
+    worker = Profiler(collect=True)
+    worker.add("rasterize", 10.0, 0.5, frame=3)
+    worker.add("render svg", 10.5, 0.25, frame=3, pid=1234)
+    timings = worker.drain()
+    assert timings == [("rasterize", 10.0, 0.5, 3, os.getpid()), ("render svg", 10.5, 0.25, 3, 1234)]
+    assert worker.drain() == []  # every timing is only sent once
+    assert Profiler().drain() == []  # only collected if asked for
+
+    main = Profiler()
+    main.add("rasterize", 11.0, 1.0, frame=4)
+    main.merge(timings)
+    assert main.timings == {"rasterize": [1.0, 0.5], "render svg": [0.25]}
+    assert main.frame_timings == {4: {"rasterize": 1.0}, 3: {"rasterize": 0.5, "render svg": 0.25}}
+
+
+def test_report_statistics():
+    profiler = Profiler()
+    for index, ms in enumerate(range(100, 0, -1)):
+        profiler.add("rasterize", 0.0, ms / 1000, frame=index)
+    profiler.add("build palette", 0.0, 0.25)
+    profiler.stop()
+    report = profiler.report()
+    rasterize = report['stages']['rasterize']
+    assert rasterize['count'] == 100
+    assert rasterize['total'] == pytest.approx(5.05)
+    assert rasterize['mean'] == pytest.approx(0.0505)
+    assert rasterize['max'] == pytest.approx(0.1)
+    assert rasterize['p95'] == pytest.approx(0.095)
+    assert report['stages']['build palette'] == {'count': 1, 'total': 0.25, 'mean': 0.25, 'max': 0.25, 'p95': 0.25}
+    assert [frame['frame'] for frame in report['slowest_frames']] == list(range(10))
+    assert len(report['frames']) == 100  # stages that don't belong to a frame aren't in the frame list
+    assert report['wall_time'] >= 0
+    table = profile_table(report)
+    assert table.splitlines()[1].startswith("rasterize") and "slowest frame: 0 (100.0 ms)" in table
+
+
+def test_trace_file_is_a_chrome_trace(tmp_path):
+    trace_file = tmp_path / "out.trace.json"
+    profiler = Profiler()
+    with profiler.start(trace_file=str(trace_file)):
+        with profiler.stage("initialize"):
+            pass
+        profiler.add("rasterize", profiler.origin + 0.5, 0.25, frame=7)
+        profiler.merge([("encode", profiler.origin + 1.0, 0.125, 7, 4321)])
+    events = json.loads(trace_file.read_text())
+    assert events[0] == {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': 'camala'}}
+    assert [event['name'] for event in events[1:]] == ["initialize", "rasterize", "encode"]
+    assert events[1]['cat'] == 'setup' and 'args' not in events[1]
+    assert events[2] == {'name': 'rasterize', 'cat': 'frame', 'ph': 'X', 'ts': pytest.approx(500000),
+                         'dur': pytest.approx(250000), 'pid': os.getpid(), 'tid': 0, 'args': {'frame': 7}}
+    assert events[3]['pid'] == 4321
+
+
+def test_trace_file_is_closed_when_rendering_fails(tmp_path):
+    trace_file = tmp_path / "out.trace.json"
+    profiler = Profiler()
+    with pytest.raises(RuntimeError):
+        with profiler.start(trace_file=str(trace_file)):
+            profiler.add("rasterize", profiler.origin, 0.1, frame=0)
+            raise RuntimeError("rasterizer failed")
+    assert profiler.trace is None
+    assert [event['name'] for event in json.loads(trace_file.read_text())] == ["process_name", "rasterize"]
+    profiler.stop()  # stopping again does nothing
+
+
+def test_trace_file_is_closed_when_starting_fails(tmp_path, monkeypatch):
+    class FailingProfile(object):
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(profiling.cProfile, "Profile", FailingProfile)
+    trace_file = tmp_path / "out.trace.json"
+    profiler = Profiler()
+    with pytest.raises(ValueError):
+        profiler.start(trace_file=str(trace_file), use_cprofile=True)
+    assert profiler.trace is None
+    assert json.loads(trace_file.read_text())[0]['name'] == "process_name"
@@ -0,0 +1,45 @@
+import io
+import numpy as np
+import PIL.Image
+import pytest
+from rasterizer import PngDecoder
+
+
+def png(mode, width=7, height=5, seed=0):
+    """
+    :return: bytes of a png image with random pixels in the given PIL mode
+    """
+    pixels = np.random.default_rng(seed).integers(0, 256, (height, width, 4), dtype=np.uint8)
+    data = io.BytesIO()
+    PIL.Image.fromarray(pixels, "RGBA").convert(mode).save(data, format="PNG")
+    return data.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "RGB", "LA", "L", "P"])
+def test_decoded_pixels_match_pil(mode):
+    decoder = PngDecoder()
+    for seed in range(3):  # the buffer is reused
+        data = png(mode, seed=seed)
+        expected = np.array(PIL.Image.open(io.BytesIO(data)).convert("RGBA"))
+        assert np.array_equal(decoder.decode(data, 7, 5, alpha=True), expected)
+        assert np.array_equal(decoder.decode(data, 7, 5), expected[:, :, :3])
+
+
+def test_rgba_images_are_decoded_into_the_buffer():
+    # relies on how the Pillow version in requirements.txt loads images; PngDecoder falls back to copying otherwise
+    decoder = PngDecoder()
+    decoder._prepare(7, 5)
+    img = PIL.Image.open(io.BytesIO(png("RGBA")), formats=["PNG"])
+    decoder._decode_into_buffer(img)
+    assert img.im.id == decoder.image.im.id
+    assert np.array_equal(decoder.buffer, np.array(PIL.Image.open(io.BytesIO(png("RGBA")))))
+
+
+def test_decoded_frames_are_read_only_views_on_the_buffer():
+    decoder = PngDecoder()
+    frame = decoder.decode(png("RGBA"), 7, 5)
+    assert not frame.flags.writeable
+    assert np.shares_memory(frame, decoder.buffer)
+    kept = frame.copy()
+    decoder.decode(png("RGBA", seed=1), 7, 5)
+    assert not np.array_equal(frame, kept)  # overwritten by the next frame
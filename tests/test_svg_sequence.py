@@ -0,0 +1,47 @@
+import contextlib
+import gzip
+import io
+import json
+from pathlib import Path
+import pytest
+from benchmark import BoxRasterizer
+from captiongenerator import CaptionGenerator
+from renderoptions import RenderOptions
+
+SPEC = Path(__file__).absolute().parent.parent / "examples" / "gettingstarted" / "position-animation.toml"
+
+
+def write_sequence(tmp_path, contents=None, **options):
+    """
+    writes position-animation.toml in the svg format at 10 fps
+    :return: the index of the sequence
+    """
+    spec = tmp_path / "spec.toml"
+    spec.write_text((contents or SPEC.read_text("utf-8")).replace('format = "gif"', 'format = "svg"'), "utf-8")
+    c = CaptionGenerator(str(tmp_path / "out"), RenderOptions(render_fps=10, **options), rasterizer=BoxRasterizer())
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert c.write_videofile(str(spec))
+    return json.loads((tmp_path / "out.index.json").read_text())
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_frames_are_named_after_the_output(tmp_path, jobs):
+    index = write_sequence(tmp_path, jobs=jobs)
+    names = [f"out_{i:08}.svg" for i in range(10)]
+    assert sorted(path.name for path in tmp_path.glob("*.svg")) == names
+    assert [frame['file'] for frame in index['frames']] == names
+    assert [frame['time'] for frame in index['frames']] == pytest.approx([i / 10 for i in range(10)])
+    assert index['background'] == "black"
+    assert (tmp_path / "out_00000000.svg").read_text("utf-8").startswith("<")
+
+
+def test_frame_stride_writes_every_nth_frame(tmp_path):
+    index = write_sequence(tmp_path, frame_stride=3, svgz=True)
+    assert sorted(path.name for path in tmp_path.glob("out_*")) == [f"out_{i:08}.svgz" for i in (0, 3, 6, 9)]
+    assert [frame['file'] for frame in index['frames']] == [f"out_{i // 3 * 3:08}.svgz" for i in range(10)]
+    assert gzip.decompress((tmp_path / "out_00000003.svgz").read_bytes()).decode("utf-8").startswith("<")
+
+
+def test_index_without_a_background(tmp_path):
+    contents = SPEC.read_text("utf-8").replace('background = "black"\n', '')
+    assert write_sequence(tmp_path, contents)['background'] is None
@@ -0,0 +1,166 @@
+import contextlib
+import io
+import math
+import numpy as np
+import pytest
+from pathlib import Path
+from vectortween.NumberAnimation import NumberAnimation
+from vectortween.PointAnimation import PointAnimation
+from vectortween.SequentialAnimation import SequentialAnimation
+from vectortween.SumAnimation import SumAnimation
+from captiongenerator import AnimationBinding, CaptionGenerator
+from timeline import Timeline, sample, sample_frame
+
+TWEEN_METHODS = CaptionGenerator._supported_tween_methods(None)
+FRAMES = np.arange(0, 61)
+BIRTH, START, STOP, DEATH = 5, 10.5, 47, 55
+
+
+def scalar(animation, frames, birth_frame, start_frame, stop_frame, death_frame):
+    """
+    evaluates the animation frame by frame with vectortween, with NaN (or (NaN, NaN)) instead of None
+    """
+    values = []
+    for frame in frames:
+        value = animation.make_frame(frame, birth_frame, start_frame, stop_frame, death_frame)
+        if isinstance(value, tuple):
+            value = tuple(math.nan if v is None else v for v in value)
+        values.append(math.nan if value is None else value)
+    if any(isinstance(value, tuple) for value in values):  # animation of points
+        values = [(value, value) if not isinstance(value, tuple) else value for value in values]
+    return np.array(values, dtype=float)
+
+
+def assert_same(animation, frames=FRAMES, birth_frame=BIRTH, start_frame=START, stop_frame=STOP, death_frame=DEATH):
+    expected = scalar(animation, frames, birth_frame, start_frame, stop_frame, death_frame)
+    actual = sample(animation, frames, birth_frame, start_frame, stop_frame, death_frame)
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("method", TWEEN_METHODS)
+def test_number_animation_matches_vectortween(method):
+    assert_same(NumberAnimation(-20, 80, [method]))
+    assert_same(NumberAnimation(3, -7, [method]))
+
+
+def test_ease_in_out_circ_behaves_like_ease_out_circ():
+    # vectortween maps easeInOutCirc to pytweening's easeOutCirc; the timeline must do the same
+    in_out = sample(NumberAnimation(0, 1, ['easeInOutCirc']), FRAMES, BIRTH, START, STOP, DEATH)
+    out = sample(NumberAnimation(0, 1, ['easeOutCirc']), FRAMES, BIRTH, START, STOP, DEATH)
+    np.testing.assert_array_equal(in_out, out)
+    assert_same(NumberAnimation(0, 1, ['easeInOutCirc']))
+
+
+@pytest.mark.parametrize("method", ['linear', 'easeInOutQuad', 'easeOutBounce'])
+def test_point_animation_matches_vectortween(method):
+    animation = PointAnimation((0, 100), (-50, 20), [method], ['easeInCubic'])
+    assert sample(animation, FRAMES, BIRTH, START, STOP, DEATH).shape == (len(FRAMES), 2)
+    assert_same(animation)
+
+
+def test_nested_sum_animation_matches_vectortween():
+    inner = SumAnimation([NumberAnimation(0, 10, ['easeInQuad']), NumberAnimation(5, -5, ['easeOutSine'])])
+    assert_same(SumAnimation([inner, NumberAnimation(1, 2, ['easeInOutExpo'])]))
+    assert_same(SumAnimation([PointAnimation((0, 0), (10, 20), ['linear']),
+                              PointAnimation((5, 5), (0, 0), ['easeOutQuad'])]))
+
+
+def test_sequential_animation_matches_vectortween():
+    assert_same(SequentialAnimation([NumberAnimation(0, 10, ['easeInQuad']),
+                                     NumberAnimation(10, 4, ['easeOutBounce']),
+                                     NumberAnimation(4, 8, ['linear'])], timeweight=[1, 3, 2],
+                                    tween=['easeInOutSine']))
+    assert_same(SequentialAnimation([PointAnimation((0, 0), (10, 20), ['linear']),
+                                     PointAnimation((10, 20), (-5, 0), ['easeInCubic'])]))
+
+
+def test_nested_sequential_and_sum_animations_match_vectortween():
+    sequence = SequentialAnimation([NumberAnimation(0, 10, ['linear']),
+                                    SequentialAnimation([NumberAnimation(10, 0, ['easeInQuart']),
+                                                         NumberAnimation(0, 3, ['easeOutQuint'])])],
+                                   timeweight=[2, 1])
+    assert_same(sequence)
+    assert_same(SumAnimation([sequence, NumberAnimation(100, 0, ['easeInCirc'])]))
+
+
+def test_fractional_frames_match_vectortween():
+    assert_same(NumberAnimation(0, 10, ['easeInOutCubic']), frames=np.arange(0, 60, 0.37))
+
+
+def test_animation_that_starts_and_ends_on_the_same_frame():
+    # vectortween divides by zero in the frame in which such an animation starts; the timeline completes the
+    # animation at once instead
+    number = NumberAnimation(0, 10, ['easeInQuad'])
+    with pytest.raises(TypeError):
+        number.make_frame(20, 0, 20, 20, 40)
+    values = sample(number, FRAMES, 0, 20, 20, 40)
+    np.testing.assert_array_equal(values[:20], 0)
+    np.testing.assert_array_equal(values[20:41], 10)
+    assert np.isnan(values[41:]).all()
+    sequence = SequentialAnimation([NumberAnimation(0, 10, ['linear']), NumberAnimation(10, 3, ['linear'])])
+    values = sample(sequence, FRAMES, 0, 20, 20, 40)
+    np.testing.assert_array_equal(values[:20], 0)
+    np.testing.assert_array_equal(values[20:41], 3)
+    assert np.isnan(values[41:]).all()
+
+
+def test_sample_frame_matches_sample():
+    animations = [NumberAnimation(0, 10, ['easeInQuad']),
+                  PointAnimation((0, 100), (-50, 20), ['linear']),
+                  SequentialAnimation([NumberAnimation(0, 10, ['linear']), NumberAnimation(10, 3, ['linear'])])]
+    for animation in animations:
+        for start_frame, stop_frame in [(START, STOP), (20, 20), (20.5, 20.5)]:
+            frames = np.arange(0, 60, 0.25)
+            expected = sample(animation, frames, BIRTH, start_frame, stop_frame, DEATH)
+            actual = [sample_frame(animation, frame, BIRTH, start_frame, stop_frame, DEATH) for frame in frames]
+            actual = np.array([[math.nan if v is None else v for v in value] if isinstance(value, tuple)
+                               else (math.nan if value is None else value) for value in actual], dtype=float)
+            np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_sample_frame_completes_noisy_animations_that_start_and_end_on_the_same_frame():
+    noisy = NumberAnimation(0, 10, ['linear'], noise_fn=lambda value, t: 1)
+    with pytest.raises(TypeError):
+        noisy.make_frame(20, 0, 20, 20, 40)
+    assert sample_frame(noisy, 19.5, 0, 20, 20, 40) == 0
+    assert sample_frame(noisy, 20, 0, 20, 20, 40) == 10
+    assert sample_frame(noisy, 20.5, 0, 20, 20, 40) == 10
+    assert sample_frame(noisy, 41, 0, 20, 20, 40) is None
+    assert sample_frame(noisy, 15, 0, 10, 20, 40) == 6  # evolving: linear value plus noise
+
+
+def test_zero_length_animation_renders_at_fractional_frames():
+    # frames between whole frame numbers (e.g. with a render fps or frame stride) are not precomputed, and must
+    # give the same result as the precomputed ones
+    spec = Path(__file__).absolute().parent.joinpath("specs", "layers.toml").read_text("utf-8")
+    spec = spec.replace('begin_time = "${Global.duration}/4"', 'begin_time = "0.5"')
+    spec = spec.replace('end_time = "${Global.duration}*2/3"', 'end_time = "0.5"')
+    c = CaptionGenerator("")
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert c.initialize_from_string(spec)
+    assert c.fps() == 25  # the animation starts and stops in frame 12.5
+    assert c._resolve_placeholder_values(12)['Line1_y'] == pytest.approx(-500 / 3)
+    assert c._resolve_placeholder_values(12.5)['Line1_y'] == pytest.approx(500 / 3)
+    assert c._resolve_placeholder_values(13)['Line1_y'] == pytest.approx(500 / 3)
+
+
+def test_timeline_lookup():
+    bindings = [AnimationBinding(NumberAnimation(0, 10, ['linear']), 0, 0, 10, 20, 'a'),
+                AnimationBinding(PointAnimation((0, 0), (10, 20), ['linear']), 2, 2, 12, 15, 'Line1', 'position')]
+    timeline = Timeline(bindings, 20)
+    assert timeline.lookup(0, 5) == (True, 5.0)
+    assert timeline.lookup(0, 5.0000000001) == (True, 5.0)
+    assert timeline.lookup(1, 1) == (True, (None, None))  # before the birth of the animation
+    assert timeline.lookup(1, 7) == (True, (5.0, 10.0))
+    assert timeline.lookup(1, 16) == (True, (None, None))  # after its death
+
+
+def test_timeline_falls_back_for_fractional_and_unknown_frames():
+    noisy = NumberAnimation(0, 10, ['linear'], noise_fn=lambda value, t: value)
+    bindings = [AnimationBinding(NumberAnimation(0, 10, ['linear']), 0, 0, 10, 20, 'a'),
+                AnimationBinding(noisy, 0, 0, 10, 20, 'b')]
+    timeline = Timeline(bindings, 20)
+    assert timeline.lookup(0, 2.5) == (False, None)  # between frames: evaluated by vectortween
+    assert timeline.lookup(0, 21) == (False, None)  # beyond the precomputed frames
+    assert timeline.lookup(0, -1) == (False, None)
+    assert timeline.lookup(1, 5) == (False, None)  # noise functions can't be sampled
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from typewriter import TypewriterIndex, grapheme_boundaries
+
+E_ACUTE = "e\u0301"  # e followed by a combining acute accent
+FAMILY = "\U0001F468\u200d\U0001F469\u200d\U0001F467"  # man, woman and girl joined by zero width joiners
+WAVING = "\U0001F44B\U0001F3FD"  # waving hand with a skin tone modifier
+FLAG_BE = "\U0001F1E7\U0001F1EA"  # a flag is a pair of regional indicators
+FLAG_NL = "\U0001F1F3\U0001F1F1"
+HANGUL = "\u1100\u1161\u11a8"  # a syllable written with conjoining jamo (L V T)
+
+
+def clusters(text):
+    boundaries = grapheme_boundaries(text)
+    return [text[begin:end] for begin, end in zip(boundaries, boundaries[1:])]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", []),
+    ("abc", ["a", "b", "c"]),
+    (f"caf{E_ACUTE}!", ["c", "a", "f", E_ACUTE, "!"]),
+    (f"a{E_ACUTE}\u0323b", ["a", f"{E_ACUTE}\u0323", "b"]),  # several combining marks
+    (f"hi {FAMILY}!", ["h", "i", " ", FAMILY, "!"]),
+    (f"{WAVING}{WAVING}", [WAVING, WAVING]),
+    ("\u2764\ufe0f", ["\u2764\ufe0f"]),  # variation selector
+    (f"{FLAG_BE}{FLAG_NL}", [FLAG_BE, FLAG_NL]),
+    (f"{FLAG_BE}{FLAG_NL}\U0001F1E7", [FLAG_BE, FLAG_NL, "\U0001F1E7"]),  # an odd regional indicator stays alone
+    (f"{FLAG_BE}x{FLAG_NL}", [FLAG_BE, "x", FLAG_NL]),
+    ("a\r\nb\n\u0301", ["a", "\r\n", "b", "\n", "\u0301"]),  # nothing joins a line break
+    (f"{HANGUL}\uac00\u11a8\uac01", [HANGUL, "\uac00\u11a8", "\uac01"]),
+])
+def test_grapheme_boundaries(text, expected):
+    assert clusters(text) == expected
+    assert "".join(clusters(text)) == text
+
+
+def test_reveal_shows_whole_clusters_from_front_to_back():
+    index = TypewriterIndex("line1", {'a': f"{E_ACUTE}{FAMILY}", 'b': f" {FLAG_BE}{FLAG_NL}"})
+    assert index.length == 5
+    assert index.reveal(0) == {'text_line1_a': E_ACUTE, 'text_line1_b': ""}
+    assert index.reveal(25) == {'text_line1_a': f"{E_ACUTE}{FAMILY}", 'text_line1_b': ""}
+    assert index.reveal(50) == {'text_line1_a': f"{E_ACUTE}{FAMILY}", 'text_line1_b': " "}
+    assert index.reveal(75) == {'text_line1_a': f"{E_ACUTE}{FAMILY}", 'text_line1_b': f" {FLAG_BE}"}
+    assert index.reveal(100) == {'text_line1_a': f"{E_ACUTE}{FAMILY}", 'text_line1_b': f" {FLAG_BE}{FLAG_NL}"}
+    assert index.reveal(None) == {'text_line1_a': "", 'text_line1_b': ""}
+
+
+def test_reverse_reveal_shows_whole_clusters_from_back_to_front():
+    index = TypewriterIndex("line1", {'a': f"{E_ACUTE}{FAMILY}", 'b': f" {FLAG_BE}{FLAG_NL}"})
+    assert index.reveal(-1) == {'text_line1_a': "", 'text_line1_b': FLAG_NL}
+    assert index.reveal(-25) == {'text_line1_a': "", 'text_line1_b': f"{FLAG_BE}{FLAG_NL}"}
+    assert index.reveal(-50) == {'text_line1_a': "", 'text_line1_b': f" {FLAG_BE}{FLAG_NL}"}
+    assert index.reveal(-75) == {'text_line1_a': FAMILY, 'text_line1_b': f" {FLAG_BE}{FLAG_NL}"}
+    assert index.reveal(-100) == {'text_line1_a': f"{E_ACUTE}{FAMILY}", 'text_line1_b': f" {FLAG_BE}{FLAG_NL}"}
+
+
+def test_reveal_never_splits_a_cluster():
+    segments = {'a': f"caf{E_ACUTE} ", 'b': f"{FAMILY}{WAVING}", 'c': "", 'd': f"{FLAG_BE}{FLAG_NL}{HANGUL}!"}
+    index = TypewriterIndex("l", segments)
+    assert index.length == 11
+    counts = []
+    for value in np.linspace(-100, 100, 801):
+        values = index.reveal(value)
+        visible = [values[f"text_l_{segment}"] for segment in segments]
+        for text, part in zip(segments.values(), visible):
+            ends = [text[:boundary] for boundary in grapheme_boundaries(text)]
+            starts = [text[boundary:] for boundary in grapheme_boundaries(text)]
+            assert part in (ends if value >= 0 else starts)
+        counts.append(sum(len(clusters(part)) for part in visible))
+        assert counts[-1] == index.visible_count(value)
+    # every number of clusters between 1 and all of them is shown on the way, in both directions
+    assert set(counts) == set(range(1, index.length + 1))